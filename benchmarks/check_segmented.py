@@ -0,0 +1,146 @@
+# benchmarks/check_segmented.py
+#
+# Checks that the segmented MP3 encoder (helpers/segmented_encoder.py) puts
+# every segment on the timeline of a single pass encode. A pink noise input is
+# encoded both ways with the same encoder settings and both MP3s are decoded
+# back to PCM:
+#   samples    both decode to the same number of samples
+#   alignment  around every join and in the middle of every segment the
+#              samples match the single pass; a misplaced segment shows up as
+#              a large difference and the offset that would fit instead
+# Needs ffmpeg with libmp3lame (and libopus for the webm input).
+#
+#   python -m benchmarks.check_segmented
+#   python -m benchmarks.check_segmented --format m4a --duration 900 --segments 6
+
+import argparse
+import array
+import math
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.run_benchmarks import DEFAULT_CACHE_DIR
+from helpers.utils import get_ffmpeg_path
+from helpers.ffmpeg_helper import probe_codecs
+from helpers.segmented_encoder import SAMPLE_RATE, FRAME_SAMPLES, _segment_frames, encode_mp3_segmented
+
+# WebM/Opus has millisecond timestamps, a negative start time and a codec
+# pre-skip; M4A/AAC has sample accurate timestamps
+INPUT_FORMATS = {
+    "webm": {"rate": 48000, "encode": ['-c:a', 'libopus', '-b:a', '128k']},
+    "m4a": {"rate": 44100, "encode": ['-c:a', 'aac', '-b:a', '128k']},
+}
+
+BITRATE = 192
+
+# Samples compared on each side of a join, and the relative difference
+# (RMS of the difference over RMS of the signal) still taken as a match.
+# Encoding the same samples differs only slightly; a shifted segment is
+# uncorrelated noise, around 1.4.
+WINDOW = 2 * FRAME_SAMPLES
+MAX_DIFFERENCE = 0.1
+
+# Offsets searched for a window that doesn't match
+SEARCH_SAMPLES = 2 * FRAME_SAMPLES
+
+def make_input(cache_dir, file_format, duration):
+    spec = INPUT_FORMATS[file_format]
+    os.makedirs(cache_dir, exist_ok=True)
+    file_path = os.path.join(cache_dir, f"pink_{duration}s.{file_format}")
+    if not os.path.isfile(file_path):
+        temp_file = file_path + f".tmp.{file_format}"
+        command = [
+            get_ffmpeg_path(), '-y', '-v', 'error',
+            '-f', 'lavfi', '-i', f"anoisesrc=color=pink:seed=7:sample_rate={spec['rate']}:duration={duration}",
+            '-ac', '2', *spec["encode"], temp_file,
+        ]
+        subprocess.run(command, check=True)
+        os.replace(temp_file, file_path)
+    return file_path
+
+# Single pass encode with the settings the segments use, so both carry the
+# same encoder delay and padding
+def encode_single(input_file, output_file):
+    command = [
+        get_ffmpeg_path(), '-y', '-v', 'error', '-i', input_file, '-vn',
+        '-af', f"aresample={SAMPLE_RATE}", '-ac', '2', '-c:a', 'libmp3lame', '-b:a', f"{BITRATE}k",
+        '-reservoir', '0', '-f', 'mp3', output_file,
+    ]
+    subprocess.run(command, check=True)
+
+# Function to decode an MP3 to mono 16 bit samples
+def decode(file_path):
+    command = [get_ffmpeg_path(), '-v', 'error', '-i', file_path, '-ac', '1', '-f', 's16le', '-']
+    samples = array.array('h')
+    samples.frombytes(subprocess.run(command, capture_output=True, check=True).stdout)
+    return samples
+
+def _rms(values):
+    return math.sqrt(sum(value * value for value in values) / len(values)) if values else 0.0
+
+# Relative difference of the window at position in actual against expected
+# shifted by offset
+def difference(expected, actual, position, offset=0):
+    window = actual[position:position + WINDOW]
+    reference = expected[position + offset:position + offset + len(window)]
+    if len(reference) != len(window) or not window:
+        return float("inf")
+    return _rms([a - b for a, b in zip(window, reference)]) / max(_rms(reference), 1.0)
+
+def best_offset(expected, actual, position):
+    return min(range(-SEARCH_SAMPLES, SEARCH_SAMPLES + 1), key=lambda offset: difference(expected, actual, position, offset))
+
+# Positions to compare: both sides of every join, and the middle of every segment
+def check_positions(bounds, total):
+    positions = []
+    for first, end in bounds:
+        start = first * FRAME_SAMPLES
+        stop = end * FRAME_SAMPLES if end is not None else total
+        if first:
+            positions.append((f"join at {start / SAMPLE_RATE:.2f}s, before", start - WINDOW))
+            positions.append((f"join at {start / SAMPLE_RATE:.2f}s, after", start))
+        positions.append((f"segment at {start / SAMPLE_RATE:.2f}s, middle", (start + stop) // 2))
+    return positions
+
+def run_check(file_format, args):
+    input_file = make_input(args.cache_dir, file_format, args.duration)
+    duration = probe_codecs(input_file)["duration"]
+    bounds = _segment_frames(duration, args.segments)
+    print(f"== {file_format}: {duration:.1f}s in {len(bounds)} segments")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        segmented_file = os.path.join(temp_dir, "segmented.mp3")
+        single_file = os.path.join(temp_dir, "single.mp3")
+        encode_mp3_segmented(input_file, segmented_file, duration, BITRATE, workers=args.segments)
+        encode_single(input_file, single_file)
+        expected, actual = decode(single_file), decode(segmented_file)
+
+    ok = len(actual) == len(expected)
+    print(f"   samples      single pass {len(expected)}, segmented {len(actual)}{'' if ok else '  MISMATCH'}")
+    for label, position in check_positions(bounds, len(expected)):
+        value = difference(expected, actual, position)
+        if value <= MAX_DIFFERENCE:
+            print(f"   {label:<32} difference {value:.3f}")
+        else:
+            ok = False
+            print(f"   {label:<32} difference {value:.3f}  MISALIGNED, fits at offset {best_offset(expected, actual, position)}")
+    return ok
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check the segmented MP3 encoder against a single pass encode.")
+    parser.add_argument("--format", choices=tuple(INPUT_FORMATS) + ("all",), default="all", help="input container to check (default: all)")
+    parser.add_argument("--duration", type=int, default=600, help="length of the input in seconds (default: 600)")
+    parser.add_argument("--segments", type=int, default=4, help="segments to encode in (default: 4)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="where the inputs are generated and kept")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    formats = INPUT_FORMATS if args.format == "all" else (args.format,)
+    results = [run_check(file_format, args) for file_format in formats]
+    return 0 if all(results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
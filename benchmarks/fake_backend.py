@@ -0,0 +1,149 @@
+# benchmarks/fake_backend.py
+
+import json
+import os
+from urllib.request import Request, urlopen
+import helpers.resolver as resolver
+
+# Stand-ins for pytubefix's YouTube, Playlist, Stream and StreamQuery that
+# serve the synthetic streams of a StreamServer. They carry exactly what the
+# helpers read from the real objects, and install_fake_backend() plugs them
+# into the shared resolver, so the real download, convert and playlist code
+# runs unchanged without contacting YouTube.
+
+CHUNK_SIZE = 9 * 1024 * 1024  # pytubefix's default chunk size
+
+class _Monostate:
+    def __init__(self, duration):
+        self.duration = duration
+
+class FakeStream:
+    def __init__(self, itag, url, file_path, duration, mime_type, resolution=None, abr=None, video_codec=None, audio_codec=None):
+        self.itag = itag
+        self.url = url
+        self.filesize = os.path.getsize(file_path)
+        self._filesize = self.filesize
+        self.mime_type = mime_type
+        self.subtype = mime_type.split('/')[1]
+        self.resolution = resolution
+        self.height = int(resolution.rstrip('p')) if resolution else None
+        self.abr = abr
+        self.video_codec = video_codec
+        self.audio_codec = audio_codec
+        self.includes_video_track = video_codec is not None
+        self.includes_audio_track = audio_codec is not None
+        self.is_progressive = self.includes_video_track and self.includes_audio_track
+        self.bitrate = int(self.filesize * 8 / duration) if duration else None
+        self._monostate = _Monostate(duration)
+
+    # Range requests of CHUNK_SIZE, like pytubefix's Stream.iter_chunks
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        for start in range(0, self.filesize, chunk_size):
+            end = min(start + chunk_size, self.filesize) - 1
+            request = Request(self.url, headers={"User-Agent": "Mozilla/5.0", "Range": f"bytes={start}-{end}"})
+            with urlopen(request) as response:  # nosec
+                while True:
+                    block = response.read(64 * 1024)
+                    if not block:
+                        break
+                    yield block
+
+    def download(self, output_path=None, filename=None, skip_existing=True):
+        file_path = os.path.join(output_path or os.getcwd(), filename or f"{self.itag}.{self.subtype}")
+        if skip_existing and os.path.isfile(file_path) and os.path.getsize(file_path) == self.filesize:
+            return file_path
+        with open(file_path, 'wb') as file:
+            for chunk in self.iter_chunks():
+                file.write(chunk)
+        return file_path
+
+def _resolution_key(stream):
+    return stream.height or 0
+
+class FakeStreamQuery(list):
+    def filter(self, file_extension=None, progressive=None, only_audio=False, only_video=False, adaptive=None):
+        streams = list(self)
+        if file_extension is not None:
+            streams = [s for s in streams if s.subtype == file_extension]
+        if progressive is not None:
+            streams = [s for s in streams if s.is_progressive == progressive]
+        if adaptive is not None:
+            streams = [s for s in streams if s.is_progressive != adaptive]
+        if only_audio:
+            streams = [s for s in streams if s.includes_audio_track and not s.includes_video_track]
+        if only_video:
+            streams = [s for s in streams if s.includes_video_track and not s.includes_audio_track]
+        return FakeStreamQuery(streams)
+
+    def order_by(self, attribute):
+        key = _resolution_key if attribute == "resolution" else (lambda s: getattr(s, attribute) or 0)
+        return FakeStreamQuery(sorted(self, key=key))
+
+    def desc(self):
+        return FakeStreamQuery(reversed(self))
+
+    def asc(self):
+        return self
+
+    def first(self):
+        return self[0] if self else None
+
+    def get_by_itag(self, itag):
+        return next((s for s in self if s.itag == itag), None)
+
+class FakeYouTube:
+    def __init__(self, video_id, title, length, streams):
+        self.video_id = video_id
+        self.title = title
+        self.length = length
+        self.watch_url = f"https://www.youtube.com/watch?v={video_id}"
+        self.streams = FakeStreamQuery(streams)
+        self.fmt_streams = list(streams)
+
+class FakePlaylist:
+    def __init__(self, playlist_id, title, videos):
+        self.playlist_id = playlist_id
+        self.title = title
+        self.videos = videos
+        self.video_urls = [f"https://www.youtube.com/watch?v={video_id}" for video_id, _ in videos]
+        self.length = len(videos)
+        # A one page listing in the shape helpers.playlist_enum reads
+        renderers = [{"playlistVideoRenderer": {"videoId": video_id, "title": {"simpleText": video_title}}} for video_id, video_title in videos]
+        self.html = f"<script>var ytInitialData = {json.dumps({'contents': renderers})};</script>"
+
+    def _extract_videos(self, page, context=None):
+        return [f"/watch?v={video_id}" for video_id, _ in self.videos], None
+
+# Function to build the catalog of fake videos and playlists served by server.
+# media is {itag: file} from benchmarks.media.prepare_media; every video shares
+# the same streams. Returns (video ids, playlist id, catalog dict).
+def build_catalog(server, media, duration, playlist_items):
+    urls = {itag: server.add_file(os.path.basename(path), path) for itag, path in media.items()}
+
+    def streams():
+        return [
+            FakeStream(140, urls[140], media[140], duration, "audio/mp4", abr="128kbps", audio_codec="mp4a.40.2"),
+            FakeStream(136, urls[136], media[136], duration, "video/mp4", resolution="720p", video_codec="avc1.64001f"),
+            FakeStream(134, urls[134], media[134], duration, "video/mp4", resolution="360p", video_codec="avc1.4d401e"),
+        ]
+
+    # 11 characters ending in "A", so helpers.url_parser accepts them
+    video_ids = [f"bench{index:05d}A" for index in range(max(1, playlist_items))]
+    videos = {video_id: FakeYouTube(video_id, f"Benchmark video {index}", duration, streams()) for index, video_id in enumerate(video_ids)}
+    playlist_id = "PLbenchmark"
+    playlist = FakePlaylist(playlist_id, "Benchmark playlist", [(video_id, videos[video_id].title) for video_id in video_ids])
+    return video_ids, playlist_id, {"videos": videos, "playlists": {playlist_id: playlist}}
+
+# Function to route the shared resolver to the catalog instead of pytubefix
+def install_fake_backend(catalog):
+    from helpers.url_parser import video_id_from_url, playlist_id_from_url
+
+    def build_video(url):
+        return catalog["videos"][video_id_from_url(url)]
+
+    def build_playlist(url):
+        return catalog["playlists"][playlist_id_from_url(url)]
+
+    resolver._build_video = build_video
+    resolver._build_playlist = build_playlist
+    resolver.clear_resolver_cache()
@@ -0,0 +1,51 @@
+# benchmarks/media.py
+
+import os
+import subprocess
+from helpers.utils import get_ffmpeg_path
+
+# Synthetic streams shaped like YouTube's adaptive formats, generated once with
+# ffmpeg's lavfi sources and kept in cache_dir:
+#   itag 140  AAC 128kbps in mp4 (audio only)
+#   itag 136  H.264 720p in fragmented mp4 (video only)
+#   itag 134  H.264 360p in fragmented mp4 (video only)
+# Fragmented like the DASH files YouTube serves, so they can be piped into ffmpeg.
+MEDIA_FORMATS = {
+    140: {
+        "file": "audio_140_{duration}s.m4a",
+        "source": ['-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100:duration={duration}'],
+        "encode": ['-c:a', 'aac', '-b:a', '128k', '-ac', '2'],
+    },
+    136: {
+        "file": "video_136_{duration}s.mp4",
+        "source": ['-f', 'lavfi', '-i', 'testsrc2=size=1280x720:rate=30:duration={duration}'],
+        "encode": ['-c:v', 'libx264', '-preset', 'ultrafast', '-g', '60', '-pix_fmt', 'yuv420p', '-an'],
+    },
+    134: {
+        "file": "video_134_{duration}s.mp4",
+        "source": ['-f', 'lavfi', '-i', 'testsrc2=size=640x360:rate=30:duration={duration}'],
+        "encode": ['-c:v', 'libx264', '-preset', 'ultrafast', '-g', '60', '-pix_fmt', 'yuv420p', '-an'],
+    },
+}
+
+_FRAGMENTED = ['-movflags', 'frag_keyframe+empty_moov+default_base_moof']
+
+# Function to get the path of the synthetic stream for an itag, generating it
+# first if the cache doesn't have it yet
+def media_file(cache_dir, itag, duration):
+    spec = MEDIA_FORMATS[itag]
+    os.makedirs(cache_dir, exist_ok=True)
+    file_path = os.path.join(cache_dir, spec["file"].format(duration=duration))
+    if os.path.isfile(file_path):
+        return file_path
+
+    temp_file = file_path + ".tmp.mp4"
+    source = [arg.format(duration=duration) for arg in spec["source"]]
+    command = [get_ffmpeg_path(), '-y', '-v', 'error', *source, *spec["encode"], *_FRAGMENTED, '-f', 'mp4', temp_file]
+    subprocess.run(command, check=True)
+    os.replace(temp_file, file_path)
+    return file_path
+
+# Function to make sure every synthetic stream exists; returns {itag: path}
+def prepare_media(cache_dir, duration):
+    return {itag: media_file(cache_dir, itag, duration) for itag in MEDIA_FORMATS}
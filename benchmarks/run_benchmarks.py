@@ -0,0 +1,255 @@
+# benchmarks/run_benchmarks.py
+#
+# Offline benchmarks of the download and convert paths. Synthetic streams are
+# served from a local HTTP server and resolved by a fake pytubefix backend, so
+# the real helpers (ranged downloads, ffmpeg transcodes and merges, playlist
+# pipeline) run end to end without contacting YouTube. Needs ffmpeg.
+#
+#   python -m benchmarks.run_benchmarks
+#   python -m benchmarks.run_benchmarks playlist-audio --items 20 --bandwidth 2000000 --latency 0.05
+#   python -m benchmarks.run_benchmarks --save before.json
+#   python -m benchmarks.run_benchmarks --baseline before.json
+#
+# Every run happens in its own process, so peak RSS and disk writes are per
+# scenario. Reported per scenario (median of --repeat runs):
+#   wall_seconds      time from start to the finished output
+#   bytes_served      bytes the stream server sent
+#   bytes_per_sec     bytes_served / wall_seconds
+#   peak_rss_mb       peak RSS of the Python process
+#   ffmpeg_rss_mb     peak RSS of the largest ffmpeg child
+#   disk_write_bytes  bytes written to storage by the process and ffmpeg
+#                     (block device writes, so 0 on tmpfs)
+#   output_bytes      size of what ended up in the output folder
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = ("audio", "video", "video-files", "playlist-audio", "playlist-video")
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "youtube-converter-bench")
+
+_MEASURES = ("wall_seconds", "bytes_served", "bytes_per_sec", "peak_rss_mb", "ffmpeg_rss_mb", "disk_write_bytes", "output_bytes")
+
+# Metrics where a larger value is an improvement
+_HIGHER_IS_BETTER = ("bytes_per_sec",)
+
+def _rss_mb(kilobytes_or_bytes):
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return kilobytes_or_bytes / 1048576
+    return kilobytes_or_bytes / 1024
+
+def _usage():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+
+def _folder_size(folder):
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+# Function to run one scenario in this process and return its measurements
+def run_scenario(name, args):
+    from helpers.progress import Progress
+    from helpers.metrics import enable_metrics, summarize
+    from helpers.audio_helper import start_download_audio
+    from helpers.video_helper import start_process_video
+    from helpers.playlist_helper import start_download_playlist
+    from benchmarks.media import prepare_media
+    from benchmarks.stream_server import StreamServer
+    from benchmarks.fake_backend import build_catalog, install_fake_backend
+    from helpers.url_parser import canonical_video_url, canonical_playlist_url
+
+    media = prepare_media(args.cache_dir, args.duration)
+    server = StreamServer(latency=args.latency, bandwidth=args.bandwidth).start()
+    items = args.items if name.startswith("playlist-") else 1
+    video_ids, playlist_id, catalog = build_catalog(server, media, args.duration, items)
+    install_fake_backend(catalog)
+    enable_metrics()
+
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+    output_dir = tempfile.mkdtemp(prefix=f"{name}_", dir=args.work_dir)
+    outcome = {"output": None, "error": None}
+    progress = Progress(
+        on_finished=lambda path: outcome.update(output=path),
+        on_error=lambda message: outcome.update(error=message),
+    )
+    video_url = canonical_video_url(video_ids[0])
+    playlist_url = canonical_playlist_url(playlist_id)
+
+    before = _usage()
+    started = time.perf_counter()
+    try:
+        if name == "audio":
+            start_download_audio(video_url, output_dir, progress)
+        elif name == "video":
+            start_process_video(video_url, 0, output_dir, progress)
+        elif name == "video-files":
+            start_process_video(video_url, 0, output_dir, progress, streaming=False)
+        elif name == "playlist-audio":
+            start_download_playlist(playlist_url, output_dir, progress, 1)
+        elif name == "playlist-video":
+            start_download_playlist(playlist_url, output_dir, progress, 2)
+        else:
+            raise ValueError(f"Unknown scenario: {name}")
+    except Exception as e:
+        outcome["error"] = str(e)
+    wall = time.perf_counter() - started
+    after = _usage()
+
+    counters = server.take_counters()
+    server.stop()
+    result = {
+        "scenario": name,
+        "status": "ok" if outcome["output"] and not outcome["error"] else "failed",
+        "error": outcome["error"],
+        "wall_seconds": round(wall, 3),
+        "bytes_served": counters["bytes_served"],
+        "requests": counters["requests"],
+        "bytes_per_sec": round(counters["bytes_served"] / wall) if wall else None,
+        "output_bytes": _folder_size(output_dir),
+        "peak_rss_mb": None,
+        "ffmpeg_rss_mb": None,
+        "disk_write_bytes": None,
+        "stages": summarize(),
+    }
+    if after is not None:
+        result["peak_rss_mb"] = round(_rss_mb(after[0].ru_maxrss), 1)
+        result["ffmpeg_rss_mb"] = round(_rss_mb(after[1].ru_maxrss), 1)
+        blocks = (after[0].ru_oublock - before[0].ru_oublock) + (after[1].ru_oublock - before[1].ru_oublock)
+        result["disk_write_bytes"] = blocks * 512
+    if not args.keep:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return result
+
+def _child_command(name, args):
+    command = [
+        sys.executable, "-m", "benchmarks.run_benchmarks", "--child", name,
+        "--items", str(args.items), "--duration", str(args.duration),
+        "--latency", str(args.latency), "--cache-dir", args.cache_dir,
+    ]
+    if args.bandwidth:
+        command += ["--bandwidth", str(args.bandwidth)]
+    if args.work_dir:
+        command += ["--work-dir", args.work_dir]
+    if args.keep:
+        command.append("--keep")
+    return command
+
+# Function to run a scenario in a fresh process and read its result line
+def run_isolated(name, args):
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run(_child_command(name, args), cwd=project_dir, capture_output=True, text=True)
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    error = (completed.stderr.strip().splitlines() or [f"exit code {completed.returncode}"])[-1]
+    return {"scenario": name, "status": "failed", "error": error}
+
+# Median of each measure over the runs of one scenario
+def combine_runs(runs):
+    combined = {"scenario": runs[0]["scenario"], "runs": len(runs)}
+    failed = [run for run in runs if run.get("status") != "ok"]
+    combined["status"] = "failed" if failed else "ok"
+    if failed:
+        combined["error"] = failed[0].get("error")
+    for measure in _MEASURES:
+        values = [run[measure] for run in runs if run.get(measure) is not None]
+        combined[measure] = statistics.median(values) if values else None
+    combined["stages"] = runs[-1].get("stages", {})
+    return combined
+
+def _format(measure, value):
+    if value is None:
+        return "-"
+    if measure in ("bytes_served", "disk_write_bytes", "output_bytes"):
+        return f"{value / 1048576:.1f} MB"
+    if measure == "bytes_per_sec":
+        return f"{value / 1048576:.2f} MB/s"
+    if measure.endswith("_mb"):
+        return f"{value:.1f} MB"
+    return f"{value:.2f} s"
+
+def _change(measure, value, baseline_value):
+    if value is None or not baseline_value:
+        return ""
+    change = (value - baseline_value) / baseline_value * 100
+    better = change > 0 if measure in _HIGHER_IS_BETTER else change < 0
+    mark = "better" if better else "worse"
+    return f" ({change:+.1f}% {mark})" if abs(change) >= 0.5 else " (same)"
+
+def print_report(results, baseline=None):
+    baseline = {result["scenario"]: result for result in (baseline or [])}
+    for result in results:
+        print(f"== {result['scenario']} ({result.get('runs', 1)} run(s), {result['status']})")
+        if result.get("error"):
+            print(f"   error: {result['error']}")
+        previous = baseline.get(result["scenario"], {})
+        for measure in _MEASURES:
+            value = result.get(measure)
+            print(f"   {measure:<17} {_format(measure, value):>12}{_change(measure, value, previous.get(measure))}")
+        for stage, totals in sorted(result.get("stages", {}).items(), key=lambda item: -item[1]["seconds"]):
+            print(f"   stage {stage:<20} {totals['count']:>4} x {totals['seconds']:.2f}s")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the download and convert paths.")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--items", type=int, default=10, help="items in the playlist scenarios (default: 10)")
+    parser.add_argument("--duration", type=int, default=120, help="length of the synthetic streams in seconds (default: 120)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the server waits before each response")
+    parser.add_argument("--bandwidth", type=int, help="bytes/second per connection (default: unlimited)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per scenario; the median is reported")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="where the synthetic streams are generated and kept")
+    parser.add_argument("--work-dir", help="folder for the outputs (default: system temp folder)")
+    parser.add_argument("--keep", action="store_true", help="keep the output folders")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved earlier with --save")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}, choose from: {', '.join(SCENARIOS)}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args)), flush=True)
+        return 0
+
+    from benchmarks.media import prepare_media
+    # Generate the streams up front so it isn't part of any measurement
+    prepare_media(args.cache_dir, args.duration)
+
+    results = []
+    for name in args.scenarios or SCENARIOS:
+        runs = [run_isolated(name, args) for _ in range(max(1, args.repeat))]
+        results.append(combine_runs(runs))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)["results"]
+    print_report(results, baseline)
+
+    if args.save:
+        settings = {key: getattr(args, key) for key in ("items", "duration", "latency", "bandwidth", "repeat")}
+        with open(args.save, 'w', encoding='utf-8') as file:
+            json.dump({"settings": settings, "results": results}, file, indent=2)
+    return 1 if any(result["status"] != "ok" for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# benchmarks/stream_server.py
+
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_RANGE = re.compile(r"bytes=(\d+)-(\d*)")
+_BLOCK_SIZE = 64 * 1024
+
+# Local HTTP server for synthetic streams, standing in for googlevideo.com.
+# Serves registered files by name with Range support. latency (seconds) is
+# waited before every response, bandwidth (bytes/second, per connection)
+# throttles the body, like a slow CDN edge would. With ranges=False every
+# request gets the whole file, like a server without Range support.
+class StreamServer:
+    def __init__(self, latency=0.0, bandwidth=None, host="127.0.0.1", port=0, ranges=True):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.ranges = ranges
+        self.files = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_served = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    # Function to serve file_path as /name; returns its URL
+    def add_file(self, name, file_path):
+        self.files[name] = file_path
+        return self.url(name)
+
+    def url(self, name):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/{name}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # Returns and resets the request and byte counters
+    def take_counters(self):
+        with self.lock:
+            counters = {"requests": self.requests, "bytes_served": self.bytes_served}
+            self.requests = 0
+            self.bytes_served = 0
+        return counters
+
+    def _count(self, requests=0, sent=0):
+        with self.lock:
+            self.requests += requests
+            self.bytes_served += sent
+
+    def _send_body(self, wfile, file_path, start, length):
+        started = time.perf_counter()
+        sent = 0
+        with open(file_path, 'rb') as file:
+            file.seek(start)
+            while sent < length:
+                block = file.read(min(_BLOCK_SIZE, length - sent))
+                if not block:
+                    break
+                wfile.write(block)
+                sent += len(block)
+                self._count(sent=len(block))
+                if self.bandwidth:
+                    ahead = sent / self.bandwidth - (time.perf_counter() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, with_body):
+                server._count(requests=1)
+                name = self.path.split("?", 1)[0].lstrip("/")
+                file_path = server.files.get(name)
+                if file_path is None:
+                    self.send_error(404)
+                    return
+                if server.latency:
+                    time.sleep(server.latency)
+
+                size = os.path.getsize(file_path)
+                start, end = 0, size - 1
+                # The range may come as a header or, like googlevideo, in the query
+                match = _RANGE.match(self.headers.get("Range", "")) or re.search(r"[?&]range=(\d+)-(\d*)", self.path)
+                if match and server.ranges:
+                    start = int(match.group(1))
+                    if match.group(2):
+                        end = min(int(match.group(2)), size - 1)
+                    if start >= size:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{size}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                else:
+                    self.send_response(200)
+                if server.ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+                if with_body:
+                    try:
+                        server._send_body(self.wfile, file_path, start, end - start + 1)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # ffmpeg closes the connection once it has seeked past this range
+                        pass
+
+            def do_GET(self):
+                self._respond(True)
+
+            def do_HEAD(self):
+                self._respond(False)
+
+        return Handler
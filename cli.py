@@ -0,0 +1,343 @@
+# cli.py
+#
+# Headless batch mode: runs the audio, raw audio, video and playlist flows
+# without tkinter and prints one JSON result per job on stdout.
+#
+#   python cli.py https://youtu.be/...                    (kind defaults to audio)
+#   python cli.py audio https://youtu.be/... https://youtu.be/... -o downloads
+#   python cli.py video --resolution 720p --url-file links.txt -o downloads
+#   python cli.py audio https://youtu.be/... --start 1:30 --end 2:00
+#   python cli.py --job-file jobs.jsonl --concurrency 4
+#   python cli.py audio https://youtu.be/... --metrics spans.jsonl --metrics-prom metrics.prom
+#   python cli.py playlist-audio https://youtube.com/playlist?list=... --journal
+#   python cli.py --resume
+#   python cli.py playlist-audio https://youtube.com/playlist?list=... --async
+#   python cli.py playlist-audio https://youtube.com/playlist?list=... --store
+#   python cli.py --store-stats
+#
+# A job file has one JSON object per line, for example
+#   {"kind": "playlist-audio", "url": "https://...", "output_dir": "music", "sync": true}
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+
+from helpers.progress import Progress
+from helpers.utils import parse_clip
+from helpers.metrics import enable_metrics, write_prometheus, describe_summary
+from helpers.job_journal import JOURNAL_PATH, DOWNLOADING, FAILED, JobJournal, JournalProgress
+from helpers.async_engine import AsyncEngine
+from helpers.output_store import STORE_DIR, STORE_MAX_BYTES, OutputStore, enable_store
+from helpers.stream_policy import StreamPolicy
+from helpers.audio_helper import start_download_audio
+from helpers.video_helper import get_available_resolutions, start_process_video
+from helpers.playlist_helper import PLAYLIST_WORKERS, TRANSCODE_WORKERS, start_download_playlist
+from helpers.url_parser import (
+    video_id_from_url,
+    playlist_id_from_url,
+    canonical_video_url,
+    canonical_playlist_url,
+)
+
+KINDS = ("audio", "raw-audio", "audio-copy", "video", "playlist-audio", "playlist-video")
+
+_stderr_lock = threading.Lock()
+
+def _resolution_index(youtube_link, resolution, max_height=None):
+    resolutions, _ = get_available_resolutions(youtube_link)
+    if isinstance(resolutions, str):
+        raise RuntimeError(f"Failed to get resolutions: {resolutions}")
+    if not resolution and max_height:
+        # Highest resolution within the limit, or the lowest there is
+        for index, available in enumerate(resolutions):
+            if int(available.rstrip('p')) <= max_height:
+                return index
+        return len(resolutions) - 1
+    if not resolution:
+        return 0  # highest
+    if resolution not in resolutions:
+        raise ValueError(f"Resolution {resolution} not available, choose from: {', '.join(resolutions)}")
+    return resolutions.index(resolution)
+
+def _job_policy(job):
+    return StreamPolicy(
+        max_height=job.get("max_height"),
+        codecs=tuple(job["codecs"]) if job.get("codecs") else None,
+        max_bytes_per_sec=job.get("max_rate"),
+        audio_bitrate=job.get("audio_bitrate"),
+    )
+
+# Function to run one job and describe its outcome as a dict. With a journal
+# the job's progress is recorded there (see helpers.job_journal); a watcher
+# Progress also gets its log lines, percentages, status and byte counts.
+# Playlists run their items on the given AsyncEngine, if any.
+def run_job(index, job, verbose=False, journal=None, watcher=None, engine=None):
+    kind = job.get("kind", "audio")
+    url = job["url"]
+    output_dir = job.get("output_dir") or os.getcwd()
+    result = {"job": index, "kind": kind, "url": url, "status": "failed", "output": None, "error": None}
+    watcher = watcher or Progress()
+
+    def on_log(message):
+        watcher.log(message)
+        if verbose:
+            with _stderr_lock:
+                print(f"[job {index}] {message}", file=sys.stderr, flush=True)
+
+    def on_status(text):
+        watcher.status(text)
+        if verbose:
+            with _stderr_lock:
+                print(f"[job {index}] {text}", file=sys.stderr, flush=True)
+
+    def on_finished(path):
+        result["status"] = "ok"
+        result["output"] = path
+
+    def on_error(message):
+        result["error"] = message
+
+    progress = Progress(on_log=on_log, on_percent=watcher.set, on_finished=on_finished, on_error=on_error, on_status=on_status, on_bytes=watcher.transferred)
+    journal_job = None
+    if journal is not None and job.get("journal_id") is not None:
+        journal_job = journal.job(job["journal_id"])
+        journal_job.set_state(DOWNLOADING)
+        progress = JournalProgress(progress, journal_job)
+    policy = _job_policy(job)
+    clip = parse_clip(job.get("start"), job.get("end"))
+    # A journaled job downloads to a file first, so a rerun resumes its .part
+    streaming = job.get("streaming", True) and journal_job is None
+    started = time.monotonic()
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        if kind == "audio":
+            start_download_audio(url, output_dir, progress, policy=policy, clip=clip, streaming=streaming)
+        elif kind == "raw-audio":
+            start_download_audio(url, output_dir, progress, convert_to_mp3=False, policy=policy, clip=clip)
+        elif kind == "audio-copy":
+            start_download_audio(url, output_dir, progress, convert_to_mp3=False, policy=policy, remux=True, clip=clip)
+        elif kind == "video":
+            resolution_choice = _resolution_index(url, job.get("resolution"), policy.max_height)
+            start_process_video(url, resolution_choice, output_dir, progress, policy=policy, clip=clip, streaming=streaming)
+        elif kind in ("playlist-audio", "playlist-video"):
+            download_type = 1 if kind == "playlist-audio" else 2
+            start_download_playlist(
+                url, output_dir, progress, download_type,
+                max_workers=job.get("playlist_workers", PLAYLIST_WORKERS),
+                sync=job.get("sync", False),
+                prune=job.get("prune", False),
+                transcode_workers=job.get("transcode_workers", TRANSCODE_WORKERS),
+                policy=policy,
+                clip=clip,
+                job=journal_job,
+                engine=engine,
+                streaming=streaming,
+            )
+        else:
+            raise ValueError(f"Unknown job kind: {kind}")
+    except CancelledError:
+        # The engine was stopped; the journal keeps the job unfinished so
+        # --resume picks it up
+        result["status"] = "canceled"
+        result["error"] = "Canceled"
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    if result["status"] == "failed" and not result["error"]:
+        result["error"] = "Job did not produce any output"
+    if journal_job is not None and result["status"] == "failed":
+        journal_job.set_state(FAILED, error=result["error"])
+    result["seconds"] = round(time.monotonic() - started, 3)
+    return result
+
+def _read_lines(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip() and not line.lstrip().startswith('#')]
+
+def build_jobs(args):
+    defaults = {
+        "kind": args.kind,
+        "output_dir": args.output_dir,
+        "resolution": args.resolution,
+        "sync": args.sync,
+        "prune": args.prune,
+        "playlist_workers": args.playlist_workers,
+        "transcode_workers": args.transcode_workers,
+        "streaming": args.streaming,
+        "max_height": args.max_height,
+        "codecs": args.codec or None,
+        "max_rate": args.max_rate,
+        "audio_bitrate": args.audio_bitrate,
+        "start": args.start,
+        "end": args.end,
+    }
+    urls = list(args.urls)
+    for url_file in args.url_file:
+        urls.extend(_read_lines(url_file))
+
+    jobs = [dict(defaults, url=url) for url in urls]
+    for job_file in args.job_file:
+        for line in _read_lines(job_file):
+            jobs.append(dict(defaults, **json.loads(line)))
+    return jobs
+
+# Function to check every job's link offline and drop repeats before any
+# network work is scheduled. Returns (jobs to run, results for the rest).
+def prepare_jobs(jobs):
+    runnable, rejected = [], []
+    seen = {}
+    for index, job in enumerate(jobs):
+        kind = job.get("kind", "audio")
+        result = {"job": index, "kind": kind, "url": job.get("url"), "status": "failed", "output": None, "error": None, "seconds": 0}
+        if kind not in KINDS:
+            result["error"] = f"Unknown job kind: {kind}"
+            rejected.append(result)
+            continue
+        if kind.startswith("playlist-"):
+            item_id = playlist_id_from_url(job.get("url"))
+            canonical = canonical_playlist_url
+        else:
+            item_id = video_id_from_url(job.get("url"))
+            canonical = canonical_video_url
+        if item_id is None:
+            result["error"] = "Invalid YouTube link"
+            rejected.append(result)
+            continue
+        try:
+            clip = parse_clip(job.get("start"), job.get("end"))
+        except ValueError as e:
+            result["error"] = str(e)
+            rejected.append(result)
+            continue
+        if clip is not None and job.get("sync"):
+            result["error"] = "A synced playlist can't be limited to a clip"
+            rejected.append(result)
+            continue
+
+        key = (kind, item_id, job.get("output_dir"), job.get("resolution"), clip)
+        if key in seen:
+            result["status"] = "skipped"
+            result["error"] = f"Duplicate of job {seen[key]}"
+            rejected.append(result)
+            continue
+        seen[key] = index
+        runnable.append((index, dict(job, url=canonical(item_id))))
+    return runnable, rejected
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download YouTube audio, video and playlists without the GUI.")
+    # Not choices=KINDS: argparse would then reject a link given without a kind
+    parser.add_argument("kind", nargs="?", default="audio", help=f"what to download for the given URLs: {', '.join(KINDS)} (default: audio)")
+    parser.add_argument("urls", nargs="*", help="YouTube video or playlist links")
+    parser.add_argument("--url-file", action="append", default=[], help="file with one link per line")
+    parser.add_argument("--job-file", action="append", default=[], help="JSON lines file, one job object per line")
+    parser.add_argument("-o", "--output-dir", default=os.getcwd(), help="download folder (default: current folder)")
+    parser.add_argument("--resolution", help="video resolution such as 720p (default: highest)")
+    parser.add_argument("--max-height", type=int, help="highest video height to fetch, e.g. 720 (default: best available)")
+    parser.add_argument("--codec", action="append", default=[], help="acceptable codec (av1, vp9, h264, aac, opus); repeat for several")
+    parser.add_argument("--max-rate", type=int, help="bandwidth budget per stream in bytes/second")
+    parser.add_argument("--audio-bitrate", type=int, help="audio quality to aim for in kbps; the smallest stream reaching it is fetched")
+    parser.add_argument("--start", help="only download from this time on, e.g. 90, 1:30 or 1:02:03.5")
+    parser.add_argument("--end", help="only download up to this time (default: to the end)")
+    parser.add_argument("--sync", action="store_true", help="sync playlists into a stable folder, only downloading new items")
+    parser.add_argument("--prune", action="store_true", help="with --sync, delete items that left the playlist")
+    parser.add_argument("-j", "--concurrency", type=int, default=2, help="jobs run at the same time (default: 2)")
+    parser.add_argument("--playlist-workers", type=int, default=PLAYLIST_WORKERS, help=f"items per playlist downloaded at the same time (default: {PLAYLIST_WORKERS})")
+    parser.add_argument("--transcode-workers", type=int, default=TRANSCODE_WORKERS, help=f"ffmpeg processes per playlist run at the same time: streamed items, or conversions with --no-streaming (default: {TRANSCODE_WORKERS})")
+    parser.add_argument("--no-streaming", dest="streaming", action="store_false", help="download each stream to a file before converting it; playlists then fetch and convert in separate stages")
+    parser.add_argument("--metrics", nargs="?", const="", metavar="JSONL", help="time every step and print a summary; with a path, also append each span there as a JSON line")
+    parser.add_argument("--metrics-prom", metavar="PATH", help="write a Prometheus text snapshot of the step timings at the end")
+    parser.add_argument("--journal", nargs="?", const=JOURNAL_PATH, metavar="PATH", help=f"record the jobs in a journal so an interrupted run can be resumed (default: {JOURNAL_PATH})")
+    parser.add_argument("--resume", action="store_true", help="also run the jobs the journal has as unfinished, continuing where they stopped")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run playlist items as coroutines on one event loop (non-blocking downloads and ffmpeg runs) instead of a thread each")
+    parser.add_argument("--store", nargs="?", const=STORE_DIR, metavar="DIR", help=f"reuse MP3/MP4 outputs made before from a local store, reflinked or hardlinked instead of downloaded again (default: {STORE_DIR})")
+    parser.add_argument("--store-max-size", type=float, default=STORE_MAX_BYTES / 1073741824, metavar="GB", help="size the store is trimmed to, least recently used first (default: %(default)g)")
+    parser.add_argument("--store-stats", action="store_true", help="print the store's size and hit rate as JSON and exit")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print progress messages on stderr")
+    args = parser.parse_args(argv)
+
+    # python cli.py <url> ...: the first link landed in kind
+    if args.kind not in KINDS:
+        if "://" in args.kind or video_id_from_url(args.kind) or playlist_id_from_url(args.kind):
+            args.urls.insert(0, args.kind)
+            args.kind = "audio"
+        else:
+            parser.error(f"argument kind: invalid choice: {args.kind!r} (choose from {', '.join(KINDS)})")
+    return args
+
+# Function to put the journal's unfinished jobs ahead of the new ones, so a
+# new job repeating one of them is dropped as a duplicate
+def _resumed_jobs(journal):
+    return [dict(row["options"], journal_id=row["id"]) for row in journal.unfinished_jobs()]
+
+def main(argv=None):
+    args = parse_args(argv)
+    max_bytes = int(args.store_max_size * 1073741824)
+    if args.store_stats:
+        store = OutputStore(args.store or STORE_DIR, max_bytes)
+        print(json.dumps(store.stats(), indent=2))
+        return 0
+    if args.store:
+        enable_store(args.store, max_bytes)
+
+    journal = None
+    if args.journal or args.resume:
+        journal = JobJournal(args.journal or JOURNAL_PATH)
+    jobs = build_jobs(args)
+    if args.resume:
+        jobs = _resumed_jobs(journal) + jobs
+    if not jobs:
+        print("No jobs given.", file=sys.stderr)
+        return 2
+
+    metrics = args.metrics is not None or args.metrics_prom is not None
+    if metrics:
+        enable_metrics(args.metrics or None)
+
+    runnable, rejected = prepare_jobs(jobs)
+    failed = 0
+    for result in rejected:
+        if result["status"] == "failed":
+            failed += 1
+        journal_id = jobs[result["job"]].get("journal_id")
+        if journal is not None and journal_id is not None:
+            journal.update_job(journal_id, state=FAILED, error=result["error"])
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+
+    if journal is not None:
+        for index, job in runnable:
+            if job.get("journal_id") is None:
+                job["journal_id"] = journal.add_job(job.get("kind", "audio"), job["url"], job.get("output_dir") or os.getcwd(), job).id
+
+    if args.use_async:
+        # Waiting jobs are coroutines; --concurrency of them run at a time
+        engine = AsyncEngine(job_slots=max(1, args.concurrency)).start()
+        futures = [engine.submit_job(run_job, index, job, args.verbose, journal, engine=engine) for index, job in runnable]
+    else:
+        executor = ThreadPoolExecutor(max_workers=max(1, args.concurrency))
+        futures = [executor.submit(run_job, index, job, args.verbose, journal) for index, job in runnable]
+    try:
+        for future in as_completed(futures):
+            result = future.result()
+            if result["status"] != "ok":
+                failed += 1
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+    finally:
+        if args.use_async:
+            engine.stop()
+        else:
+            executor.shutdown()
+
+    if metrics:
+        for line in describe_summary():
+            print(f"[metrics] {line}", file=sys.stderr, flush=True)
+        if args.metrics_prom:
+            write_prometheus(args.metrics_prom)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
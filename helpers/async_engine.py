@@ -0,0 +1,642 @@
+# helpers/async_engine.py
+
+import asyncio
+import functools
+import os
+import ssl
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urljoin
+from helpers.utils import get_ffmpeg_path
+from helpers.metrics import span
+from helpers.pipeline import Finished, CPU_WORKERS
+from helpers.ffmpeg_helper import (
+    HTTP_USER_AGENT,
+    _progress_command,
+    _report_progress,
+    _parse_probe,
+    _merge_command,
+    _convert_command,
+)
+from helpers.ranged_downloader import (
+    RANGED_CONNECTIONS,
+    RANGE_SIZE,
+    RANGE_RETRIES,
+    READ_BLOCK_SIZE,
+    REQUEST_TIMEOUT,
+    RangeNotSupportedError,
+    _prepare_part,
+    _pending_ranges,
+    _save_part_state,
+    _range_url,
+    _pytubefix_download,
+)
+from helpers.segmented_encoder import should_segment
+from helpers.audio_helper import MP3_ENCODE_ARGS, convert_file_to_mp3
+
+# Streams downloading at the same time, over all jobs
+NETWORK_SLOTS = 8
+
+# ffmpeg processes running at the same time, over all jobs
+FFMPEG_SLOTS = CPU_WORKERS
+
+# Threads for the calls that can only block: pytubefix resolving and playlist
+# listing, and the odd fallback download
+BLOCKING_WORKERS = 4
+
+# Threads for the short file and database writes coroutines make (range
+# blocks, .part sidecars, journal rows). They are kept apart from the blocking
+# threads, which a playlist's plain stages can hold for minutes.
+IO_WORKERS = 2
+
+# Seconds stop() gives the canceled coroutines to unwind
+STOP_TIMEOUT = 5
+
+# Jobs whose blocking front half (start_download_audio, ...) runs at the same time
+JOB_SLOTS = 2
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+_MAX_REDIRECTS = 5
+
+_ssl_context = None
+
+def _get_ssl_context():
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+# Function to send a GET request over asyncio streams, following redirects.
+# Returns (status, headers with lower case names, reader, writer); the caller
+# reads the body and closes the writer.
+async def _open_url(url, headers, timeout=REQUEST_TIMEOUT):
+    for _ in range(_MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        secure = parts.scheme == "https"
+        port = parts.port or (443 if secure else 80)
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(parts.hostname, port, ssl=_get_ssl_context() if secure else None), timeout
+        )
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        lines = [f"GET {target} HTTP/1.1", f"Host: {parts.netloc}", "Connection: close"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            writer.close()
+            raise IOError(f"Bad HTTP response: {status_line[:80]!r}")
+        response_headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if status in _REDIRECTS and "location" in response_headers:
+            writer.close()
+            url = urljoin(url, response_headers["location"])
+            continue
+        return status, response_headers, reader, writer
+    raise IOError(f"Too many redirects for {url}")
+
+# Yields the body of a response in blocks, plain or chunked
+async def _iter_body(reader, headers, timeout=REQUEST_TIMEOUT):
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await asyncio.wait_for(reader.readline(), timeout)).split(b";")[0], 16)
+            if size == 0:
+                return
+            yield await asyncio.wait_for(reader.readexactly(size), timeout)
+            await asyncio.wait_for(reader.readline(), timeout)
+    else:
+        while True:
+            block = await asyncio.wait_for(reader.read(READ_BLOCK_SIZE), timeout)
+            if not block:
+                return
+            yield block
+
+def _open_at(file_path, start):
+    file = open(file_path, 'r+b')
+    file.seek(start)
+    return file
+
+# Function to fetch bytes start-end of url into file_path at the same offset.
+# The file is opened and written on the executor's threads, not on the loop.
+async def _fetch_range(url, file_path, start, end, on_bytes=None, executor=None):
+    loop = asyncio.get_running_loop()
+    status, headers, reader, writer = await _open_url(
+        _range_url(url, start, end), {"User-Agent": HTTP_USER_AGENT, "Range": f"bytes={start}-{end}"}
+    )
+    expected = end - start + 1
+    received = 0
+    try:
+        if status >= 400:
+            raise IOError(f"HTTP {status} for range {start}-{end}")
+        if status != 206 and start != 0:
+            raise RangeNotSupportedError(f"Server ignored range {start}-{end}")
+        with await loop.run_in_executor(executor, _open_at, file_path, start) as file:
+            async for block in _iter_body(reader, headers):
+                block = block[:expected - received]
+                await loop.run_in_executor(executor, file.write, block)
+                received += len(block)
+                if on_bytes is not None:
+                    on_bytes(len(block))
+                if received >= expected:
+                    break
+    finally:
+        writer.close()
+    if received != expected:
+        raise IOError(f"Incomplete range {start}-{end}: got {received} of {expected} bytes")
+
+def _known_size(stream):
+    try:
+        return stream.filesize
+    except Exception:
+        return 0
+
+# Function to write a block into a pipe writer, waiting while the pipe is
+# full. Returns False once the reader (ffmpeg) has closed its end.
+async def _write_pipe(pipe, block):
+    try:
+        pipe.write(block)
+        await pipe.drain()
+        return True
+    except (BrokenPipeError, ConnectionResetError):
+        return False
+
+# Event loop in a background thread that runs downloads, ffmpeg processes and
+# whole playlists as coroutines. A pending item costs a coroutine instead of a
+# thread; what runs at the same time is bounded by one semaphore per resource
+# ("network", "ffmpeg", "job"). Calls that can only block (pytubefix) go to a
+# small thread pool, short file and database writes to another.
+#
+# The coroutine methods mirror the blocking helpers (download_stream,
+# merge_files, convert_file_to_mp3, transcode_stream, mux_streams) and use the
+# same .part sidecars, so a transfer started by one can be finished by the other.
+class AsyncEngine:
+    def __init__(self, network_slots=NETWORK_SLOTS, ffmpeg_slots=FFMPEG_SLOTS, blocking_workers=BLOCKING_WORKERS, job_slots=JOB_SLOTS,
+                 io_workers=IO_WORKERS):
+        self.limits = {"network": network_slots, "ffmpeg": ffmpeg_slots, "job": job_slots}
+        self.blocking = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix="engine-blocking")
+        self.io = ThreadPoolExecutor(max_workers=max(1, io_workers), thread_name_prefix="engine-io")
+        self.jobs = ThreadPoolExecutor(max_workers=job_slots, thread_name_prefix="engine-job")
+        self.loop = asyncio.new_event_loop()
+        self.semaphores = {}
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stopped = False
+        # Futures handed out by submit() that haven't finished yet
+        self.futures = set()
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.semaphores = {name: asyncio.Semaphore(max(1, limit)) for name, limit in self.limits.items()}
+            ready.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name="async-engine", daemon=True)
+        self.thread.start()
+        ready.wait()
+        return self
+
+    # Function to shut the engine down. Every coroutine is canceled and gets
+    # timeout seconds to unwind before the loop stops, so whoever waits on
+    # run() or a submitted future gets CancelledError instead of waiting
+    # forever. Blocking calls already running on the thread pools finish in
+    # the background; queued ones never start.
+    def stop(self, timeout=STOP_TIMEOUT):
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+        if self.thread is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self._cancel_all, timeout)
+            self.thread.join(timeout + 1)
+        # Left over only when a coroutine didn't unwind in time
+        for future in list(self.futures):
+            future.cancel()
+        for executor in (self.blocking, self.io, self.jobs):
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # Runs on the loop: cancels every task, then stops the loop once they
+    # are done or timeout has passed
+    def _cancel_all(self, timeout):
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+
+        async def unwind():
+            if tasks:
+                await asyncio.wait(tasks, timeout=timeout)
+            self.loop.stop()
+
+        self.loop.create_task(unwind())
+
+    # Function to schedule a coroutine from any other thread; returns a
+    # concurrent.futures.Future with its result. Raises RuntimeError once
+    # the engine is stopped.
+    def submit(self, coroutine):
+        with self.lock:
+            if self.stopped:
+                coroutine.close()
+                raise RuntimeError("AsyncEngine is stopped")
+            future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+            self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+        return future
+
+    # Function to run a coroutine from another thread and wait for its result
+    def run(self, coroutine):
+        if threading.current_thread() is self.thread:
+            coroutine.close()
+            raise RuntimeError("AsyncEngine.run() can't wait inside the engine's own loop")
+        return self.submit(coroutine).result()
+
+    async def run_blocking(self, func, *args, **kwargs):
+        return await self.loop.run_in_executor(self.blocking, functools.partial(func, *args, **kwargs))
+
+    # Function to run a short file or database write off the loop
+    async def run_io(self, func, *args, **kwargs):
+        return await self.loop.run_in_executor(self.io, functools.partial(func, *args, **kwargs))
+
+    # Function to run a blocking job (start_download_audio and the like) once
+    # a job slot is free; until then it waits as a coroutine
+    async def run_job(self, func, *args, **kwargs):
+        async with self.semaphores["job"]:
+            return await self.loop.run_in_executor(self.jobs, functools.partial(func, *args, **kwargs))
+
+    def submit_job(self, func, *args, **kwargs):
+        return self.submit(self.run_job(func, *args, **kwargs))
+
+    # ----------------- Downloads -----------------
+
+    # Coroutine version of ranged_downloader.download_url: the ranges are
+    # fetched by `connections` coroutines instead of threads
+    async def download_url(self, url, file_path, total_size, connections=RANGED_CONNECTIONS, range_size=RANGE_SIZE, stats=None, on_bytes=None):
+        stats = {} if stats is None else stats
+        stats.setdefault("retries", 0)
+        stats.setdefault("bytes", 0)
+        part_file = file_path + ".part"
+        state = await self.run_io(_prepare_part, file_path, part_file, total_size, range_size, on_bytes)
+        if state is None:
+            return file_path
+        pending = deque(_pending_ranges(state, total_size, range_size))
+        errors = []
+        # Sidecar writes go one at a time, each with the latest state
+        saving = asyncio.Lock()
+
+        async def worker():
+            while pending and not errors:
+                start = pending.popleft()
+                end = min(start + range_size, total_size) - 1
+                for attempt in range(RANGE_RETRIES + 1):
+                    received = [0]
+                    def counted(count):
+                        received[0] += count
+                        on_bytes(count)
+                    try:
+                        await _fetch_range(url, file_path, start, end, counted if on_bytes is not None else None, self.io)
+                        break
+                    except RangeNotSupportedError as e:
+                        errors.append(e)
+                        return
+                    except Exception as e:
+                        if received[0]:
+                            # The range is fetched again from its start
+                            on_bytes(-received[0])
+                        if attempt == RANGE_RETRIES:
+                            errors.append(e)
+                            return
+                        stats["retries"] += 1
+                stats["bytes"] += end - start + 1
+                state["done"].append(start)
+                async with saving:
+                    await self.run_io(_save_part_state, part_file, dict(state, done=list(state["done"])))
+
+        await asyncio.gather(*(worker() for _ in range(max(1, min(connections, len(pending))))))
+        if errors:
+            # Keep the .part sidecar so the next attempt resumes
+            raise errors[0]
+        os.remove(part_file)
+        return file_path
+
+    # Coroutine version of ranged_downloader.download_stream; holds a network
+    # slot for the whole transfer
+    async def download_stream(self, stream, output_path, filename, connections=RANGED_CONNECTIONS, on_bytes=None):
+        async with self.semaphores["network"]:
+            with span("download", itag=getattr(stream, "itag", None)) as timing:
+                file_path = os.path.join(output_path, filename)
+                # pytubefix may ask the server for the size, so not on the loop
+                total_size = await self.run_blocking(_known_size, stream)
+                if not total_size:
+                    file_path = await self.run_blocking(_pytubefix_download, stream, output_path, filename, on_bytes)
+                    timing.set(bytes=os.path.getsize(file_path), connections=1)
+                    return file_path
+
+                os.makedirs(output_path, exist_ok=True)
+                stats = {}
+                reported = [0]
+                def counted(count):
+                    reported[0] += count
+                    on_bytes(count)
+                try:
+                    file_path = await self.download_url(stream.url, file_path, total_size, connections=connections, stats=stats,
+                                                        on_bytes=counted if on_bytes is not None else None)
+                    timing.set(connections=connections, **stats)
+                    return file_path
+                except RangeNotSupportedError:
+                    if os.path.exists(file_path + ".part"):
+                        os.remove(file_path + ".part")
+                    if reported[0]:
+                        # pytubefix downloads the whole stream again
+                        on_bytes(-reported[0])
+                    file_path = await self.run_blocking(_pytubefix_download, stream, output_path, filename, on_bytes, skip_existing=False)
+                    timing.set(bytes=os.path.getsize(file_path), connections=1, retries=stats.get("retries", 0))
+                    return file_path
+
+    # Function to feed url into pipe (an asyncio StreamWriter) in range
+    # requests of range_size, the way pytubefix's iter_chunks reads a stream.
+    # A request that fails is retried from the first byte not fed yet; a
+    # server that ignores Range is read in one response. Returns the bytes fed.
+    async def _feed_url(self, url, total_size, pipe, on_bytes=None, range_size=RANGE_SIZE):
+        sent = 0
+        retries = 0
+        while True:
+            headers = {"User-Agent": HTTP_USER_AGENT}
+            end = min(sent + range_size, total_size) - 1 if total_size else None
+            if end is not None:
+                headers["Range"] = f"bytes={sent}-{end}"
+            try:
+                status, response_headers, reader, writer = await _open_url(_range_url(url, sent, end) if end is not None else url, headers)
+                try:
+                    if status >= 400:
+                        raise IOError(f"HTTP {status} for {url}")
+                    ranged = status == 206
+                    if not ranged and sent:
+                        raise RangeNotSupportedError(f"Server ignored range {sent}-{end}")
+                    async for block in _iter_body(reader, response_headers):
+                        if ranged:
+                            block = block[:end + 1 - sent]
+                        if not await _write_pipe(pipe, block):
+                            # ffmpeg stopped reading; its exit code says why
+                            return sent
+                        sent += len(block)
+                        if on_bytes is not None:
+                            on_bytes(len(block))
+                        if ranged and sent > end:
+                            break
+                finally:
+                    writer.close()
+                if not ranged:
+                    if total_size and sent != total_size:
+                        raise IOError(f"Incomplete stream: got {sent} of {total_size} bytes")
+                    return sent
+                if sent <= end:
+                    raise IOError(f"Incomplete range ending at {end}: got up to {sent}")
+            except RangeNotSupportedError:
+                raise
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                if retries == RANGE_RETRIES:
+                    raise
+                retries += 1
+                continue
+            if sent >= total_size:
+                return sent
+
+    # ----------------- ffmpeg -----------------
+
+    # Coroutine version of ffmpeg_helper._run_ffmpeg_fed: runs ffmpeg with
+    # the first stream on its stdin and every other one on a pipe of its own,
+    # fed straight from the stream URLs, so only output_file is written. It
+    # holds a network and an ffmpeg slot. If a feed fails or the coroutine is
+    # canceled, ffmpeg is killed and the partial output removed.
+    async def _run_fed(self, streams, output_args, output_file, stage, on_bytes=None, extra_inputs=()):
+        loop = asyncio.get_running_loop()
+        # pytubefix may ask the server for the size, so not on the loop
+        sizes = [await self.run_blocking(_known_size, stream) for stream in streams]
+        async with self.semaphores["network"], self.semaphores["ffmpeg"]:
+            with span(stage, itag=",".join(str(getattr(stream, "itag", "")) for stream in streams)) as timing:
+                pipes = [os.pipe() for _ in streams[1:]]
+                inputs = ['-i', 'pipe:0']
+                for read_fd, _ in pipes:
+                    inputs += ['-i', f'pipe:{read_fd}']
+                command = [get_ffmpeg_path(), '-y', *inputs, *extra_inputs, *output_args, output_file]
+                try:
+                    process = await asyncio.create_subprocess_exec(*command, stdin=asyncio.subprocess.PIPE,
+                                                                   pass_fds=tuple(read_fd for read_fd, _ in pipes))
+                except BaseException:
+                    for _, write_fd in pipes:
+                        os.close(write_fd)
+                    raise
+                finally:
+                    # ffmpeg holds its own copies of the read ends now
+                    for read_fd, _ in pipes:
+                        os.close(read_fd)
+
+                writers = [process.stdin]
+                sent = [0] * len(streams)
+
+                async def feed(index):
+                    try:
+                        sent[index] = await self._feed_url(streams[index].url, sizes[index], writers[index], on_bytes)
+                    finally:
+                        writers[index].close()
+
+                tasks = []
+                try:
+                    for _, write_fd in pipes:
+                        transport, protocol = await loop.connect_write_pipe(
+                            lambda: asyncio.streams.FlowControlMixin(loop), os.fdopen(write_fd, 'wb')
+                        )
+                        writers.append(asyncio.StreamWriter(transport, protocol, None, loop))
+                    tasks = [asyncio.ensure_future(feed(index)) for index in range(len(streams))]
+                    await asyncio.gather(*tasks)
+                    returncode = await process.wait()
+                except BaseException:
+                    # Also stops the other feeds, whose pipes break now
+                    if process.returncode is None:
+                        process.kill()
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    for writer in writers[len(tasks):]:
+                        writer.close()
+                    await process.wait()
+                    if os.path.exists(output_file):
+                        os.remove(output_file)
+                    raise
+                timing.set(bytes=sum(sent))
+        if returncode != 0:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            raise subprocess.CalledProcessError(returncode, command)
+        return output_file
+
+    # Coroutine version of ffmpeg_helper.transcode_stream
+    async def transcode_stream(self, stream, output_file, output_args, on_bytes=None):
+        return await self._run_fed([stream], output_args, output_file, "stream_transcode", on_bytes)
+
+    # Coroutine version of ffmpeg_helper.mux_streams
+    async def mux_streams(self, video_stream, audio_stream, output_file, output_args, on_bytes=None):
+        if os.name == 'nt':
+            # No extra pipe handles on Windows; ffmpeg reads the audio URL itself
+            return await self._run_fed([video_stream], output_args, output_file, "stream_mux", on_bytes, ['-i', audio_stream.url])
+        return await self._run_fed([video_stream, audio_stream], output_args, output_file, "stream_mux", on_bytes)
+
+    # Coroutine version of ffmpeg_helper._run_ffmpeg; holds an ffmpeg slot
+    async def run_ffmpeg(self, command, duration=None, on_time=None):
+        async with self.semaphores["ffmpeg"]:
+            if on_time is None:
+                process = await asyncio.create_subprocess_exec(*command)
+            else:
+                command = _progress_command(command)
+                process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE)
+            try:
+                if on_time is not None:
+                    async for line in process.stdout:
+                        _report_progress(line.decode('utf-8', errors='replace'), duration, on_time)
+                returncode = await process.wait()
+            except asyncio.CancelledError:
+                # Don't leave ffmpeg running, e.g. when the engine stops
+                if process.returncode is None:
+                    process.kill()
+                raise
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command)
+
+    async def probe_codecs(self, file_path):
+        process = await asyncio.create_subprocess_exec(
+            get_ffmpeg_path(), '-hide_banner', '-i', file_path,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+        )
+        _, output = await process.communicate()
+        return _parse_probe(output.decode('utf-8', errors='replace'))
+
+    async def merge_files(self, video_file, audio_file, output_file, on_time=None):
+        video_probe, audio_probe = await asyncio.gather(self.probe_codecs(video_file), self.probe_codecs(audio_file))
+        command, decisions = _merge_command(video_file, audio_file, output_file, video_probe, audio_probe)
+        with span("merge", decisions=decisions) as timing:
+            await self.run_ffmpeg(command, video_probe.get("duration"), on_time)
+            timing.set(bytes=os.path.getsize(video_file) + os.path.getsize(audio_file))
+        return decisions
+
+    async def convert_audio_file(self, audio_file, output_file, encode_args, on_time=None):
+        probe = await self.probe_codecs(audio_file)
+        command, decisions = _convert_command(audio_file, output_file, encode_args, probe)
+        with span("convert", decisions=decisions) as timing:
+            await self.run_ffmpeg(command, probe.get("duration"), on_time)
+            timing.set(bytes=os.path.getsize(audio_file))
+        return decisions
+
+    # Coroutine version of audio_helper.convert_file_to_mp3. Long inputs still
+    # take the segmented encoder, which spreads over all cores by itself.
+    async def convert_file_to_mp3(self, audio_file, mp3_file, on_time=None):
+        probe = await self.probe_codecs(audio_file)
+        if probe.get("audio") != "mp3" and should_segment(probe.get("duration")):
+            async with self.semaphores["ffmpeg"]:
+                return await self.run_blocking(convert_file_to_mp3, audio_file, mp3_file, on_time)
+        decisions = await self.convert_audio_file(audio_file, mp3_file, MP3_ENCODE_ARGS, on_time)
+        with span("cleanup"):
+            os.remove(audio_file)
+        return decisions
+
+# Coroutine counterpart of pipeline.Pipeline, taking the same Stage list. Each
+# item is a task that walks through the stages; a stage runs at most
+# stage.workers items at once and admits at most workers + queue size, so a
+# fast stage waits for a slow one instead of piling up work. Coroutine stage
+# functions run on the loop, plain ones on the engine's blocking threads.
+# on_done runs on the engine's io threads, as it may write to the journal.
+class AsyncPipeline:
+    def __init__(self, engine, stages, on_done):
+        self.engine = engine
+        self.stages = stages
+        self.on_done = on_done
+        self.workers = None
+        self.slots = None
+
+    async def _run_stage(self, stage, payload):
+        with span("pipeline_" + stage.name):
+            if asyncio.iscoroutinefunction(stage.func):
+                return await stage.func(payload)
+            return await self.engine.run_blocking(stage.func, payload)
+
+    # Walks one item through the stages; it holds a slot of stage 0 on entry
+    async def _process(self, index, payload):
+        position = 0
+        while True:
+            stage = self.stages[position]
+            async with self.workers[position]:
+                stage.queued -= 1
+                stage.active += 1
+                try:
+                    result = await self._run_stage(stage, payload)
+                    error = None
+                except Exception as e:
+                    result, error = None, e
+                stage.active -= 1
+                stage.processed += 1
+
+            if error is not None or isinstance(result, Finished) or position + 1 == len(self.stages):
+                self.slots[position].release()
+                if error is not None:
+                    await self.engine.run_io(self.on_done, index, None, error)
+                elif isinstance(result, Finished):
+                    await self.engine.run_io(self.on_done, index, result.value, None)
+                else:
+                    await self.engine.run_io(self.on_done, index, result, None)
+                return
+
+            # Waits while the next stage is full (backpressure)
+            await self.slots[position + 1].acquire()
+            self.slots[position].release()
+            self.stages[position + 1].queued += 1
+            payload = result
+            position += 1
+
+    async def run_async(self, items):
+        self.workers = [asyncio.Semaphore(stage.workers) for stage in self.stages]
+        self.slots = [asyncio.Semaphore(stage.workers + stage.queue.maxsize) for stage in self.stages]
+        iterator = iter(items)
+        done = object()
+        tasks = []
+        count = 0
+        try:
+            while True:
+                await self.slots[0].acquire()
+                # Reading items may page through the playlist over the network
+                item = await self.engine.run_blocking(next, iterator, done)
+                if item is done:
+                    self.slots[0].release()
+                    break
+                self.stages[0].queued += 1
+                tasks.append(asyncio.ensure_future(self._process(count, item)))
+                count += 1
+        finally:
+            # Also when reading items fails: finish what was already started
+            if tasks:
+                await asyncio.gather(*tasks)
+        return count
+
+    # Function to push every item through the stages and wait until all are
+    # done, like Pipeline.run; called from outside the engine's loop
+    def run(self, items):
+        return self.engine.run(self.run_async(items))
+
+    def stats(self):
+        return {
+            stage.name: {"queued": stage.queued, "active": stage.active, "processed": stage.processed}
+            for stage in self.stages
+        }
+
+    def describe_depths(self):
+        return ", ".join(f"{name} {s['queued']}/{s['active']}" for name, s in self.stats().items())
@@ -1,101 +1,189 @@
 # helpers/audio_helper.py
 
 import os
-import subprocess
-import tkinter as tk
-from pytubefix import YouTube
-from helpers.utils import sanitize_filename, get_ffmpeg_path, get_token_file_path, show_success_message
+from helpers.utils import sanitize_filename, temp_filename, clip_suffix, describe_clip
+from helpers.resolver import resolve_video
+from helpers.ranged_downloader import download_stream
+from helpers.ffmpeg_helper import transcode_stream, plan_codec_args, stream_codecs, convert_audio_file, probe_codecs, clip_streams
+from helpers.segmented_encoder import should_segment, encode_mp3_segmented
+from helpers.stream_policy import DEFAULT_POLICY, select_audio_stream, explain_selection, stream_size
+from helpers.progress import TransferMeter
+from helpers.metrics import span
+from helpers.output_store import reuse_output, remember_output
 
-# Function to download audio and convert to mp3
-def download_audio_as_mp3(youtube_link, output_dir, progress_var, progress_text_widget, override=False):
+# Encode to MP3 while the audio downloads instead of saving the original file first
+STREAM_MP3_TRANSCODE = True
+
+MP3_ENCODE_ARGS = ['-c:a', 'libmp3lame', '-ar', '44100', '-ac', '2', '-b:a', '192k']
+
+# Bitrate of the MP3s we write, in kbps; a source above it only wastes bandwidth
+MP3_BITRATE = 192
+
+# Output store profile of those MP3s
+MP3_PROFILE = f"mp3-{MP3_BITRATE}k"
+
+# Container the audio is kept in when it is extracted without re-encoding
+REMUX_CONTAINERS = {"aac": "m4a", "opus": "opus", "vorbis": "ogg"}
+
+# Function to convert a downloaded audio file to MP3 and delete the original.
+# Long inputs are encoded in parallel segments on all cores.
+# Returns what was done with the audio (copied, re-encoded, segmented).
+# on_time(seconds, duration) follows a single pass conversion.
+def convert_file_to_mp3(audio_file, mp3_file, on_time=None):
+    probe = probe_codecs(audio_file)
+    if probe.get("audio") != "mp3" and should_segment(probe.get("duration")):
+        with span("segmented_encode", bytes=os.path.getsize(audio_file)) as timing:
+            segments = encode_mp3_segmented(audio_file, mp3_file, probe["duration"], MP3_BITRATE, on_time=on_time)
+            timing.set(segments=segments)
+        decisions = f"audio {probe.get('audio') or 'unknown'} re-encoded in {segments} parallel segments"
+    else:
+        decisions = convert_audio_file(audio_file, mp3_file, MP3_ENCODE_ARGS, on_time)
+
+    # Delete the original downloaded audio file
+    with span("cleanup"):
+        os.remove(audio_file)
+    return decisions
+
+# Function to download audio and convert to mp3. With clip = (start, end)
+# seconds only that part is fetched and converted. mp3_name replaces the
+# file name made from the title.
+def download_audio_as_mp3(youtube_link, output_dir, progress, override=False, streaming=STREAM_MP3_TRANSCODE, policy=DEFAULT_POLICY, clip=None,
+                          mp3_name=None):
     try:
-        yt = YouTube(
-            youtube_link,
-            client='WEB_EMBEDDED_PLAYER',
-            use_po_token=True,
-            token_file= get_token_file_path()
-        )
-        
-        # Get the highest bitrate audio stream
-        audio_stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, "Downloading audio...\n")
-        progress_text_widget.config(state=tk.DISABLED)
-        progress_var.set(30)
-        
-        # Download the audio stream in its original format (usually .webm or .m4a)
+        yt = resolve_video(youtube_link)
+
+        # Get the smallest audio stream that is still good enough for the MP3
+        selection = select_audio_stream(yt.streams, policy, MP3_BITRATE)
+        audio_stream = selection.stream
+        progress.log(explain_selection(selection))
         sanitized_title = sanitize_filename(yt.title)
-        audio_file = audio_stream.download(output_path=output_dir, filename=f"{sanitized_title}_audio")
-        progress_var.set(60)
-        
+        mp3_file = os.path.join(output_dir, mp3_name or f"{sanitized_title}{clip_suffix(clip)}.mp3")
+
+        if clip is not None:
+            codec_args, decisions = plan_codec_args("mp3", stream_codecs(audio_stream=audio_stream), audio_encode_args=MP3_ENCODE_ARGS)
+            progress.log(f"Downloading clip {describe_clip(clip, yt.length)} as MP3 ({decisions})...")
+            meter = TransferMeter(progress, label="Converting clip", unit="seconds")
+
+            clip_streams([audio_stream], mp3_file, clip, ['-vn', *codec_args], meter.update, yt.length)
+            meter.finish()
+
+            return mp3_file
+
+        if reuse_output(yt.video_id, audio_stream.itag, MP3_PROFILE, mp3_file, progress):
+            progress.set(100)
+            return mp3_file
+
+        if streaming and should_segment(yt.length):
+            # A piped encode runs on one core; long audio is downloaded first
+            # and then encoded in segments on all of them
+            progress.log(f"Long audio ({yt.length // 60} min), encoding in parallel segments.")
+            streaming = False
+
+        if streaming:
+            # Pipe the stream straight into ffmpeg, no intermediate _audio file
+            codec_args, decisions = plan_codec_args("mp3", stream_codecs(audio_stream=audio_stream), audio_encode_args=MP3_ENCODE_ARGS)
+            progress.log(f"Downloading and converting to MP3 ({decisions})...")
+            meter = TransferMeter(progress, stream_size(audio_stream), label="Downloading and converting")
+
+            transcode_stream(audio_stream, mp3_file, ['-vn', *codec_args], meter.add)
+            meter.finish()
+
+            remember_output(yt.video_id, audio_stream.itag, MP3_PROFILE, mp3_file, progress)
+            return mp3_file
+
+        progress.log("Downloading audio...")
+        meter = TransferMeter(progress, stream_size(audio_stream), 0, 60)
+
+        # Download the audio stream in its original format (usually .webm or .m4a)
+        audio_file = download_stream(audio_stream, output_dir, temp_filename(yt.title, yt.video_id, "audio"), on_bytes=meter.add)
+        meter.finish()
+
         # Convert the downloaded audio to MP3 with a bitrate of 192kbps
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, "Converting to MP3...\n")
-        progress_text_widget.config(state=tk.DISABLED)
-        mp3_file = os.path.join(output_dir, f"{sanitized_title}.mp3")
-        
-        ffmpeg_path = get_ffmpeg_path()  # Get the path to the ffmpeg.exe
-        command = f'"{ffmpeg_path}" -y -i "{audio_file}" -vn -ar 44100 -ac 2 -b:a 192k "{mp3_file}"'
-        
-        subprocess.run(command, shell=True, check=True)
-        progress_var.set(90)
-        
-        # Delete the original downloaded audio file
-        os.remove(audio_file)
-        progress_var.set(100)
-        
+        progress.log("Converting to MP3...")
+        meter = TransferMeter(progress, start=60, end=100, label="Converting", unit="seconds")
+        progress.log(convert_file_to_mp3(audio_file, mp3_file, meter.update).capitalize())
+        meter.finish()
+
+        remember_output(yt.video_id, audio_stream.itag, MP3_PROFILE, mp3_file, progress)
         return mp3_file
     except Exception as e:
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, f"Download failed: {e}\n")
-        progress_text_widget.config(state=tk.DISABLED)
+        progress.log(f"Download failed: {e}")
         return str(e)
 
 # Function to download audio without conversion (raw format)
-def download_raw_audio(youtube_link, output_dir, progress_var, progress_text_widget):
+def download_raw_audio(youtube_link, output_dir, progress, policy=DEFAULT_POLICY, clip=None):
     try:
-        yt = YouTube(
-            youtube_link,
-            client='WEB_EMBEDDED_PLAYER',
-            use_po_token=True,
-            token_file= get_token_file_path()
-        )
-        
-        # Get the highest bitrate audio stream
-        audio_stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, "Downloading raw audio...\n")
-        progress_text_widget.config(state=tk.DISABLED)
-        progress_var.set(30)
+        yt = resolve_video(youtube_link)
+
+        # Get the highest bitrate audio stream, unless the policy asks for less
+        selection = select_audio_stream(yt.streams, policy)
+        audio_stream = selection.stream
+        progress.log(explain_selection(selection))
+        progress.log("Downloading raw audio...")
 
         # Download the audio stream in its original format
         sanitized_title = sanitize_filename(yt.title)
         file_extension = audio_stream.mime_type.split('/')[1]
-        audio_file = audio_stream.download(output_path=output_dir, filename=f"{sanitized_title}.{file_extension}")
-        progress_var.set(100)
+        if clip is not None:
+            audio_file = os.path.join(output_dir, f"{sanitized_title}{clip_suffix(clip)}.{file_extension}")
+            progress.log(f"Clip {describe_clip(clip, yt.length)}")
+            meter = TransferMeter(progress, label="Cutting clip", unit="seconds")
+            clip_streams([audio_stream], audio_file, clip, ['-vn', '-c:a', 'copy'], meter.update, yt.length)
+        else:
+            meter = TransferMeter(progress, stream_size(audio_stream))
+            audio_file = download_stream(audio_stream, output_dir, f"{sanitized_title}.{file_extension}", on_bytes=meter.add)
+        meter.finish()
+
+        return audio_file
+    except Exception as e:
+        progress.log(f"Download failed: {e}")
+        return str(e)
+
+# Function to extract the audio track without re-encoding it: AAC ends up in
+# an .m4a file, Opus in an .opus file, only the container changes
+def download_audio_remux(youtube_link, output_dir, progress, policy=DEFAULT_POLICY, clip=None):
+    try:
+        yt = resolve_video(youtube_link)
+
+        selection = select_audio_stream(yt.streams, policy)
+        audio_stream = selection.stream
+        progress.log(explain_selection(selection))
+
+        codecs = stream_codecs(audio_stream=audio_stream)
+        container = REMUX_CONTAINERS.get(codecs["audio"], "m4a")
+        audio_file = os.path.join(output_dir, f"{sanitize_filename(yt.title)}{clip_suffix(clip)}.{container}")
+
+        codec_args, decisions = plan_codec_args(container, codecs)
+        progress.log(f"Extracting audio ({decisions})...")
+
+        if clip is not None:
+            progress.log(f"Clip {describe_clip(clip, yt.length)}")
+            meter = TransferMeter(progress, label="Cutting clip", unit="seconds")
+            clip_streams([audio_stream], audio_file, clip, ['-vn', *codec_args], meter.update, yt.length)
+        else:
+            meter = TransferMeter(progress, stream_size(audio_stream), label="Extracting")
+            transcode_stream(audio_stream, audio_file, ['-vn', *codec_args], meter.add)
+        meter.finish()
 
         return audio_file
     except Exception as e:
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, f"Download failed: {e}\n")
-        progress_text_widget.config(state=tk.DISABLED)
+        progress.log(f"Download failed: {e}")
         return str(e)
 
-# Function to start the download based on user's choice (mp3 or raw)
-def start_download_audio(youtube_link, output_dir, progress_var, progress_text_widget, loading_window, override=False, convert_to_mp3=True):
+# Function to start the download based on user's choice (mp3, raw, or remuxed
+# audio without re-encoding)
+def start_download_audio(youtube_link, output_dir, progress, override=False, convert_to_mp3=True, policy=DEFAULT_POLICY, remux=False, clip=None,
+                         streaming=STREAM_MP3_TRANSCODE):
     if convert_to_mp3:
-        audio_file = download_audio_as_mp3(youtube_link, output_dir, progress_var, progress_text_widget, override=override)
+        audio_file = download_audio_as_mp3(youtube_link, output_dir, progress, override=override, streaming=streaming, policy=policy, clip=clip)
+    elif remux:
+        audio_file = download_audio_remux(youtube_link, output_dir, progress, policy=policy, clip=clip)
     else:
-        audio_file = download_raw_audio(youtube_link, output_dir, progress_var, progress_text_widget)
+        audio_file = download_raw_audio(youtube_link, output_dir, progress, policy=policy, clip=clip)
 
-    if isinstance(audio_file, str) and "failed" in audio_file.lower():
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, "Download failed.\n")
-        progress_text_widget.config(state=tk.DISABLED)
+    if not (isinstance(audio_file, str) and os.path.isfile(audio_file)):
+        progress.error(f"Download failed: {audio_file}")
     else:
         normalized_audio_file = os.path.normpath(audio_file)
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, f"Download complete!\nFile saved to: {normalized_audio_file}\n")
-        progress_text_widget.config(state=tk.DISABLED)
-        loading_window.title("Finished")
-        show_success_message(normalized_audio_file)
+        progress.log(f"Download complete!\nFile saved to: {normalized_audio_file}")
+        progress.finished(normalized_audio_file)
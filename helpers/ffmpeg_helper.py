@@ -0,0 +1,260 @@
+# helpers/ffmpeg_helper.py
+
+import os
+import re
+import subprocess
+import threading
+from helpers.utils import get_ffmpeg_path
+from helpers.stream_policy import codec_family
+from helpers.metrics import span
+
+# Codecs each output container takes as they are, so they can be stream-copied.
+# Audio in mp4 stays AAC only: Opus in mp4 doesn't play in many players.
+CONTAINER_CODECS = {
+    "mp4": {"video": ("h264", "av1", "vp9", "hevc"), "audio": ("aac", "mp3")},
+    "m4a": {"video": (), "audio": ("aac",)},
+    "mp3": {"video": (), "audio": ("mp3",)},
+    "opus": {"video": (), "audio": ("opus",)},
+    "ogg": {"video": (), "audio": ("vorbis", "opus")},
+    "webm": {"video": ("vp8", "vp9", "av1"), "audio": ("opus", "vorbis")},
+}
+
+# Sent by ffmpeg when it reads a stream URL itself
+HTTP_USER_AGENT = "Mozilla/5.0"
+
+# Used only when a codec has to change
+VIDEO_ENCODE_ARGS = ['-c:v', 'libx264']
+AUDIO_ENCODE_ARGS = ['-c:a', 'aac']
+
+_PROBE_STREAM = re.compile(r"Stream #\d+:\d+.*?: (Video|Audio): (\w+)")
+_PROBE_DURATION = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+def _feed_stream(stream, pipe, process, errors, sent, on_bytes):
+    try:
+        for chunk in stream.iter_chunks():
+            pipe.write(chunk)
+            sent[0] += len(chunk)
+            if on_bytes is not None:
+                on_bytes(len(chunk))
+    except BrokenPipeError:
+        # ffmpeg stopped reading; its exit code says why
+        pass
+    except Exception as e:
+        errors.append(e)
+        # Stop ffmpeg so the other feeders don't wait on a job that already failed
+        process.kill()
+    finally:
+        try:
+            pipe.close()
+        except OSError:
+            pass
+
+# Runs ffmpeg while one thread per (stream, pipe) pair writes the stream's
+# chunks into that pipe. Each feeder blocks whenever ffmpeg isn't reading its
+# input, so nothing is buffered beyond the OS pipe. on_bytes(count) is called
+# for every chunk fed, from the feeder threads.
+def _run_ffmpeg_fed(command, process, feeds, output_file, stage, on_bytes=None):
+    errors = []
+    sent = [[0] for _ in feeds]
+    with span(stage, itag=",".join(str(getattr(stream, "itag", "")) for stream, _ in feeds)) as timing:
+        feeders = [
+            threading.Thread(target=_feed_stream, args=(stream, pipe, process, errors, counter, on_bytes), daemon=True)
+            for (stream, pipe), counter in zip(feeds, sent)
+        ]
+        for feeder in feeders:
+            feeder.start()
+        for feeder in feeders:
+            feeder.join()
+
+        returncode = process.wait()
+        timing.set(bytes=sum(counter[0] for counter in sent))
+        if errors or returncode != 0:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            if errors:
+                raise errors[0]
+            raise subprocess.CalledProcessError(returncode, command)
+    return output_file
+
+# Function to feed a pytubefix stream into ffmpeg's stdin while it downloads,
+# so the output is produced during the transfer and the original file never
+# touches the disk
+def transcode_stream(stream, output_file, output_args, on_bytes=None):
+    ffmpeg_path = get_ffmpeg_path()
+    command = [ffmpeg_path, '-y', '-i', 'pipe:0', *output_args, output_file]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE)
+    return _run_ffmpeg_fed(command, process, [(stream, process.stdin)], output_file, "stream_transcode", on_bytes)
+
+# Function to mux a video and an audio stream into one file while both are
+# downloading. The video goes through ffmpeg's stdin and the audio through a
+# second pipe, so only the final file is ever written to disk.
+def mux_streams(video_stream, audio_stream, output_file, output_args, on_bytes=None):
+    ffmpeg_path = get_ffmpeg_path()
+
+    if os.name == 'nt':
+        # Windows can't hand ffmpeg an extra pipe handle, so let ffmpeg read
+        # the audio straight from its URL instead
+        command = [ffmpeg_path, '-y', '-i', 'pipe:0', '-i', audio_stream.url, *output_args, output_file]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        return _run_ffmpeg_fed(command, process, [(video_stream, process.stdin)], output_file, "stream_mux", on_bytes)
+
+    audio_read_fd, audio_write_fd = os.pipe()
+    command = [ffmpeg_path, '-y', '-i', 'pipe:0', '-i', f'pipe:{audio_read_fd}', *output_args, output_file]
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, pass_fds=(audio_read_fd,))
+    except Exception:
+        os.close(audio_write_fd)
+        raise
+    finally:
+        # ffmpeg holds its own copy of the read end now
+        os.close(audio_read_fd)
+
+    audio_pipe = os.fdopen(audio_write_fd, 'wb')
+    return _run_ffmpeg_fed(command, process, [(video_stream, process.stdin), (audio_stream, audio_pipe)], output_file, "stream_mux", on_bytes)
+
+# Function to run an ffmpeg command to completion, like subprocess.run(check=True).
+# With on_time, ffmpeg reports its position on stdout (-progress) and
+# on_time(seconds written, duration) is called for every report.
+def _run_ffmpeg(command, duration=None, on_time=None):
+    if on_time is None:
+        subprocess.run(command, check=True)
+        return
+    command = _progress_command(command)
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, errors='replace')
+    for line in process.stdout:
+        _report_progress(line, duration, on_time)
+    returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
+
+def _progress_command(command):
+    return [command[0], '-progress', 'pipe:1', '-nostats', *command[1:]]
+
+# Function to pass one line of ffmpeg's -progress output on to on_time
+def _report_progress(line, duration, on_time):
+    key, _, value = line.strip().partition('=')
+    # out_time_us and (despite its name) out_time_ms are both microseconds
+    if key == 'out_time_us' and value.isdigit():
+        seconds = int(value) / 1000000
+        on_time(min(seconds, duration) if duration else seconds, duration)
+    elif key == 'progress' and value == 'end' and duration:
+        on_time(duration, duration)
+
+# Function to read the codecs and duration of a media file, e.g.
+# {"video": "h264", "audio": "aac", "duration": 212.5}. Missing entries are
+# left out. Uses "ffmpeg -i" so no separate ffprobe binary is needed.
+def probe_codecs(file_path):
+    ffmpeg_path = get_ffmpeg_path()
+    result = subprocess.run([ffmpeg_path, '-hide_banner', '-i', file_path], capture_output=True, text=True, errors='replace')
+    return _parse_probe(result.stderr)
+
+def _parse_probe(output):
+    codecs = {}
+    for kind, codec in _PROBE_STREAM.findall(output):
+        codecs.setdefault(kind.lower(), codec)
+    duration = _PROBE_DURATION.search(output)
+    if duration:
+        hours, minutes, seconds = duration.groups()
+        codecs["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return codecs
+
+# Function to get the codecs of pytubefix streams from their manifest entry
+def stream_codecs(video_stream=None, audio_stream=None):
+    codecs = {}
+    if video_stream is not None:
+        codecs["video"] = codec_family(video_stream.video_codec)
+    if audio_stream is not None:
+        codecs["audio"] = codec_family(audio_stream.audio_codec)
+    return codecs
+
+# Function to choose, per track, between stream copy and re-encoding for the
+# given output container. Returns (ffmpeg output args, what was decided).
+# An unknown video codec is copied and an unknown audio codec re-encoded, as
+# the merges did before they looked at codecs.
+def plan_codec_args(container, codecs, video_encode_args=VIDEO_ENCODE_ARGS, audio_encode_args=AUDIO_ENCODE_ARGS):
+    allowed = CONTAINER_CODECS.get(container, {"video": (), "audio": ()})
+    args = []
+    decisions = []
+
+    if "video" in codecs:
+        video_codec = codecs["video"]
+        if video_codec in allowed["video"] or not video_codec:
+            args += ['-c:v', 'copy']
+            decisions.append(f"video {video_codec or 'unknown'} copied")
+        else:
+            args += video_encode_args
+            decisions.append(f"video {video_codec} re-encoded for {container}")
+    if "audio" in codecs:
+        audio_codec = codecs["audio"]
+        if audio_codec in allowed["audio"]:
+            args += ['-c:a', 'copy']
+            decisions.append(f"audio {audio_codec} copied")
+        else:
+            args += audio_encode_args
+            decisions.append(f"audio {audio_codec or 'unknown'} re-encoded for {container}")
+    return args, ", ".join(decisions)
+
+def _container(output_file):
+    return os.path.splitext(output_file)[1].lstrip('.').lower()
+
+# Function to merge a downloaded video and audio file, copying every track the
+# container can hold. Returns what was decided, e.g. "video h264 copied, audio aac copied".
+# on_time(seconds, duration) follows ffmpeg's progress through the file.
+def merge_files(video_file, audio_file, output_file, on_time=None):
+    video_probe = probe_codecs(video_file)
+    command, decisions = _merge_command(video_file, audio_file, output_file, video_probe, probe_codecs(audio_file))
+    with span("merge", decisions=decisions) as timing:
+        _run_ffmpeg(command, video_probe.get("duration"), on_time)
+        timing.set(bytes=os.path.getsize(video_file) + os.path.getsize(audio_file))
+    return decisions
+
+# Returns (ffmpeg command, decisions) for merge_files from both files' probes
+def _merge_command(video_file, audio_file, output_file, video_probe, audio_probe):
+    codecs = {"video": video_probe.get("video"), "audio": audio_probe.get("audio")}
+    codec_args, decisions = plan_codec_args(_container(output_file), codecs)
+    return [get_ffmpeg_path(), '-y', '-i', video_file, '-i', audio_file, '-map', '0:v:0', '-map', '1:a:0', *codec_args, output_file], decisions
+
+# Function to convert one downloaded audio file, copying the audio when the
+# target container already takes its codec. Returns what was decided.
+def convert_audio_file(audio_file, output_file, encode_args, on_time=None):
+    probe = probe_codecs(audio_file)
+    command, decisions = _convert_command(audio_file, output_file, encode_args, probe)
+    with span("convert", decisions=decisions) as timing:
+        _run_ffmpeg(command, probe.get("duration"), on_time)
+        timing.set(bytes=os.path.getsize(audio_file))
+    return decisions
+
+# Returns (ffmpeg command, decisions) for convert_audio_file from the file's probe
+def _convert_command(audio_file, output_file, encode_args, probe):
+    codec_args, decisions = plan_codec_args(_container(output_file), {"audio": probe.get("audio")}, audio_encode_args=encode_args)
+    return [get_ffmpeg_path(), '-y', '-i', audio_file, '-vn', *codec_args, output_file], decisions
+
+# Function to cut clip = (start, end) seconds (end None: to the end) out of
+# streams, reading them straight from their URLs. ffmpeg seeks inside the
+# remote files with HTTP range requests, so only the clipped part, the index
+# and the data back to the preceding keyframe are transferred. Copied video
+# starts at that keyframe, re-encoded tracks exactly at start. on_time gets
+# ffmpeg's position in the clip; length (seconds) of the whole video gives the
+# clip duration when it runs to the end.
+def clip_streams(streams, output_file, clip, output_args, on_time=None, length=None):
+    start, end = clip
+    duration = (end if end is not None else length or 0) - start
+    command = [get_ffmpeg_path(), '-y']
+    for stream in streams:
+        command += ['-ss', f"{start:.3f}"]
+        if end is not None:
+            command += ['-t', f"{end - start:.3f}"]
+        command += ['-user_agent', HTTP_USER_AGENT, '-i', stream.url]
+    for index in range(len(streams)):
+        command += ['-map', str(index)]
+    command += [*output_args, output_file]
+
+    try:
+        with span("clip", itag=",".join(str(getattr(stream, "itag", "")) for stream in streams)) as timing:
+            _run_ffmpeg(command, duration if duration > 0 else None, on_time)
+            timing.set(bytes=os.path.getsize(output_file))
+    except Exception:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        raise
+    return output_file
@@ -0,0 +1,259 @@
+# helpers/gui_utils.py
+
+import os
+import subprocess
+import threading
+import tkinter as tk
+import tkinter.font as tkfont
+from tkinter import messagebox
+from helpers.progress import Progress, ProgressBus, coalesce_events
+from helpers.log_buffer import LogBuffer
+
+def center_window(window, width, height):
+    window.update_idletasks()
+    screen_width = window.winfo_screenwidth()
+    screen_height = window.winfo_screenheight()
+    x = (screen_width // 2) - (width // 2)
+    y = (screen_height // 2) - (height // 2)
+    window.geometry(f'{width}x{height}+{x}+{y}')
+
+def show_success_message(file_path):
+    if messagebox.askyesno(
+        "Success",
+        f"Download completed successfully. The file(s) are located at {file_path}.\n\nDo you want to open the file location?"
+    ):
+        open_file_location(file_path)
+
+def open_file_location(file_path):
+    if not os.path.exists(file_path):
+        messagebox.showerror("Error", "The path does not exist.")
+        return
+
+    if os.name == 'nt':  # For Windows
+        normalized_path = os.path.normpath(file_path)
+        subprocess.run(['explorer', '/select,', normalized_path], shell=True)
+    elif os.name == 'posix':  # For MacOS
+        subprocess.run(['open', '-R', file_path])
+    else:  # Assume Linux
+        directory = os.path.dirname(file_path)
+        subprocess.run(['xdg-open', directory])
+
+# Toast logic to show a quick message under a button
+current_toast = None
+def show_toast(root, message, button):
+    global current_toast
+    if current_toast is not None:
+        current_toast.destroy()
+
+    toast = tk.Toplevel(root)
+    toast.overrideredirect(True)
+    toast.attributes("-topmost", True)
+    current_toast = toast
+
+    label = tk.Label(toast, text=message, bg="lightyellow", relief=tk.SOLID, bd=1, padx=5, pady=2)
+    label.pack(expand=True, fill=tk.BOTH)
+
+    toast.update_idletasks()
+    toast_width = label.winfo_reqwidth() + 10
+
+    button_x = button.winfo_rootx() + (button.winfo_width() // 2) - (toast_width // 2)
+    button_y = button.winfo_rooty() + button.winfo_height()
+    toast.geometry(f"{toast_width}x30+{button_x}+{button_y}")
+
+    if hasattr(toast, "timer"):
+        root.after_cancel(toast.timer)
+    toast.timer = toast.after(1300, lambda: destroy_toast(toast))
+
+def destroy_toast(toast):
+    global current_toast
+    if toast == current_toast:
+        toast.destroy()
+        current_toast = None
+
+# How often the loading window applies queued progress, and how many events
+# it takes per tick so a flood of updates can't stall the UI
+PROGRESS_POLL_MS = 100
+PROGRESS_EVENTS_PER_TICK = 500
+
+# Lines moved per mouse wheel step in a LogView
+LOG_WHEEL_LINES = 3
+
+# Scrollable log of a loading window, showing a LogBuffer. Only the lines that
+# fit in the window are ever in the Text widget: scrolling and new lines
+# redraw that window from the buffer, so memory and the cost of an update
+# stay the same however long the run gets. The scrollbar is driven from the
+# buffer rather than from the widget. While scrolled to the bottom the view
+# follows new lines; scrolled up, it stays on the lines being read.
+class LogView(tk.Frame):
+    def __init__(self, parent, log=None, height=10, width=50):
+        super().__init__(parent)
+        self.log = log if log is not None else LogBuffer()
+        self.rows = height
+        # Number (in the LogBuffer) of the first line shown
+        self.top = 0
+        self.follow = True
+        # Whether the spill file outlives the window; set after an error
+        self.keep_log = False
+
+        self.text = tk.Text(self, height=height, width=width, wrap=tk.WORD, state=tk.DISABLED)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar = tk.Scrollbar(self, command=self._scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.line_height = max(1, tkfont.Font(font=self.text.cget("font")).metrics("linespace"))
+
+        self.text.bind("<Configure>", self._resize)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.text.bind(sequence, self._wheel)
+        self.bind("<Destroy>", self._destroyed)
+        self._render()
+
+    def append(self, messages):
+        self.log.extend(messages)
+        self._render()
+
+    def _resize(self, event):
+        rows = max(1, event.height // self.line_height)
+        if rows != self.rows:
+            self.rows = rows
+            self._render()
+
+    def _render(self):
+        first, total = self.log.first, self.log.count
+        last_top = max(total - self.rows, first)
+        if self.follow:
+            self.top = last_top
+        self.top = min(max(self.top, first), last_top)
+        lines = self.log.window(self.top, self.rows)
+        if self.top == first and first > 0:
+            where = f" (full log in {self.log.spill_path})" if self.log.spill_path else ""
+            lines.insert(0, f"... {first} earlier lines{where}")
+
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert(tk.END, "\n".join(lines))
+        if self.follow:
+            self.text.see(tk.END)
+        self.text.config(state=tk.DISABLED)
+
+        kept = total - first
+        if kept:
+            self.scrollbar.set((self.top - first) / kept, min(self.top - first + self.rows, kept) / kept)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _scroll_to(self, top):
+        self.top = top
+        self.follow = top >= self.log.count - self.rows
+        self._render()
+
+    def _scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self._scroll_to(self.log.first + int(float(amount) * len(self.log)))
+        elif action == "scroll":
+            step = self.rows if unit == "pages" else 1
+            self._scroll_to(self.top + int(amount) * step)
+
+    def _wheel(self, event):
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self._scroll_to(self.top + (-LOG_WHEEL_LINES if up else LOG_WHEEL_LINES))
+        return "break"
+
+    def close(self):
+        self.log.close()
+
+    # Function to keep the spill file once the window is closed
+    def keep(self):
+        self.keep_log = True
+
+    # A run that ended without an error leaves no log file behind
+    def _destroyed(self, event):
+        if event.widget is not self:
+            return
+        if self.keep_log:
+            self.log.close()
+        else:
+            self.log.discard()
+
+# Progress for a loading window. The worker thread only posts events to a
+# ProgressBus; the Tk main loop drains it every PROGRESS_POLL_MS and applies
+# each batch with one LogView update and one progress bar update. The end of
+# the job is shown with the usual success / error dialogs, also from the main
+# loop.
+class TkProgress(Progress):
+    def __init__(self, progress_var, log_view, loading_window):
+        self.bus = ProgressBus()
+        bus_progress = self.bus.progress()
+        super().__init__(bus_progress.on_log, bus_progress.on_percent, bus_progress.on_finished, bus_progress.on_error, bus_progress.on_status,
+                         on_items_failed=bus_progress.on_items_failed)
+        self.progress_var = progress_var
+        self.log_view = log_view
+        self.loading_window = loading_window
+        self.loading_window.after(PROGRESS_POLL_MS, self._poll)
+
+    def _poll(self):
+        if not self.loading_window.winfo_exists():
+            self.log_view.close()
+            return
+        batch = coalesce_events(self.bus.drain(PROGRESS_EVENTS_PER_TICK)).get(None)
+        if batch:
+            self._apply(batch)
+            if batch["finished"] is not None or batch["error"] is not None:
+                self.log_view.close()
+                return
+        self.loading_window.after(PROGRESS_POLL_MS, self._poll)
+
+    def _apply(self, batch):
+        if batch["log"]:
+            self.log_view.append(batch["log"])
+        if batch["percent"] is not None:
+            self.progress_var.set(batch["percent"])
+        if batch["status"] is not None:
+            # Throughput and ETA go in the title bar instead of the log
+            self.loading_window.title(batch["status"])
+        if batch["items_failed"]:
+            # The log file is the only record of why the items failed
+            self.log_view.keep()
+        if batch["error"] is not None:
+            self.log_view.append([batch["error"]])
+            self.log_view.keep()
+            self.loading_window.title("Failed")
+            messagebox.showerror("Error", batch["error"], parent=self.loading_window)
+        elif batch["finished"] is not None:
+            self.loading_window.title("Finished")
+            self.loading_window.update_idletasks()
+            show_success_message(batch["finished"])
+
+# Runs work() on a background thread and hands its result to on_done (or the
+# exception to on_error) on the Tk main loop, polling with after(). After
+# cancel() the result is dropped; the thread itself can't be interrupted.
+class BackgroundTask:
+    def __init__(self, widget, work, on_done, on_error, poll_ms=PROGRESS_POLL_MS):
+        self.widget = widget
+        self.on_done = on_done
+        self.on_error = on_error
+        self.poll_ms = poll_ms
+        self.cancelled = False
+        self.outcome = None
+        threading.Thread(target=self._run, args=(work,), daemon=True).start()
+        self.widget.after(self.poll_ms, self._poll)
+
+    def _run(self, work):
+        try:
+            self.outcome = (True, work())
+        except Exception as e:
+            self.outcome = (False, e)
+
+    def _poll(self):
+        if self.cancelled or not self.widget.winfo_exists():
+            return
+        if self.outcome is None:
+            self.widget.after(self.poll_ms, self._poll)
+            return
+        succeeded, value = self.outcome
+        if succeeded:
+            self.on_done(value)
+        else:
+            self.on_error(value)
+
+    def cancel(self):
+        self.cancelled = True
@@ -0,0 +1,205 @@
+# helpers/job_journal.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from helpers.progress import Progress
+
+# Durable record of every job and playlist item, so a run killed mid-playlist
+# (app crash, kill -9, power loss) resumes where it stopped: items already done
+# are skipped without touching the network, and interrupted downloads continue
+# from their .part sidecar in the same folder.
+JOURNAL_PATH = os.path.join(os.path.expanduser("~"), ".youtube-converter", "jobs.sqlite3")
+
+# States of jobs and items, in the order they go through them
+QUEUED = "queued"
+RESOLVING = "resolving"
+DOWNLOADING = "downloading"
+CONVERTING = "converting"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL,
+    folder TEXT,
+    output TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    video_id TEXT NOT NULL,
+    url TEXT,
+    title TEXT,
+    state TEXT NOT NULL,
+    source TEXT,
+    output TEXT,
+    error TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (job_id, video_id)
+);
+"""
+
+_JOB_FIELDS = ("state", "folder", "output", "error")
+_ITEM_FIELDS = ("url", "title", "source", "output", "error")
+
+# SQLite journal shared by all threads of a run. Every state change is its own
+# transaction, written with synchronous=FULL, so what the journal says is on
+# disk once the call returns.
+class JobJournal:
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=FULL")
+            self.connection.execute("PRAGMA foreign_keys=ON")
+            self.connection.executescript(_SCHEMA)
+
+    def _execute(self, sql, parameters=()):
+        with self.lock, self.connection:
+            return self.connection.execute(sql, parameters)
+
+    def _query(self, sql, parameters=()):
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(sql, parameters)]
+
+    # Function to record a new job; returns its JournalJob
+    def add_job(self, kind, url, output_dir, options=None):
+        now = time.time()
+        cursor = self._execute(
+            "INSERT INTO jobs (kind, url, output_dir, options, state, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (kind, url, output_dir, json.dumps(options or {}), QUEUED, now, now),
+        )
+        return JournalJob(self, cursor.lastrowid)
+
+    def job(self, job_id):
+        return JournalJob(self, job_id)
+
+    def get_job(self, job_id):
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        rows[0]["options"] = json.loads(rows[0]["options"])
+        return rows[0]
+
+    def update_job(self, job_id, **fields):
+        columns = [name for name in fields if name in _JOB_FIELDS]
+        assignments = "".join(f", {name} = ?" for name in columns)
+        self._execute(
+            f"UPDATE jobs SET updated = ?{assignments} WHERE id = ?",
+            (time.time(), *(fields[name] for name in columns), job_id),
+        )
+
+    # Jobs a run was still working on when it stopped, oldest first
+    def unfinished_jobs(self):
+        rows = self._query("SELECT * FROM jobs WHERE state NOT IN (?, ?) ORDER BY id", (DONE, FAILED))
+        for row in rows:
+            row["options"] = json.loads(row["options"])
+        return rows
+
+    def get_item(self, job_id, video_id):
+        rows = self._query("SELECT * FROM items WHERE job_id = ? AND video_id = ?", (job_id, video_id))
+        return rows[0] if rows else None
+
+    def items(self, job_id):
+        return self._query("SELECT * FROM items WHERE job_id = ? ORDER BY rowid", (job_id,))
+
+    # Function to create or update an item; fields not given keep their value
+    def set_item(self, job_id, video_id, state, **fields):
+        columns = [name for name in fields if name in _ITEM_FIELDS]
+        updates = "".join(f", {name} = excluded.{name}" for name in columns)
+        self._execute(
+            f"INSERT INTO items (job_id, video_id, state, updated{''.join(', ' + name for name in columns)}) "
+            f"VALUES (?, ?, ?, ?{', ?' * len(columns)}) "
+            f"ON CONFLICT (job_id, video_id) DO UPDATE SET state = excluded.state, updated = excluded.updated{updates}",
+            (job_id, video_id, state, time.time(), *(fields[name] for name in columns)),
+        )
+
+    # Function to delete finished jobs older than max_age seconds
+    def prune(self, max_age):
+        self._execute("DELETE FROM jobs WHERE state IN (?, ?) AND updated < ?", (DONE, FAILED, time.time() - max_age))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+# One job of the journal, handed to the download helpers
+class JournalJob:
+    def __init__(self, journal, job_id):
+        self.journal = journal
+        self.id = job_id
+
+    def info(self):
+        return self.journal.get_job(self.id)
+
+    def set_state(self, state, **fields):
+        self.journal.update_job(self.id, state=state, **fields)
+
+    # The folder a playlist job writes into, kept so a resumed run reuses it
+    @property
+    def folder(self):
+        info = self.info()
+        return info["folder"] if info else None
+
+    def set_folder(self, folder):
+        self.journal.update_job(self.id, folder=folder)
+
+    def item(self, video_id):
+        return self.journal.get_item(self.id, video_id)
+
+    def set_item(self, video_id, state, **fields):
+        self.journal.set_item(self.id, video_id, state, **fields)
+
+    # Function to tell whether an item was finished by an earlier run; returns
+    # its record then, None otherwise. An item stopped while converting counts
+    # as done when its output exists and its source is gone, since the source
+    # is only deleted after a successful conversion.
+    def finished_item(self, video_id):
+        item = self.item(video_id)
+        if item is None or not item["output"] or not os.path.isfile(item["output"]):
+            return None
+        if item["state"] == DONE:
+            return item
+        if item["state"] == CONVERTING and item["source"] and not os.path.exists(item["source"]):
+            self.set_item(video_id, DONE)
+            return item
+        return None
+
+# Progress that records the job's outcome in the journal: finished() marks it
+# done with its output, error() failed with the message. A playlist whose
+# items partly failed is queued again instead, so a resumed run retries them.
+class JournalProgress(Progress):
+    def __init__(self, progress, job):
+        super().__init__(progress.log, progress.set, self._finished, self._error, progress.status, progress.transferred, self._items_failed)
+        self.parent = progress
+        self.job = job
+        self.failed = 0
+
+    def _items_failed(self, count):
+        self.failed = count
+        self.parent.items_failed(count)
+
+    def _finished(self, path):
+        if self.failed:
+            self.job.set_state(QUEUED, output=path, error=f"{self.failed} items failed")
+        else:
+            self.job.set_state(DONE, output=path, error=None)
+        self.parent.finished(path)
+
+    def _error(self, message):
+        self.job.set_state(FAILED, error=message)
+        self.parent.error(message)
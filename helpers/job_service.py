@@ -0,0 +1,218 @@
+# helpers/job_service.py
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from helpers.progress import Progress
+
+# States of a service job
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELED = "canceled"
+
+# Log lines kept per job; older ones are dropped
+JOB_LOG_LINES = 200
+
+# Finished jobs kept for status queries; older ones are forgotten
+FINISHED_JOBS_KEPT = 1000
+
+# One submitted job, with everything the status endpoints report about it.
+# Updated from the worker thread running it, read from the request threads.
+class ServiceJob:
+    def __init__(self, client, job):
+        self.id = uuid.uuid4().hex[:16]
+        self.client = client
+        self.job = job
+        self.state = QUEUED
+        self.percent = 0
+        self.status = None
+        self.bytes = 0
+        self.output = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.log = deque(maxlen=JOB_LOG_LINES)
+        # Lines ever logged, so a poller can ask only for the lines it hasn't seen
+        self.log_count = 0
+        self.lock = threading.Lock()
+
+    # Function to get the Progress the job's download helpers report to
+    def progress(self):
+        return Progress(on_log=self._log, on_percent=self._percent, on_status=self._status, on_bytes=self._bytes)
+
+    def _log(self, message):
+        with self.lock:
+            self.log.append(message)
+            self.log_count += 1
+
+    def _percent(self, percent):
+        self.percent = percent
+
+    def _status(self, text):
+        self.status = text
+
+    def _bytes(self, count):
+        with self.lock:
+            self.bytes += count
+
+    @property
+    def is_finished(self):
+        return self.state in (DONE, FAILED, CANCELED)
+
+    def describe(self):
+        return {
+            "id": self.id,
+            "client": self.client,
+            "kind": self.job.get("kind", "audio"),
+            "url": self.job.get("url"),
+            "state": self.state,
+            "percent": self.percent,
+            "status": self.status,
+            "bytes": self.bytes,
+            "output": self.output,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+    # Function to get the log lines after the first since ones and the count to
+    # pass as since next time. Lines that already fell out of the log are skipped.
+    def log_since(self, since=0):
+        with self.lock:
+            first = self.log_count - len(self.log)
+            lines = list(self.log)[max(since - first, 0):]
+            return lines, self.log_count
+
+# Runs submitted jobs on a fixed pool of worker threads. At most concurrency
+# jobs run at once, and at most per_client of them for the same client (None
+# for no limit). Clients take turns: a free worker picks the oldest job of
+# the next client in round robin order, so one client queueing hundreds of
+# jobs doesn't hold up the others.
+#
+# runner(service_job) does the work and returns a dict with "status" ("ok"
+# when it produced something), "output" and "error", like cli.run_job.
+class JobService:
+    def __init__(self, runner, concurrency=2, per_client=None):
+        self.runner = runner
+        self.concurrency = max(1, concurrency)
+        self.per_client = per_client
+        self.queues = OrderedDict()
+        self.running = {}
+        self.jobs = {}
+        self.finished = deque()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.workers = []
+
+    def start(self):
+        for number in range(self.concurrency):
+            worker = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        return self
+
+    # Function to stop taking jobs; running ones are finished unless wait is False
+    def stop(self, wait=True):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if wait:
+            for worker in self.workers:
+                worker.join()
+
+    def submit(self, client, job):
+        service_job = ServiceJob(client, job)
+        with self.condition:
+            self.jobs[service_job.id] = service_job
+            self.queues.setdefault(client, deque()).append(service_job)
+            self.condition.notify()
+        return service_job
+
+    def get(self, job_id):
+        with self.condition:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self, client=None):
+        with self.condition:
+            return [job for job in self.jobs.values() if client is None or job.client == client]
+
+    # Function to cancel a job that hasn't started yet; returns whether it was
+    def cancel(self, job_id):
+        with self.condition:
+            service_job = self.jobs.get(job_id)
+            if service_job is None or service_job.state != QUEUED:
+                return False
+            queue = self.queues[service_job.client]
+            queue.remove(service_job)
+            if not queue:
+                del self.queues[service_job.client]
+            self._finish(service_job, CANCELED, error="Canceled")
+            return True
+
+    def counts(self):
+        with self.condition:
+            queued = sum(len(queue) for queue in self.queues.values())
+            running = sum(self.running.values())
+        return {"queued": queued, "running": running, "workers": self.concurrency}
+
+    # Function to take the next job to run, or None when no client may start one
+    def _next_job(self):
+        for client, queue in self.queues.items():
+            if not queue:
+                continue
+            if self.per_client is not None and self.running.get(client, 0) >= self.per_client:
+                continue
+            service_job = queue.popleft()
+            # This client had its turn; the others come first next time
+            self.queues.move_to_end(client)
+            if not queue:
+                del self.queues[client]
+            self.running[client] = self.running.get(client, 0) + 1
+            return service_job
+        return None
+
+    def _finish(self, service_job, state, output=None, error=None):
+        service_job.state = state
+        service_job.output = output
+        service_job.error = error
+        service_job.finished = time.time()
+        if state == DONE:
+            service_job.percent = 100
+        self.finished.append(service_job.id)
+        while len(self.finished) > FINISHED_JOBS_KEPT:
+            self.jobs.pop(self.finished.popleft(), None)
+
+    def _work(self):
+        while True:
+            with self.condition:
+                service_job = None
+                while not self.stopped:
+                    service_job = self._next_job()
+                    if service_job is not None:
+                        break
+                    self.condition.wait()
+                if service_job is None:
+                    return
+                service_job.state = RUNNING
+                service_job.started = time.time()
+
+            try:
+                result = self.runner(service_job)
+            except Exception as e:
+                result = {"status": "failed", "output": None, "error": str(e)}
+
+            with self.condition:
+                self.running[service_job.client] -= 1
+                if not self.running[service_job.client]:
+                    del self.running[service_job.client]
+                if result.get("status") == "ok":
+                    self._finish(service_job, DONE, output=result.get("output"))
+                else:
+                    self._finish(service_job, FAILED, output=result.get("output"), error=result.get("error"))
+                # A slot of this client is free again
+                self.condition.notify_all()
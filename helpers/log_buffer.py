@@ -0,0 +1,114 @@
+# helpers/log_buffer.py
+
+import os
+import time
+from collections import deque
+from itertools import islice
+
+# Log lines a progress window keeps in memory; older ones are dropped (and
+# only kept in the spill file, when there is one)
+LOG_MAX_LINES = 1000
+
+# Where the full logs of long runs, like playlists, are written
+LOG_DIR = os.path.join(os.path.expanduser("~"), ".youtube-converter", "logs")
+
+# Log files kept in LOG_DIR; the oldest are deleted to make room for a new one
+LOG_KEEP_FILES = 20
+
+def _modified(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+# Function to delete all but the newest keep log files in directory
+def prune_logs(directory=LOG_DIR, keep=LOG_KEEP_FILES):
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith(".log")]
+    except OSError:
+        return
+    paths = sorted((os.path.join(directory, name) for name in names), key=_modified, reverse=True)
+    for path in paths[max(keep, 0):]:
+        try:
+            os.remove(path)
+        except OSError:
+            # Still open by a running window on Windows
+            pass
+
+# Function to make a path for a new log file in directory, named by kind and
+# start time. Old logs are pruned first, so the folder holds at most keep.
+def new_log_path(kind, directory=LOG_DIR, keep=LOG_KEEP_FILES):
+    prune_logs(directory, keep - 1)
+    stem = os.path.join(directory, f"{kind}_{time.strftime('%Y%m%d_%H%M%S')}")
+    path = stem + ".log"
+    number = 1
+    while os.path.exists(path):
+        number += 1
+        path = f"{stem}_{number}.log"
+    return path
+
+# Ring buffer of the last max_lines log lines. Lines are numbered from 0 in
+# the order they were added, so a view can keep its place while old lines
+# fall out. With a spill_path every line is also appended to that file, so
+# the full log of a long run is still there. Used from one thread (the Tk
+# main loop).
+class LogBuffer:
+    def __init__(self, max_lines=LOG_MAX_LINES, spill_path=None):
+        self.lines = deque(maxlen=max(1, max_lines))
+        self.count = 0
+        self.spill_path = None
+        self.spill_file = None
+        if spill_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+                self.spill_file = open(spill_path, 'a', encoding='utf-8')
+                self.spill_path = spill_path
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self.lines)
+
+    # Number of the oldest line still kept
+    @property
+    def first(self):
+        return self.count - len(self.lines)
+
+    # Function to add messages; a message with line breaks is split into lines
+    def extend(self, messages):
+        lines = []
+        for message in messages:
+            lines.extend(str(message).splitlines() or [""])
+        self.lines.extend(lines)
+        self.count += len(lines)
+        if self.spill_file is not None and lines:
+            try:
+                self.spill_file.write("".join(f"{line}\n" for line in lines))
+                self.spill_file.flush()
+            except OSError:
+                # A full disk only costs the spill file
+                self.close()
+
+    def append(self, message):
+        self.extend([message])
+
+    # Function to get up to count kept lines starting at line number start
+    def window(self, start, count):
+        offset = max(start - self.first, 0)
+        return list(islice(self.lines, offset, offset + count))
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+
+    # Function to close and delete the spill file, for a run whose log isn't
+    # worth keeping
+    def discard(self):
+        self.close()
+        if self.spill_path is not None:
+            try:
+                os.remove(self.spill_path)
+            except OSError:
+                pass
+            self.spill_path = None
@@ -0,0 +1,167 @@
+# helpers/metrics.py
+
+import json
+import threading
+import time
+
+# Timing spans around the expensive steps (resolve, download, ffmpeg,
+# cleanup). Off by default: span() then hands out one shared no-op object, so
+# the instrumented code only pays for a flag check and a with-statement.
+METRICS_ENABLED = False
+
+_lock = threading.Lock()
+# Running totals per stage. The spans themselves are only kept in the JSONL
+# file, so a long session (or server) doesn't pile them up in memory.
+_totals = {}
+_sink = None
+
+class _Span:
+    def __init__(self, stage, fields):
+        self.stage = stage
+        self.fields = fields
+
+    # Function to attach values such as bytes=..., itag=... or retries=...
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.started = time.time()
+        self.clock = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        record = {"stage": self.stage, "started": round(self.started, 3), "seconds": round(time.perf_counter() - self.clock, 6)}
+        record.update(self.fields)
+        if exc_type is not None:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        _record(record)
+        return False
+
+class _NoSpan:
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def _new_totals():
+    return {"count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0, "retries": 0, "byte_seconds": 0.0}
+
+# Function to add one record to the per-stage totals in stages
+def _add_record(stages, record):
+    totals = stages.get(record["stage"])
+    if totals is None:
+        totals = stages[record["stage"]] = _new_totals()
+    totals["count"] += 1
+    totals["seconds"] += record["seconds"]
+    totals["max_seconds"] = max(totals["max_seconds"], record["seconds"])
+    totals["retries"] += record.get("retries") or 0
+    if "error" in record:
+        totals["errors"] += 1
+    if record.get("bytes"):
+        totals["bytes"] += record["bytes"]
+        totals["byte_seconds"] += record["seconds"]
+
+def _record(record):
+    with _lock:
+        _add_record(_totals, record)
+        if _sink is not None:
+            _sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+            _sink.flush()
+
+# Function to time one step: with span("download", itag=251) as s: ...; s.set(bytes=n)
+# Every span becomes a record with stage, started, seconds, the given fields
+# and error when the step raised.
+def span(stage, **fields):
+    if not METRICS_ENABLED:
+        return _NO_SPAN
+    return _Span(stage, fields)
+
+# Function to start recording spans, optionally appending each one as a JSON
+# line to jsonl_path as soon as it ends
+def enable_metrics(jsonl_path=None):
+    global METRICS_ENABLED, _sink
+    with _lock:
+        if _sink is not None:
+            _sink.close()
+        _sink = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+        METRICS_ENABLED = True
+
+def disable_metrics():
+    global METRICS_ENABLED, _sink
+    with _lock:
+        METRICS_ENABLED = False
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+
+def clear_metrics():
+    with _lock:
+        _totals.clear()
+
+# Function to total spans per stage:
+# {stage: {"count", "errors", "seconds", "max_seconds", "bytes", "retries", "bytes_per_sec"}}
+# bytes_per_sec only counts spans that reported bytes. By default these are
+# the spans recorded since metrics were enabled; records (e.g. read back from
+# the JSONL file) are totaled instead when given.
+def summarize(records=None):
+    if records is None:
+        with _lock:
+            stages = {name: dict(totals) for name, totals in _totals.items()}
+    else:
+        stages = {}
+        for record in records:
+            _add_record(stages, record)
+    for totals in stages.values():
+        byte_seconds = totals.pop("byte_seconds")
+        totals["bytes_per_sec"] = totals["bytes"] / byte_seconds if totals["bytes"] and byte_seconds else None
+    return stages
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Function to render the per-stage totals in the Prometheus text format
+def prometheus_text(records=None):
+    summary = summarize(records)
+    metrics = (
+        ("ytconverter_stage_runs_total", "counter", "Spans recorded per stage", "count"),
+        ("ytconverter_stage_errors_total", "counter", "Spans that ended with an error", "errors"),
+        ("ytconverter_stage_seconds_total", "counter", "Time spent per stage", "seconds"),
+        ("ytconverter_stage_seconds_max", "gauge", "Longest single span per stage", "max_seconds"),
+        ("ytconverter_stage_bytes_total", "counter", "Bytes moved per stage", "bytes"),
+        ("ytconverter_stage_retries_total", "counter", "Retried requests per stage", "retries"),
+    )
+    lines = []
+    for name, kind, description, field in metrics:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for stage, totals in sorted(summary.items()):
+            lines.append(f'{name}{{stage="{_label(stage)}"}} {totals[field]:g}')
+    return "\n".join(lines) + "\n"
+
+# Function to write the Prometheus snapshot to a file, replacing it
+def write_prometheus(path, records=None):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(prometheus_text(records))
+
+# Human readable per-stage summary, one line per stage, slowest first
+def describe_summary(records=None):
+    summary = summarize(records)
+    lines = []
+    for stage, totals in sorted(summary.items(), key=lambda item: -item[1]["seconds"]):
+        line = f"{stage}: {totals['count']} run(s), {totals['seconds']:.2f}s total, {totals['max_seconds']:.2f}s max"
+        if totals["bytes"]:
+            line += f", {totals['bytes'] / 1048576:.1f} MB"
+        if totals["bytes_per_sec"]:
+            line += f" at {totals['bytes_per_sec'] / 1048576:.2f} MB/s"
+        if totals["retries"]:
+            line += f", {totals['retries']} retries"
+        if totals["errors"]:
+            line += f", {totals['errors']} failed"
+        lines.append(line)
+    return lines
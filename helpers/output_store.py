@@ -0,0 +1,289 @@
+# helpers/output_store.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from helpers.playlist_sync import _file_sha256
+
+# Finished outputs (MP3s, merged MP4s) kept by what they were made from:
+# (video ID, stream itag(s), output profile such as "mp3-192k" or "mp4-1080p").
+# The same video in another playlist, or in the next timestamped Playlist_*
+# folder, is then reflinked (or hardlinked) from the store instead of being
+# downloaded and converted again. Nothing is ever copied: where neither link
+# works the store is skipped. A hardlinked output shares its data with the
+# stored file, so editing it (tagging, an ffmpeg -y rewrite) edits the stored
+# file too; every entry keeps its content hash and a changed file is dropped
+# instead of handed out. Looked up without an itag, any stream's output of the
+# video in the profile will do, so a caller that knows the video ID and name
+# can reuse it before resolving the video at all.
+STORE_DIR = os.path.join(os.path.expanduser("~"), ".youtube-converter", "store")
+
+# Size the store is trimmed to, least recently used entries first
+STORE_MAX_BYTES = 5 * 1024 * 1024 * 1024
+
+# Environment variable that turns the store on in the GUI: "1" for STORE_DIR,
+# or the store's folder
+STORE_ENV = "YOUTUBE_CONVERTER_STORE"
+
+# Linux FICLONE ioctl: a copy-on-write clone on btrfs, XFS and the like
+_FICLONE = 0x40049409
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    itag TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    file TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    sha256 TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE INDEX IF NOT EXISTS entries_video ON entries (video_id, profile);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def _reflink(source, target):
+    try:
+        import fcntl
+    except ImportError:  # Windows
+        raise OSError("Reflinks are not supported here")
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+
+# Function to make target the same content as source without copying: a
+# reflink (a copy-on-write clone, so either file can change on its own) where
+# the file system has them, else a hardlink. Returns which one it was; raises
+# OSError when neither works, e.g. across file systems.
+def link_file(source, target):
+    try:
+        _reflink(source, target)
+        return "reflink"
+    except OSError:
+        if os.path.exists(target):
+            os.remove(target)
+    os.link(source, target)
+    return "hardlink"
+
+class OutputStore:
+    def __init__(self, root=STORE_DIR, max_bytes=STORE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(_SCHEMA)
+            # Stores made before entries had a hash; those entries are dropped on lookup
+            columns = {row["name"] for row in self.connection.execute("PRAGMA table_info(entries)")}
+            if "sha256" not in columns:
+                self.connection.execute("ALTER TABLE entries ADD COLUMN sha256 TEXT")
+
+    @staticmethod
+    def key(video_id, itag, profile):
+        return hashlib.sha256(f"{video_id}|{itag}|{profile}".encode('utf-8')).hexdigest()
+
+    def _object_path(self, key, extension):
+        return os.path.join(self.root, "objects", key[:2], key + extension)
+
+    def _count(self, name, amount=1):
+        self.connection.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    @staticmethod
+    def _intact(row):
+        try:
+            return os.path.getsize(row["file"]) == row["size"] and row["sha256"] == _file_sha256(row["file"])
+        except OSError:
+            return False
+
+    # Function to find the stored entry; returns (key, path) or None. With
+    # itag None the most recently used entry of the video in the profile is
+    # taken. An entry whose file went missing or no longer has the content it
+    # was stored with is dropped.
+    def _find(self, video_id, itag, profile):
+        with self.lock:
+            if itag is None:
+                row = self.connection.execute(
+                    "SELECT key, file, size, sha256 FROM entries WHERE video_id = ? AND profile = ? ORDER BY last_used DESC LIMIT 1",
+                    (video_id, profile),
+                ).fetchone()
+            else:
+                row = self.connection.execute("SELECT key, file, size, sha256 FROM entries WHERE key = ?",
+                                              (self.key(video_id, itag, profile),)).fetchone()
+        if row is None:
+            return None
+        # Hashed outside the lock, it reads the whole file
+        if not self._intact(row):
+            with self.lock, self.connection:
+                self.connection.execute("DELETE FROM entries WHERE key = ? AND file = ?", (row["key"], row["file"]))
+            # Outputs hardlinked to it keep their data
+            if os.path.exists(row["file"]):
+                os.remove(row["file"])
+            return None
+        return row["key"], row["file"]
+
+    # Function to find the stored file (any stream's with itag None); returns
+    # its path or None
+    def lookup(self, video_id, itag, profile):
+        found = self._find(video_id, itag, profile)
+        return found[1] if found is not None else None
+
+    def _record_use(self, key, hit):
+        with self.lock, self.connection:
+            if hit:
+                self.connection.execute("UPDATE entries SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self._count("hits" if hit else "misses")
+
+    # Function to put the stored file for the key at target; returns how it
+    # got there ("reflink" or "hardlink"), or None when it isn't stored. Only
+    # an output that actually got to target counts as a hit.
+    def fetch(self, video_id, itag, profile, target):
+        method = None
+        key = None
+        try:
+            found = self._find(video_id, itag, profile)
+            if found is None:
+                return None
+            key, stored = found
+            if os.path.exists(target) and os.path.samefile(stored, target):
+                method = "hardlink"
+                return method
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+            temp_file = target + ".store.tmp"
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            method = link_file(stored, temp_file)
+            os.replace(temp_file, target)
+            return method
+        finally:
+            self._record_use(key, method is not None)
+
+    # Function to keep file_path as the output for the key, then trim the
+    # store to its size limit. Returns the stored path.
+    def add(self, video_id, itag, profile, file_path):
+        key = self.key(video_id, itag, profile)
+        stored = self._object_path(key, os.path.splitext(file_path)[1])
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        temp_file = stored + ".tmp"
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        link_file(file_path, temp_file)
+        os.replace(temp_file, stored)
+
+        now = time.time()
+        size, sha256 = os.path.getsize(stored), _file_sha256(stored)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO entries (key, video_id, itag, profile, file, size, created, last_used, sha256) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET file = excluded.file, size = excluded.size, last_used = excluded.last_used, sha256 = excluded.sha256",
+                (key, video_id, str(itag), profile, stored, size, now, now, sha256),
+            )
+        self.evict()
+        return stored
+
+    # Function to delete least recently used entries until the store holds at
+    # most max_bytes (default: its limit). Returns the number deleted.
+    def evict(self, max_bytes=None):
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        removed = 0
+        with self.lock, self.connection:
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= max_bytes:
+                return 0
+            for row in self.connection.execute("SELECT key, file, size FROM entries ORDER BY last_used").fetchall():
+                if total <= max_bytes:
+                    break
+                # Hardlinked outputs elsewhere keep their data
+                if os.path.exists(row["file"]):
+                    os.remove(row["file"])
+                self.connection.execute("DELETE FROM entries WHERE key = ?", (row["key"],))
+                total -= row["size"]
+                removed += 1
+            self._count("evictions", removed)
+        return removed
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            counters = {row["name"]: row["value"] for row in self.connection.execute("SELECT name, value FROM counters")}
+            profiles = {
+                row["profile"]: {"entries": row["entries"], "bytes": row["bytes"]}
+                for row in self.connection.execute("SELECT profile, COUNT(*) AS entries, SUM(size) AS bytes FROM entries GROUP BY profile")
+            }
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "root": self.root,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+            "evictions": counters.get("evictions", 0),
+            "profiles": profiles,
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+# The store the download helpers use; None while it is off
+_store = None
+
+def enable_store(root=STORE_DIR, max_bytes=STORE_MAX_BYTES):
+    global _store
+    _store = OutputStore(root, max_bytes)
+    return _store
+
+def disable_store():
+    global _store
+    if _store is not None:
+        _store.close()
+    _store = None
+
+def get_store():
+    return _store
+
+# Function used by the download helpers: when the store has the output for
+# (video_id, itag, profile), put it at target and return True, so nothing is
+# downloaded or converted. With itag None any stream's output in the profile
+# is taken. Store problems only cost the reuse.
+def reuse_output(video_id, itag, profile, target, progress=None):
+    store = _store
+    if store is None:
+        return False
+    try:
+        method = store.fetch(video_id, itag, profile, target)
+    except Exception as e:
+        if progress is not None:
+            progress.log(f"Output store lookup failed: {e}")
+        return False
+    if method is None:
+        return False
+    if progress is not None:
+        progress.log(f"Reused from the output store ({method}): {os.path.basename(target)}")
+    return True
+
+# Function used by the download helpers to keep a finished output in the store
+def remember_output(video_id, itag, profile, file_path, progress=None):
+    store = _store
+    if store is None:
+        return
+    try:
+        store.add(video_id, itag, profile, file_path)
+    except Exception as e:
+        if progress is not None:
+            progress.log(f"Could not add to the output store: {e}")
@@ -0,0 +1,113 @@
+# helpers/pipeline.py
+
+import os
+import queue
+import threading
+from collections import namedtuple
+from helpers.metrics import span
+
+# Workers for CPU bound stages (ffmpeg transcode and mux)
+CPU_WORKERS = os.cpu_count() or 1
+
+# Returned by a stage to end an item early (e.g. already downloaded); the
+# value becomes the item's result and the remaining stages are skipped
+Finished = namedtuple("Finished", ["value"])
+
+_STOP = object()
+
+# One step of a Pipeline: func(payload) runs on `workers` threads and returns
+# the payload for the next stage. Its input queue holds at most queue_size
+# items, so a fast stage blocks instead of piling work up in front of a slow one.
+class Stage:
+    def __init__(self, name, func, workers=1, queue_size=None):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=queue_size or self.workers * 2)
+        self.queued = 0
+        self.active = 0
+        self.processed = 0
+
+# Runs items through a chain of stages with bounded queues in between, so
+# e.g. network workers keep downloading while ffmpeg workers transcode what
+# was fetched before. on_done(index, result, error) is called from a worker
+# thread once per item, when it leaves the last stage, finishes early or fails.
+class Pipeline:
+    def __init__(self, stages, on_done):
+        self.stages = stages
+        self.on_done = on_done
+        self.lock = threading.Lock()
+
+    def _worker(self, position):
+        stage = self.stages[position]
+        while True:
+            entry = stage.queue.get()
+            if entry is _STOP:
+                return
+            index, payload = entry
+            with self.lock:
+                stage.queued -= 1
+                stage.active += 1
+            try:
+                with span("pipeline_" + stage.name):
+                    result = stage.func(payload)
+                error = None
+            except Exception as e:
+                result, error = None, e
+            with self.lock:
+                stage.active -= 1
+                stage.processed += 1
+
+            if error is not None:
+                self.on_done(index, None, error)
+            elif isinstance(result, Finished):
+                self.on_done(index, result.value, None)
+            elif position + 1 < len(self.stages):
+                # Blocks while the next stage is full (backpressure)
+                self._put(self.stages[position + 1], index, result)
+            else:
+                self.on_done(index, result, None)
+
+    def _put(self, stage, index, payload):
+        # Counted before put() so a worker never sees the item uncounted
+        with self.lock:
+            stage.queued += 1
+        stage.queue.put((index, payload))
+
+    # Function to push every item through the pipeline and wait until all are
+    # done. items may be a lazy iterable; it is only read as fast as the first
+    # stage takes items.
+    def run(self, items):
+        threads = []
+        for position, stage in enumerate(self.stages):
+            stage_threads = [threading.Thread(target=self._worker, args=(position,), daemon=True) for _ in range(stage.workers)]
+            for thread in stage_threads:
+                thread.start()
+            threads.append(stage_threads)
+
+        count = 0
+        try:
+            for index, item in enumerate(items):
+                self._put(self.stages[0], index, item)
+                count += 1
+        finally:
+            # Also when reading items fails: finish what was already queued.
+            # Shut the stages down in order, so each one drains before the next stops.
+            for stage, stage_threads in zip(self.stages, threads):
+                for _ in stage_threads:
+                    stage.queue.put(_STOP)
+                for thread in stage_threads:
+                    thread.join()
+        return count
+
+    # Returns {stage name: {"queued", "active", "processed"}}
+    def stats(self):
+        with self.lock:
+            return {
+                stage.name: {"queued": stage.queued, "active": stage.active, "processed": stage.processed}
+                for stage in self.stages
+            }
+
+    # Short "name queued/active" summary of every stage for log lines
+    def describe_depths(self):
+        return ", ".join(f"{name} {s['queued']}/{s['active']}" for name, s in self.stats().items())
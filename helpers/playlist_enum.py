@@ -0,0 +1,97 @@
+# helpers/playlist_enum.py
+
+from collections import namedtuple
+from itertools import chain
+from pytubefix import extract
+from pytubefix.innertube import InnerTube
+from helpers.url_parser import video_id_from_url, canonical_video_url
+
+# One playlist entry as listed on the playlist page, without resolving the video
+PlaylistEntry = namedtuple("PlaylistEntry", ["video_id", "title", "url"])
+
+def _text(node):
+    if not isinstance(node, dict):
+        return None
+    if "simpleText" in node:
+        return node["simpleText"]
+    if "runs" in node:
+        return "".join(run.get("text", "") for run in node["runs"])
+    return node.get("content")
+
+# Walks a playlist page (or continuation response) and maps every video ID to
+# the title shown in the listing. Searching the whole tree keeps this working
+# when YouTube moves the renderers around.
+def _collect_titles(node, titles):
+    if isinstance(node, dict):
+        renderer = node.get("playlistVideoRenderer") or node.get("reelItemRenderer")
+        if isinstance(renderer, dict) and "videoId" in renderer:
+            titles.setdefault(renderer["videoId"], _text(renderer.get("title") or renderer.get("headline")))
+        shorts = node.get("shortsLockupViewModel")
+        if isinstance(shorts, dict):
+            try:
+                video_id = shorts["onTap"]["innertubeCommand"]["reelWatchEndpoint"]["videoId"]
+                titles.setdefault(video_id, _text(shorts.get("overlayMetadata", {}).get("primaryText")))
+            except (KeyError, TypeError):
+                pass
+        for value in node.values():
+            _collect_titles(value, titles)
+    elif isinstance(node, list):
+        for value in node:
+            _collect_titles(value, titles)
+    return titles
+
+# Yields (page, watch paths) for every page of the playlist, fetching the next
+# page only when the previous one has been consumed
+def _iter_pages(playlist):
+    page = extract.initial_data(playlist.html)
+    watch_paths, continuation = playlist._extract_videos(page)
+    yield page, watch_paths
+    while continuation:
+        page = InnerTube('WEB').browse(continuation=continuation, visitor_data=getattr(playlist, "_visitor_data", None))
+        watch_paths, continuation = playlist._extract_videos(page)
+        yield page, watch_paths
+
+# Yields the entries of pytubefix's own video_urls, without titles
+def _fallback_entries(playlist):
+    seen = set()
+    for url in playlist.video_urls:
+        video_id = video_id_from_url(url)
+        if video_id is not None and video_id not in seen:
+            seen.add(video_id)
+            yield PlaylistEntry(video_id, None, canonical_video_url(video_id))
+
+# Function to list a playlist lazily, page by page (100 entries each), as
+# PlaylistEntry records. Nothing is resolved per entry, so the first download
+# can start as soon as the first page is in. Falls back to pytubefix's own
+# video_urls (without titles) if the page layout isn't understood: reading
+# the first page fails or finds no videos in it.
+def iter_playlist_entries(playlist):
+    seen = set()
+    pages = _iter_pages(playlist)
+    try:
+        first_page = next(pages)
+    except StopIteration:
+        return
+    except Exception:
+        yield from _fallback_entries(playlist)
+        return
+    if not first_page[1]:
+        yield from _fallback_entries(playlist)
+        return
+
+    for page, watch_paths in chain([first_page], pages):
+        titles = _collect_titles(page, {})
+        for watch_path in watch_paths:
+            video_id = video_id_from_url("https://www.youtube.com" + watch_path)
+            if video_id is None or video_id in seen:
+                continue
+            seen.add(video_id)
+            yield PlaylistEntry(video_id, titles.get(video_id), canonical_video_url(video_id))
+
+# Function to get the entry count shown on the playlist page, or None.
+# Only an estimate for progress: hidden and unavailable videos are counted too.
+def playlist_length(playlist):
+    try:
+        return playlist.length
+    except Exception:
+        return None
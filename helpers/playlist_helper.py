@@ -1,143 +1,516 @@
 # helpers/playlist_helper.py
 
+import asyncio
 import os
-import subprocess
-import tkinter as tk
+import threading
+from concurrent.futures import CancelledError
 from datetime import datetime
-from pytubefix import Playlist, YouTube
-from helpers.utils import sanitize_filename, get_ffmpeg_path, get_token_file_path, show_success_message
-from helpers.audio_helper import download_audio_as_mp3
-from helpers.video_helper import get_highest_resolution, download_video, download_audio
+from helpers.utils import sanitize_filename, temp_filename, clip_suffix
+from helpers.resolver import resolve_video, resolve_playlist
+from helpers.playlist_sync import PlaylistManifest
+from helpers.pipeline import Pipeline, Stage, Finished, CPU_WORKERS
+from helpers.async_engine import AsyncPipeline
+from helpers.metrics import span
+from helpers.progress import PlaylistProgress
+from helpers.job_journal import RESOLVING, DOWNLOADING, CONVERTING, DONE, FAILED
+from helpers.playlist_enum import iter_playlist_entries, playlist_length
+from helpers.ranged_downloader import download_stream
+from helpers.ffmpeg_helper import merge_files, plan_codec_args, stream_codecs
+from helpers.segmented_encoder import should_segment
+from helpers.stream_policy import DEFAULT_POLICY, select_video_stream, select_audio_stream, explain_selection
+from helpers.output_store import reuse_output, remember_output
+from helpers.audio_helper import STREAM_MP3_TRANSCODE, MP3_BITRATE, MP3_PROFILE, MP3_ENCODE_ARGS, download_audio_as_mp3, convert_file_to_mp3
+from helpers.video_helper import (
+    STREAM_MUX,
+    MUX_AUDIO_BITRATE,
+    mp4_store_key,
+    download_video_and_audio,
+    download_and_merge_streams,
+    is_downloaded_file,
+)
 
-# ----------------- Playlist Download Functions -----------------
-def download_playlist_audio(playlist_url, output_dir, progress_var, progress_text_widget):
-    playlist = Playlist(
-        playlist_url,
-        client='WEB_EMBEDDED_PLAYER',
-        use_po_token=True,
-        token_file= get_token_file_path()
-    )
+# Number of playlist items downloaded at the same time
+PLAYLIST_WORKERS = 4
+
+# Number of ffmpeg conversions/merges run at the same time
+TRANSCODE_WORKERS = CPU_WORKERS
+
+# With streaming off, split each item into resolve -> fetch -> transcode
+# stages, so downloads keep going while ffmpeg converts earlier items. When
+# off, each item is downloaded and converted in one go. Streamed items are
+# always downloaded and converted in one go, piped through ffmpeg, so only
+# the final file is written; only resolving is a stage of its own then.
+# Every streamed item keeps an ffmpeg process running for its whole
+# download, so at most transcode_workers of them run at once.
+PLAYLIST_STAGED = True
 
-    # Generate a timestamp in the format yyyyMMdd_HHmmss_SSS
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+# Function to get the stages of a playlist run: the staged fetch/transcode
+# split, or resolving followed by one download stage
+def _playlist_stages(resolve_item, fetch_item, transcode_item, download_item, max_workers, transcode_workers, staged, streaming, clip,
+                     transcode_name="transcode"):
+    if staged and clip is None and not streaming:
+        return [
+            Stage("resolve", resolve_item, max_workers),
+            Stage("fetch", fetch_item, max_workers),
+            Stage(transcode_name, transcode_item, transcode_workers),
+        ]
+    if streaming or clip is not None:
+        # Each of these downloads runs an ffmpeg process of its own
+        return [Stage("resolve", resolve_item, max_workers), Stage("download", download_item, max(1, min(max_workers, transcode_workers)))]
+    return [Stage("resolve", resolve_item, max_workers), Stage("download", download_item, max_workers)]
+
+def _create_playlist_dir(output_dir, kind, playlist=None, sync=False):
+    if sync:
+        # Synced playlists always live in the same folder so re-runs can reuse it
+        playlist_dir = os.path.join(output_dir, f"Playlist_{kind}_{playlist.playlist_id}")
+    else:
+        # Generate a timestamp in the format yyyyMMdd_HHmmss_SSS
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        playlist_dir = os.path.join(output_dir, f"Playlist_{kind}_{timestamp}")
 
     # Create the playlist directory
-    playlist_dir = os.path.join(output_dir, f"Playlist_audio_{timestamp}")
     os.makedirs(playlist_dir, exist_ok=True)
+    return playlist_dir
 
-    playlist_file = os.path.join(playlist_dir, "playlist.txt")
+# With a journal job, a resumed run goes on in the folder of the interrupted one
+def _job_playlist_dir(job, output_dir, kind, playlist, sync):
+    if job is not None:
+        folder = job.folder
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+            return folder
+    playlist_dir = _create_playlist_dir(output_dir, kind, playlist, sync)
+    if job is not None:
+        job.set_folder(playlist_dir)
+    return playlist_dir
+
+# Function to skip an entry a previous run of the journal job finished;
+# otherwise the entry is recorded as being resolved
+def _resume_entry(job, entry, progress):
+    if job is None:
+        return None
+    item = job.finished_item(entry.video_id)
+    if item is not None:
+        progress.log(f"Already done: {item['title'] or entry.url}")
+        return Finished((item["title"], True))
+    job.set_item(entry.video_id, RESOLVING, url=entry.url, title=entry.title)
+    return None
+
+# Function to run every playlist entry through the given pipeline stages; the
+# first stage gets the entry's PlaylistEntry and the last returns
+# (title, succeeded). Entries are listed page by page while the first ones
+# already download. A failing item is reported and skipped without stopping
+# the others; playlist.txt is written in playlist order once all items are done.
+# The items only log to progress, the bar follows the number of finished items
+# and the status line the playlist's throughput and ETA.
+# With a sync manifest and prune=True, entries that left the playlist are
+# removed from the folder afterwards. With a journal job, failed items are
+# recorded as such. With an AsyncEngine the items run as its coroutines.
+def _run_playlist_items(playlist, playlist_dir, stages, progress, manifest=None, prune=False, job=None, engine=None):
+    entries = []
+    titles = {}
+    # Until the listing is complete the bar is based on the count shown on the playlist page
+    expected = playlist_length(playlist) or 0
+    counts = {"completed": 0, "failed": 0, "listed": False}
+    lock = threading.Lock()
+
+    def list_entries():
+        for entry in iter_playlist_entries(playlist):
+            entries.append(entry)
+            yield entry
+        counts["listed"] = True
+
+    def on_done(index, result, error):
+        entry = entries[index]
+        if error is not None:
+            title, succeeded = None, False
+            progress.log(f"Failed: {entry.url} ({error})")
+        else:
+            title, succeeded = result
+        if job is not None and not succeeded:
+            job.set_item(entry.video_id, FAILED, error=str(error) if error is not None else None)
+        with lock:
+            titles[index] = title
+            counts["completed"] += 1
+            if not succeeded:
+                counts["failed"] += 1
+            completed = counts["completed"]
+            total = len(entries) if counts["listed"] else max(expected, len(entries))
+        status = "Done" if succeeded else "Failed"
+        progress.log(f"[{completed}/{total}] {status}: {title or entry.title or entry.url} (queued/active: {pipeline.describe_depths()})")
+        progress.set(int(completed * 100 / total))
+        progress.items_done(completed, total)
+
+    pipeline = Pipeline(stages, on_done) if engine is None else AsyncPipeline(engine, stages, on_done)
+    try:
+        pipeline.run(list_entries())
+    except CancelledError:
+        # The engine was stopped (the app is closing). Passed on, so the job
+        # isn't reported finished and stays unfinished in the journal.
+        progress.log("Playlist canceled.")
+        raise
+    except Exception as e:
+        # Items listed before the failure have been processed; keep their results
+        progress.log(f"Listing the playlist failed: {e}")
+        counts["failed"] += 1
 
+    playlist_file = os.path.join(playlist_dir, "playlist.txt")
     with open(playlist_file, 'w', encoding='utf-8') as file:
-        for video in playlist.videos:
-            yt_link = video.watch_url
-            title = video.title
-            file.write(f"{yt_link} - {title}\n")
-            progress_text_widget.config(state=tk.NORMAL)
-            progress_text_widget.insert(tk.END, f"Downloading audio: {title}\n")
-            progress_text_widget.config(state=tk.DISABLED)
-
-            # Download audio and convert to MP3
-            mp3_file = download_audio_as_mp3(yt_link, playlist_dir, progress_var, progress_text_widget)
-            if isinstance(mp3_file, Exception):
-                progress_text_widget.config(state=tk.NORMAL)
-                progress_text_widget.insert(tk.END, "Failed to download and convert audio.\n")
-                progress_text_widget.config(state=tk.DISABLED)
-                continue
+        for index, entry in enumerate(entries):
+            file.write(f"{entry.url} - {titles.get(index) or entry.title or 'unavailable'}\n")
 
-    return playlist_dir
+    failed = counts["failed"]
+    if failed:
+        progress.log(f"{failed} of {len(entries)} items failed.")
+        progress.items_failed(failed)
+
+    if manifest is not None and prune and not failed:
+        for title in manifest.prune({entry.video_id for entry in entries}):
+            progress.log(f"Removed: {title}")
+
+# Output names handed out in one playlist run. Titles can repeat, or differ
+# only in characters sanitize_filename replaces; a name another video of the
+# run already has gets the video ID appended, so no two items write one file.
+class OutputNames:
+    def __init__(self):
+        self.owners = {}
+        self.lock = threading.Lock()
+
+    # Function to get the name video_id's output is saved under
+    def claim(self, title, video_id):
+        name = sanitize_filename(title)
+        with self.lock:
+            # Case-insensitive file systems treat "A" and "a" as one file
+            owner = self.owners.setdefault(name.lower(), video_id)
+        return name if owner == video_id else f"{name}_{video_id}"
+
+def _finish_item(manifest, item, output_file, job=None):
+    if manifest is not None:
+        manifest.record(item["video_id"], item["stream"], output_file, item["title"], item["url"])
+    if job is not None:
+        job.set_item(item["video_id"], DONE, output=output_file, title=item["title"])
+    return item["title"], True
+
+def _set_item_state(job, item, state, **fields):
+    if job is not None:
+        job.set_item(item["video_id"], state, **fields)
+
+# ----------------- Playlist Download Functions -----------------
+# With clip = (start, end) seconds only that part of every item is fetched and
+# converted, straight from the stream URLs (no staged fetch/transcode then).
+# With streaming (the default) every item is piped through ffmpeg as it
+# downloads, like the single video and audio downloads.
+# With a journal job (helpers.job_journal) every item's state is recorded and
+# a resumed run skips the items that are done. Items are then downloaded to
+# files unless streaming is asked for, so an interrupted one resumes its .part. With an AsyncEngine
+# (helpers.async_engine) the items are its coroutines, and streamed items as
+# well as the staged fetch and transcode use its non-blocking downloads and
+# ffmpeg runs. Clips and unstaged file downloads still run on its threads.
+def download_playlist_audio(playlist_url, output_dir, progress, max_workers=PLAYLIST_WORKERS, sync=False, prune=False,
+                            staged=PLAYLIST_STAGED, transcode_workers=TRANSCODE_WORKERS, policy=DEFAULT_POLICY, clip=None, job=None,
+                            engine=None, streaming=None):
+    if streaming is None:
+        streaming = STREAM_MP3_TRANSCODE and job is None
+    if sync and clip is not None:
+        raise ValueError("A synced playlist can't be limited to a clip")
+    progress = PlaylistProgress(progress)
+    playlist = resolve_playlist(playlist_url)
+    playlist_dir = _job_playlist_dir(job, output_dir, "audio", playlist, sync)
+    manifest = PlaylistManifest(playlist_dir, playlist.playlist_id, "audio") if sync else None
+    names = OutputNames()
+
+    def resolve_item(entry):
+        resumed = _resume_entry(job, entry, progress)
+        if resumed is not None:
+            return resumed
+
+        # An MP3 of the video in the store is reused without resolving it; the
+        # listed title names it. A synced playlist needs the stream for its manifest.
+        store_checked = clip is None and manifest is None and bool(entry.title)
+        if store_checked:
+            output_file = os.path.join(playlist_dir, f"{names.claim(entry.title, entry.video_id)}.mp3")
+            if reuse_output(entry.video_id, None, MP3_PROFILE, output_file, progress):
+                return Finished(_finish_item(None, {"video_id": entry.video_id, "title": entry.title}, output_file, job))
+
+        # The only full resolution of the entry; it goes through the shared
+        # cache so the download helpers reuse it
+        yt = resolve_video(entry.url)
+        selection = select_audio_stream(yt.streams, policy, MP3_BITRATE)
+        item = {
+            "url": entry.url,
+            "title": yt.title,
+            "video_id": yt.video_id,
+            "stream": selection.stream,
+            "length": yt.length,
+        }
+        progress.log(f"{item['title']}: {explain_selection(selection)}")
+        if manifest is not None and manifest.current_output(item["video_id"], item["stream"]):
+            progress.log(f"Up to date: {item['title']}")
+            return Finished((item["title"], True))
+        item["output_file"] = os.path.join(playlist_dir, f"{names.claim(item['title'], item['video_id'])}{clip_suffix(clip)}.mp3")
+        # Any stored MP3 of the video was found above already
+        if clip is None and not store_checked and reuse_output(item["video_id"], item["stream"].itag, MP3_PROFILE, item["output_file"], progress):
+            return Finished(_finish_item(manifest, item, item["output_file"], job))
+        return item
+
+    def fetch_item(item):
+        progress.log(f"Downloading audio: {item['title']}")
+        # Same name in the same folder as an interrupted run, so its .part is resumed
+        _set_item_state(job, item, DOWNLOADING, title=item["title"])
+        item["audio_file"] = download_stream(item["stream"], playlist_dir, temp_filename(item["title"], item["video_id"], "audio"), on_bytes=progress.transferred)
+        return item
 
-def download_playlist_video(playlist_url, output_dir, progress_var, progress_text_widget):
-    playlist = Playlist(
-        playlist_url,
-        client='WEB_EMBEDDED_PLAYER',
-        use_po_token=True,
-        token_file= get_token_file_path()
+    async def fetch_item_async(item):
+        progress.log(f"Downloading audio: {item['title']}")
+        await engine.run_io(_set_item_state, job, item, DOWNLOADING, title=item["title"])
+        item["audio_file"] = await engine.download_stream(item["stream"], playlist_dir, temp_filename(item["title"], item["video_id"], "audio"),
+                                                          on_bytes=progress.transferred)
+        return item
+
+    def transcode_item(item):
+        mp3_file = item["output_file"]
+        _set_item_state(job, item, CONVERTING, source=item["audio_file"], output=mp3_file)
+        decisions = convert_file_to_mp3(item["audio_file"], mp3_file)
+        progress.log(f"Converted to MP3 ({decisions}): {item['title']}")
+        remember_output(item["video_id"], item["stream"].itag, MP3_PROFILE, mp3_file, progress)
+        return _finish_item(manifest, item, mp3_file, job)
+
+    async def transcode_item_async(item):
+        mp3_file = item["output_file"]
+        await engine.run_io(_set_item_state, job, item, CONVERTING, source=item["audio_file"], output=mp3_file)
+        decisions = await engine.convert_file_to_mp3(item["audio_file"], mp3_file)
+        progress.log(f"Converted to MP3 ({decisions}): {item['title']}")
+        await engine.run_blocking(remember_output, item["video_id"], item["stream"].itag, MP3_PROFILE, mp3_file, progress)
+        return await engine.run_io(_finish_item, manifest, item, mp3_file, job)
+
+    def download_item(item):
+        progress.log(f"Downloading audio: {item['title']}")
+        _set_item_state(job, item, DOWNLOADING, title=item["title"])
+
+        # Download audio and convert to MP3
+        mp3_file = download_audio_as_mp3(item["url"], playlist_dir, progress.log_only(), streaming=streaming, policy=policy, clip=clip,
+                                         mp3_name=os.path.basename(item["output_file"]))
+        if not is_downloaded_file(mp3_file):
+            progress.log("Failed to download and convert audio.")
+            return item["title"], False
+        return _finish_item(manifest, item, mp3_file, job)
+
+    async def stream_item_async(item):
+        if should_segment(item["length"]):
+            # Long audio is downloaded first and then encoded in segments,
+            # as download_audio_as_mp3 does
+            return await transcode_item_async(await fetch_item_async(item))
+        progress.log(f"Downloading audio: {item['title']}")
+        await engine.run_io(_set_item_state, job, item, DOWNLOADING, title=item["title"])
+        mp3_file = item["output_file"]
+        codec_args, decisions = plan_codec_args("mp3", stream_codecs(audio_stream=item["stream"]), audio_encode_args=MP3_ENCODE_ARGS)
+        await engine.transcode_stream(item["stream"], mp3_file, ['-vn', *codec_args], on_bytes=progress.transferred)
+        progress.log(f"Converted to MP3 ({decisions}): {item['title']}")
+        await engine.run_blocking(remember_output, item["video_id"], item["stream"].itag, MP3_PROFILE, mp3_file, progress)
+        return await engine.run_io(_finish_item, manifest, item, mp3_file, job)
+
+    stages = _playlist_stages(
+        resolve_item,
+        fetch_item if engine is None else fetch_item_async,
+        transcode_item if engine is None else transcode_item_async,
+        stream_item_async if engine is not None and streaming and clip is None else download_item,
+        max_workers, transcode_workers, staged, streaming, clip,
     )
 
-    # Generate a timestamp in the format yyyyMMdd_HHmmss_SSS
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+    _run_playlist_items(playlist, playlist_dir, stages, progress, manifest, prune, job, engine)
+    return playlist_dir
+
+def download_playlist_video(playlist_url, output_dir, progress, max_workers=PLAYLIST_WORKERS, streaming=None, sync=False, prune=False,
+                            staged=PLAYLIST_STAGED, transcode_workers=TRANSCODE_WORKERS, policy=DEFAULT_POLICY, clip=None, job=None,
+                            engine=None):
+    if streaming is None:
+        streaming = STREAM_MUX and job is None
+    if sync and clip is not None:
+        raise ValueError("A synced playlist can't be limited to a clip")
+    progress = PlaylistProgress(progress)
+    playlist = resolve_playlist(playlist_url)
+    playlist_dir = _job_playlist_dir(job, output_dir, "video", playlist, sync)
+    manifest = PlaylistManifest(playlist_dir, playlist.playlist_id, "video") if sync else None
+    names = OutputNames()
 
-    # Create the playlist directory
-    playlist_dir = os.path.join(output_dir, f"Playlist_video_{timestamp}")
-    os.makedirs(playlist_dir, exist_ok=True)
+    def resolve_item(entry):
+        resumed = _resume_entry(job, entry, progress)
+        if resumed is not None:
+            return resumed
 
-    playlist_file = os.path.join(playlist_dir, "playlist.txt")
+        # The only full resolution of the entry; it goes through the shared
+        # cache so the download helpers reuse it
+        yt = resolve_video(entry.url)
+        title = yt.title
 
-    with open(playlist_file, 'w', encoding='utf-8') as file:
-        for video in playlist.videos:
-            yt_link = video.watch_url
-            title = video.title
-            file.write(f"{yt_link} - {title}\n")
-            progress_text_widget.config(state=tk.NORMAL)
-            progress_text_widget.insert(tk.END, f"Downloading video: {title}\n")
-            progress_text_widget.config(state=tk.DISABLED)
-
-            # Get the highest resolution video stream
-            highest_res_stream = get_highest_resolution(yt_link)
-            if highest_res_stream is None:
-                progress_text_widget.config(state=tk.NORMAL)
-                progress_text_widget.insert(tk.END, f"Skipping video due to resolution issues: {title}\n")
-                progress_text_widget.config(state=tk.DISABLED)
-                continue
-
-            # Extract resolution (e.g., 1080p) from the stream
-            resolution = highest_res_stream.resolution
-
-            # Download video without audio
-            video_file = download_video(yt_link, highest_res_stream, playlist_dir, progress_var, progress_text_widget)
-            
-            # Download audio
-            audio_file = download_audio(yt_link, playlist_dir, progress_var, progress_text_widget)
-            if isinstance(audio_file, Exception):
-                progress_text_widget.config(state=tk.NORMAL)
-                progress_text_widget.insert(tk.END, "Failed to download audio.\n")
-                progress_text_widget.config(state=tk.DISABLED)
-                continue
-
-            # Merge video and audio with resolution in filename
-            output_file = os.path.join(playlist_dir, f"{sanitize_filename(title)}_{resolution}.mp4")
-            merge_video_and_audio_playlist(video_file, audio_file, output_file, progress_var, progress_text_widget)
+        # Get the video stream the policy asks for (by default the highest resolution)
+        selection = select_video_stream(yt.streams, policy)
+        if selection is None:
+            progress.log(f"Skipping video due to resolution issues: {title}")
+            return Finished((title, False))
+        highest_res_stream = selection.stream
+        progress.log(f"{title}: {explain_selection(selection)}")
+
+        if manifest is not None and manifest.current_output(yt.video_id, highest_res_stream):
+            progress.log(f"Up to date: {title}")
+            return Finished((title, True))
+
+        # Extract resolution (e.g., 1080p) from the stream
+        resolution = highest_res_stream.resolution
+        item = {
+            "url": entry.url,
+            "title": title,
+            "video_id": yt.video_id,
+            "stream": highest_res_stream,
+            "audio_stream": select_audio_stream(yt.streams, policy, MUX_AUDIO_BITRATE).stream,
+            "output_file": os.path.join(playlist_dir, f"{names.claim(title, yt.video_id)}_{resolution}{clip_suffix(clip)}.mp4"),
+        }
+        item["store_key"] = mp4_store_key(item["stream"], item["audio_stream"])
+        if clip is None and reuse_output(item["video_id"], *item["store_key"], item["output_file"], progress):
+            return Finished(_finish_item(manifest, item, item["output_file"], job))
+        return item
 
+    def fetch_item(item):
+        progress.log(f"Downloading video: {item['title']}")
+        _set_item_state(job, item, DOWNLOADING, title=item["title"])
+
+        # Download the video (without audio) and the audio stream side by side
+        video_file, audio_file = download_video_and_audio(item["url"], item["stream"], playlist_dir, progress.log_only(), policy)
+        if not is_downloaded_file(video_file) or not is_downloaded_file(audio_file):
+            progress.log("Failed to download video or audio.")
+            return Finished((item["title"], False))
+        item["video_file"], item["audio_file"] = video_file, audio_file
+        return item
+
+    async def fetch_item_async(item):
+        progress.log(f"Downloading video: {item['title']}")
+        await engine.run_io(_set_item_state, job, item, DOWNLOADING, title=item["title"])
+
+        # Download the video (without audio) and the audio stream side by side
+        results = await asyncio.gather(
+            engine.download_stream(item["stream"], playlist_dir, temp_filename(item["title"], item["video_id"], "video.mp4"), on_bytes=progress.transferred),
+            engine.download_stream(item["audio_stream"], playlist_dir, temp_filename(item["title"], item["video_id"], "audio"), on_bytes=progress.transferred),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            # Don't leave half a pair behind
+            with span("cleanup"):
+                for result in results:
+                    if is_downloaded_file(result):
+                        os.remove(result)
+            progress.log(f"Failed to download video or audio: {errors[0]}")
+            return Finished((item["title"], False))
+        item["video_file"], item["audio_file"] = results
+        return item
+
+    def transcode_item(item):
+        # The merge deletes the video file only once it succeeded
+        _set_item_state(job, item, CONVERTING, source=item["video_file"], output=item["output_file"])
+        # Merge video and audio with resolution in filename
+        merged_file = merge_video_and_audio_playlist(item["video_file"], item["audio_file"], item["output_file"], progress.log_only())
+        if not is_downloaded_file(merged_file):
+            return item["title"], False
+        remember_output(item["video_id"], *item["store_key"], merged_file, progress)
+        return _finish_item(manifest, item, merged_file, job)
+
+    async def transcode_item_async(item):
+        await engine.run_io(_set_item_state, job, item, CONVERTING, source=item["video_file"], output=item["output_file"])
+        progress.log("Merging video and audio...")
+        try:
+            decisions = await engine.merge_files(item["video_file"], item["audio_file"], item["output_file"])
+        except Exception as e:
+            progress.log(f"Merging failed: {e}")
+            return item["title"], False
+        progress.log(f"Merging successful ({decisions}).")
+        with span("cleanup"):
+            os.remove(item["video_file"])
+            os.remove(item["audio_file"])
+        await engine.run_blocking(remember_output, item["video_id"], *item["store_key"], item["output_file"], progress)
+        return await engine.run_io(_finish_item, manifest, item, item["output_file"], job)
+
+    def download_item(item):
+        progress.log(f"Downloading video: {item['title']}")
+        _set_item_state(job, item, DOWNLOADING, title=item["title"])
+        item_progress = progress.log_only()
+        if streaming or clip is not None:
+            # Pipe both streams into ffmpeg, only the merged file is written
+            merged_file = download_and_merge_streams(item["url"], item["stream"], item["output_file"], item_progress, policy, clip)
+        else:
+            merged_file = _download_and_merge_files(item["url"], item["stream"], playlist_dir, item["output_file"], item_progress, policy)
+
+        if not is_downloaded_file(merged_file):
+            return item["title"], False
+        if clip is None:
+            remember_output(item["video_id"], *item["store_key"], merged_file, progress)
+        return _finish_item(manifest, item, merged_file, job)
+
+    async def stream_item_async(item):
+        progress.log(f"Downloading video: {item['title']}")
+        await engine.run_io(_set_item_state, job, item, DOWNLOADING, title=item["title"])
+        # Pipe both streams into ffmpeg, only the merged file is written
+        codec_args, decisions = plan_codec_args("mp4", stream_codecs(item["stream"], item["audio_stream"]))
+        await engine.mux_streams(item["stream"], item["audio_stream"], item["output_file"], codec_args, on_bytes=progress.transferred)
+        progress.log(f"Merging successful ({decisions}).")
+        await engine.run_blocking(remember_output, item["video_id"], *item["store_key"], item["output_file"], progress)
+        return await engine.run_io(_finish_item, manifest, item, item["output_file"], job)
+
+    stages = _playlist_stages(
+        resolve_item,
+        fetch_item if engine is None else fetch_item_async,
+        transcode_item if engine is None else transcode_item_async,
+        stream_item_async if engine is not None and streaming and clip is None else download_item,
+        max_workers, transcode_workers, staged, streaming, clip, transcode_name="mux",
+    )
+
+    _run_playlist_items(playlist, playlist_dir, stages, progress, manifest, prune, job, engine)
     return playlist_dir
 
-def start_download_playlist(youtube_link, output_dir, progress_var, progress_text_widget, loading_window, download_type):
+# File based variant of download_and_merge_streams for streaming=False
+def _download_and_merge_files(yt_link, highest_res_stream, playlist_dir, output_file, item_progress, policy=DEFAULT_POLICY):
+    # Download the video (without audio) and the audio stream side by side
+    video_file, audio_file = download_video_and_audio(yt_link, highest_res_stream, playlist_dir, item_progress, policy)
+    if not is_downloaded_file(video_file):
+        item_progress.log("Failed to download video.")
+        return None
+    if not is_downloaded_file(audio_file):
+        item_progress.log("Failed to download audio.")
+        return None
+
+    # Merge video and audio with resolution in filename
+    return merge_video_and_audio_playlist(video_file, audio_file, output_file, item_progress)
+
+def start_download_playlist(youtube_link, output_dir, progress, download_type, max_workers=PLAYLIST_WORKERS, sync=False, prune=False,
+                            transcode_workers=TRANSCODE_WORKERS, policy=DEFAULT_POLICY, clip=None, job=None, engine=None, streaming=None,
+                            staged=PLAYLIST_STAGED):
     playlist_dir = None
+    options = dict(max_workers=max_workers, sync=sync, prune=prune, transcode_workers=transcode_workers, policy=policy, clip=clip, job=job,
+                   engine=engine, streaming=streaming, staged=staged)
 
     if download_type == 1:  # Audio
-        playlist_dir = download_playlist_audio(youtube_link, output_dir, progress_var, progress_text_widget)
+        playlist_dir = download_playlist_audio(youtube_link, output_dir, progress, **options)
     elif download_type == 2:  # Video
-        playlist_dir = download_playlist_video(youtube_link, output_dir, progress_var, progress_text_widget)
+        playlist_dir = download_playlist_video(youtube_link, output_dir, progress, **options)
 
-    progress_text_widget.config(state=tk.NORMAL)
-    progress_text_widget.insert(tk.END, "Download Complete!\n")
-    loading_window.title("Finished")
-    progress_text_widget.config(state=tk.DISABLED)
+    progress.log("Download Complete!")
 
     if playlist_dir:
-        show_success_message(playlist_dir)
+        progress.finished(playlist_dir)
 
 
-def merge_video_and_audio_playlist(video_file, audio_file, output_file, progress_var, progress_text_widget):
+def merge_video_and_audio_playlist(video_file, audio_file, output_file, progress):
     try:
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, "Merging video and audio...\n")
-        progress_text_widget.config(state=tk.DISABLED)
-        
-        ffmpeg_path = get_ffmpeg_path()
-        command = f'"{ffmpeg_path}" -y -i "{video_file}" -i "{audio_file}" -c:v copy -c:a aac "{output_file}"'
-
-        subprocess.run(command, shell=True, check=True)
-        progress_var.set(90)
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, f"Merging successful.\n")
-        progress_text_widget.config(state=tk.DISABLED)
+        progress.log("Merging video and audio...")
+
+        decisions = merge_files(video_file, audio_file, output_file)
+        progress.set(90)
+        progress.log(f"Merging successful ({decisions}).")
 
         # Delete the temporary video and audio files
-        os.remove(video_file)
-        os.remove(audio_file)
-        progress_var.set(100)
-        
+        with span("cleanup"):
+            os.remove(video_file)
+            os.remove(audio_file)
+        progress.set(100)
+        return output_file
     except Exception as e:
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, f"Merging failed: {e}\n")
-        progress_text_widget.config(state=tk.DISABLED)
+        progress.log(f"Merging failed: {e}")
@@ -0,0 +1,102 @@
+# helpers/playlist_sync.py
+
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST_NAME = "manifest.json"
+
+def _file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _stream_size(stream):
+    try:
+        return stream.filesize
+    except Exception:
+        return None
+
+# Keeps track of what a synced playlist folder already contains, so a re-run
+# only downloads entries that are new or whose chosen stream changed.
+# Stored as manifest.json next to playlist.txt:
+#   {"playlist_id": ..., "kind": "audio"|"video",
+#    "items": {video_id: {"title", "url", "itag", "stream_size", "output", "size", "sha256"}}}
+class PlaylistManifest:
+    def __init__(self, playlist_dir, playlist_id, kind):
+        self.playlist_dir = playlist_dir
+        self.manifest_file = os.path.join(playlist_dir, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        self.items = {}
+        self.playlist_id = playlist_id
+        self.kind = kind
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get("playlist_id") == self.playlist_id and data.get("kind") == self.kind:
+            self.items = data.get("items", {})
+
+    def _save(self):
+        data = {"playlist_id": self.playlist_id, "kind": self.kind, "items": self.items}
+        temp_file = self.manifest_file + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump(data, file, indent=2, ensure_ascii=False)
+        os.replace(temp_file, self.manifest_file)
+
+    # Returns the existing output file if the entry is already downloaded from
+    # the same stream and the file is still intact, None otherwise
+    def current_output(self, video_id, stream):
+        with self.lock:
+            entry = self.items.get(video_id)
+        if entry is None:
+            return None
+        output_file = os.path.join(self.playlist_dir, entry["output"])
+        if entry.get("itag") != stream.itag or entry.get("stream_size") != _stream_size(stream):
+            return None
+        if not os.path.isfile(output_file) or os.path.getsize(output_file) != entry.get("size"):
+            return None
+        return output_file
+
+    def record(self, video_id, stream, output_file, title, url):
+        entry = {
+            "title": title,
+            "url": url,
+            "itag": stream.itag,
+            "stream_size": _stream_size(stream),
+            "output": os.path.relpath(output_file, self.playlist_dir),
+            "size": os.path.getsize(output_file),
+            "sha256": _file_sha256(output_file),
+        }
+        with self.lock:
+            previous = self.items.get(video_id)
+            self.items[video_id] = entry
+            self._save()
+        # The title (and so the file name) may have changed since the last sync
+        if previous and previous["output"] != entry["output"]:
+            stale_file = os.path.join(self.playlist_dir, previous["output"])
+            if os.path.isfile(stale_file):
+                os.remove(stale_file)
+
+    # Removes entries (and their files) for videos no longer in the playlist.
+    # Returns the titles of the removed entries.
+    def prune(self, current_video_ids):
+        removed = []
+        with self.lock:
+            for video_id in list(self.items):
+                if video_id in current_video_ids:
+                    continue
+                entry = self.items.pop(video_id)
+                stale_file = os.path.join(self.playlist_dir, entry["output"])
+                if os.path.isfile(stale_file):
+                    os.remove(stale_file)
+                removed.append(entry["title"])
+            self._save()
+        return removed
@@ -0,0 +1,221 @@
+# helpers/progress.py
+
+import threading
+import time
+from collections import deque, namedtuple
+
+# Byte counts and ffmpeg times reach the consumer at most this often (seconds)
+PROGRESS_INTERVAL = 0.5
+
+# Throughput and ETA are averaged over this many recent seconds
+RATE_WINDOW = 5.0
+
+# Progress sink handed to every download helper instead of Tk widgets, so the
+# helpers run the same under the GUI, the command line or any other front end.
+# Each method forwards to the matching callback when one is given:
+#   log(message)       a status line, without trailing newline
+#   set(percent)       overall progress of the job, 0-100
+#   finished(path)     the job is done, path is the file or folder produced
+#   error(message)     the job failed
+#   status(text)       transient line with throughput and ETA, replaced by the next one
+#   transferred(count) count more bytes were downloaded (not rate limited)
+#   items_failed(count) count items of a playlist failed; comes before finished()
+class Progress:
+    def __init__(self, on_log=None, on_percent=None, on_finished=None, on_error=None, on_status=None, on_bytes=None, on_items_failed=None):
+        self.on_log = on_log
+        self.on_percent = on_percent
+        self.on_finished = on_finished
+        self.on_error = on_error
+        self.on_status = on_status
+        self.on_bytes = on_bytes
+        self.on_items_failed = on_items_failed
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+
+    def set(self, percent):
+        if self.on_percent:
+            self.on_percent(percent)
+
+    def finished(self, path):
+        if self.on_finished:
+            self.on_finished(path)
+
+    def error(self, message):
+        if self.on_error:
+            self.on_error(message)
+
+    def status(self, text):
+        if self.on_status:
+            self.on_status(text)
+
+    def transferred(self, count):
+        if self.on_bytes:
+            self.on_bytes(count)
+
+    def items_failed(self, count):
+        if self.on_items_failed:
+            self.on_items_failed(count)
+
+    # Returns a progress that shares this one's log and byte count but ignores
+    # percentages and status. Used for items of a playlist, where the bar
+    # tracks finished items instead.
+    def log_only(self):
+        return Progress(on_log=self.log, on_bytes=self.transferred)
+
+# Function to format seconds as "m:ss" or "h:mm:ss"
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+# Moves a job's bar from start to end percent as work gets done, and reports
+# throughput and ETA through progress.status. unit is "bytes" (fed with add()
+# from download callbacks, counted in progress.transferred too) or "seconds"
+# (fed with update() from ffmpeg's -progress out_time). Thread safe; the bar
+# and status are updated at most every interval seconds.
+class TransferMeter:
+    def __init__(self, progress, total=None, start=0, end=100, label="Downloading", unit="bytes", interval=PROGRESS_INTERVAL):
+        self.progress = progress
+        self.total = total
+        self.start = start
+        self.end = end
+        self.label = label
+        self.unit = unit
+        self.interval = interval
+        self.done = 0
+        self.lock = threading.Lock()
+        now = time.monotonic()
+        self.last_emit = now
+        self.samples = deque([(now, 0)])
+
+    def add(self, amount):
+        with self.lock:
+            self.done += amount
+        if self.unit == "bytes":
+            self.progress.transferred(amount)
+        self._emit()
+
+    def update(self, done, total=None):
+        with self.lock:
+            if total:
+                self.total = total
+            self.done = done
+        self._emit()
+
+    # Function to get (rate per second, seconds left or None) over the recent window
+    def rate_and_eta(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            first_time, first_done = self.samples[0]
+            rate = (self.done - first_done) / (now - first_time) if now > first_time else 0.0
+            eta = (self.total - self.done) / rate if rate > 0 and self.total else None
+        return rate, eta
+
+    def describe(self, rate, eta):
+        if self.unit == "bytes":
+            text = f"{self.label}: {self.done / 1048576:.1f}"
+            text += f" of {self.total / 1048576:.1f} MB" if self.total else " MB"
+            text += f", {rate / 1048576:.2f} MB/s"
+        else:
+            text = f"{self.label}: {format_duration(self.done)}"
+            text += f" of {format_duration(self.total)}" if self.total else ""
+            text += f", {rate:.1f}x"
+        if eta is not None:
+            text += f", ETA {format_duration(eta)}"
+        return text
+
+    def _emit(self, force=False):
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.last_emit < self.interval:
+                return
+            self.last_emit = now
+            self.samples.append((now, self.done))
+            while len(self.samples) > 2 and now - self.samples[1][0] >= RATE_WINDOW:
+                self.samples.popleft()
+            fraction = min(self.done / self.total, 1.0) if self.total else 0.0
+        rate, eta = self.rate_and_eta(now)
+        self.progress.set(int(self.start + (self.end - self.start) * fraction))
+        self.progress.status(self.describe(rate, eta))
+
+    # Function to move the bar to end once the work is done
+    def finish(self):
+        self.progress.set(self.end)
+
+# Progress for a whole playlist: forwards everything to the job's progress,
+# counts the bytes all items download and, as items finish, reports the
+# playlist's throughput and an ETA from the average time per item.
+class PlaylistProgress(Progress):
+    def __init__(self, progress):
+        super().__init__(progress.log, progress.set, progress.finished, progress.error, progress.status, self._count, progress.items_failed)
+        self.parent = progress
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def _count(self, count):
+        with self.lock:
+            self.bytes += count
+        self.parent.transferred(count)
+
+    # Function to report progress after completed of total items are done
+    def items_done(self, completed, total):
+        elapsed = time.monotonic() - self.started
+        with self.lock:
+            downloaded = self.bytes
+        text = f"{completed} of {total} items, {downloaded / 1048576:.1f} MB"
+        if elapsed > 0:
+            text += f" at {downloaded / elapsed / 1048576:.2f} MB/s"
+        if 0 < completed < total:
+            text += f", ETA {format_duration(elapsed / completed * (total - completed))}"
+        self.status(text)
+
+# One progress update; kind is "log", "percent", "status", "items_failed",
+# "finished" or "error"
+ProgressEvent = namedtuple("ProgressEvent", ["job", "kind", "value"])
+
+# Thread-safe queue of progress events. Worker threads post events through
+# bus.progress(job); the front end drains them on its own schedule, so no
+# widget or terminal is touched from a worker thread.
+class ProgressBus:
+    def __init__(self):
+        # deque.append/popleft are atomic, so no lock is needed
+        self._events = deque()
+
+    def post(self, job, kind, value):
+        self._events.append(ProgressEvent(job, kind, value))
+
+    def progress(self, job=None):
+        return Progress(
+            on_log=lambda message: self.post(job, "log", message),
+            on_percent=lambda percent: self.post(job, "percent", percent),
+            on_finished=lambda path: self.post(job, "finished", path),
+            on_error=lambda message: self.post(job, "error", message),
+            on_status=lambda text: self.post(job, "status", text),
+            on_items_failed=lambda count: self.post(job, "items_failed", count),
+        )
+
+    # Returns the pending events (at most max_events), oldest first
+    def drain(self, max_events=None):
+        events = []
+        while self._events and (max_events is None or len(events) < max_events):
+            events.append(self._events.popleft())
+        return events
+
+# Folds a batch of events into one update per job: all log lines joined in
+# order, only the last percentage, status and failed item count, and the final
+# finished/error if any.
+# Returns {job: {"log": [...], "percent": int|None, "status": text|None, "items_failed": int|None, "finished": path|None, "error": msg|None}}
+def coalesce_events(events):
+    batches = {}
+    for event in events:
+        batch = batches.setdefault(event.job, {"log": [], "percent": None, "status": None, "items_failed": None, "finished": None, "error": None})
+        if event.kind == "log":
+            batch["log"].append(event.value)
+        else:
+            batch[event.kind] = event.value
+    return batches
@@ -0,0 +1,222 @@
+# helpers/ranged_downloader.py
+
+import json
+import os
+import threading
+from urllib.request import Request, urlopen
+from helpers.metrics import span
+
+# Number of connections used per stream and the size of each byte range.
+# The range size matches the 9MB chunks pytubefix asks YouTube for.
+RANGED_CONNECTIONS = 4
+RANGE_SIZE = 9 * 1024 * 1024
+RANGE_RETRIES = 3
+READ_BLOCK_SIZE = 64 * 1024
+REQUEST_TIMEOUT = 30
+
+class RangeNotSupportedError(Exception):
+    pass
+
+def _load_part_state(part_file, total_size, range_size):
+    try:
+        with open(part_file, 'r', encoding='utf-8') as file:
+            state = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if state.get("size") != total_size or state.get("range_size") != range_size:
+        return None
+    return state
+
+def _save_part_state(part_file, state):
+    # Write to a temporary file first so a crash never leaves a torn sidecar
+    temp_file = part_file + ".tmp"
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump(state, file)
+    os.replace(temp_file, part_file)
+
+# Function to get the .part state to continue from, preallocating the file for
+# a fresh transfer. Returns None when an earlier run already finished the file.
+# Ranges finished earlier are reported to on_bytes up front.
+def _prepare_part(file_path, part_file, total_size, range_size, on_bytes=None):
+    state = _load_part_state(part_file, total_size, range_size)
+    if state is None or not os.path.isfile(file_path):
+        if os.path.isfile(file_path) and not os.path.exists(part_file) and os.path.getsize(file_path) == total_size:
+            # Finished by an earlier run, nothing fetched
+            if on_bytes is not None:
+                on_bytes(total_size)
+            return None
+        # The sidecar goes first: a full size file without one counts as
+        # finished above, so it must never exist while the file is still zeros
+        state = {"size": total_size, "range_size": range_size, "done": []}
+        _save_part_state(part_file, state)
+        with open(file_path, 'wb') as file:
+            file.truncate(total_size)
+
+    done = state["done"]
+    if on_bytes is not None and done:
+        on_bytes(sum(min(start + range_size, total_size) - start for start in done))
+    return state
+
+def _pending_ranges(state, total_size, range_size):
+    done = set(state["done"])
+    return [start for start in range(0, total_size, range_size) if start not in done]
+
+def _range_url(url, start, end):
+    # googlevideo throttles plain Range requests, so ask for the range in the
+    # query string like pytubefix does; other servers get the Range header only
+    if "googlevideo.com" in url:
+        return f"{url}&range={start}-{end}"
+    return url
+
+def _fetch_range(url, file_path, start, end, on_bytes=None):
+    request = Request(
+        _range_url(url, start, end),
+        headers={"User-Agent": "Mozilla/5.0", "Range": f"bytes={start}-{end}"}
+    )
+    with urlopen(request, timeout=REQUEST_TIMEOUT) as response:  # nosec
+        if response.status != 206 and start != 0:
+            raise RangeNotSupportedError(f"Server ignored range {start}-{end}")
+        expected = end - start + 1
+        received = 0
+        with open(file_path, 'r+b') as file:
+            file.seek(start)
+            while received < expected:
+                block = response.read(min(READ_BLOCK_SIZE, expected - received))
+                if not block:
+                    break
+                file.write(block)
+                received += len(block)
+                if on_bytes is not None:
+                    on_bytes(len(block))
+    if received != expected:
+        raise IOError(f"Incomplete range {start}-{end}: got {received} of {expected} bytes")
+
+# Function to download a URL of known size over several connections at once.
+# The file is preallocated and every finished byte range is recorded in a
+# <file>.part sidecar, so an interrupted transfer picks up where it stopped.
+# When a stats dict is given, "retries" and "bytes" (fetched by this call) are
+# added to it. on_bytes(count) is called from the worker threads as data
+# arrives; ranges finished by an earlier run are reported up front.
+def download_url(url, file_path, total_size, connections=RANGED_CONNECTIONS, range_size=RANGE_SIZE, stats=None, on_bytes=None):
+    stats = {} if stats is None else stats
+    stats.setdefault("retries", 0)
+    stats.setdefault("bytes", 0)
+    part_file = file_path + ".part"
+    state = _prepare_part(file_path, part_file, total_size, range_size, on_bytes)
+    if state is None:
+        return file_path
+    pending = _pending_ranges(state, total_size, range_size)
+    state_lock = threading.Lock()
+    errors = []
+
+    def worker():
+        while True:
+            with state_lock:
+                if not pending or errors:
+                    return
+                start = pending.pop(0)
+            end = min(start + range_size, total_size) - 1
+            for attempt in range(RANGE_RETRIES + 1):
+                received = [0]
+                def counted(count):
+                    received[0] += count
+                    on_bytes(count)
+                try:
+                    _fetch_range(url, file_path, start, end, counted if on_bytes is not None else None)
+                    break
+                except RangeNotSupportedError as e:
+                    with state_lock:
+                        errors.append(e)
+                    return
+                except Exception as e:
+                    if received[0]:
+                        # The range is fetched again from its start
+                        on_bytes(-received[0])
+                    if attempt == RANGE_RETRIES:
+                        with state_lock:
+                            errors.append(e)
+                        return
+                    with state_lock:
+                        stats["retries"] += 1
+            with state_lock:
+                stats["bytes"] += end - start + 1
+                state["done"].append(start)
+                _save_part_state(part_file, state)
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, min(connections, len(pending))))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    if errors:
+        # Keep the .part sidecar so the next attempt resumes
+        raise errors[0]
+
+    os.remove(part_file)
+    return file_path
+
+# pytubefix reports download progress through one callback per YouTube
+# object, shared by all its streams; route it to the callback of each stream
+_progress_callbacks = {}
+_progress_lock = threading.Lock()
+
+def _on_pytubefix_progress(stream, chunk, bytes_remaining):
+    with _progress_lock:
+        on_bytes = _progress_callbacks.get(id(stream))
+    if on_bytes is not None:
+        on_bytes(len(chunk))
+
+def _pytubefix_download(stream, output_path, filename, on_bytes, **kwargs):
+    monostate = getattr(stream, "_monostate", None)
+    if on_bytes is None or monostate is None:
+        return stream.download(output_path=output_path, filename=filename, **kwargs)
+    with _progress_lock:
+        _progress_callbacks[id(stream)] = on_bytes
+        monostate.on_progress = _on_pytubefix_progress
+    try:
+        return stream.download(output_path=output_path, filename=filename, **kwargs)
+    finally:
+        with _progress_lock:
+            _progress_callbacks.pop(id(stream), None)
+
+# Function to download a pytubefix stream with the ranged downloader, falling
+# back to pytubefix's own single connection download when the size is unknown.
+# on_bytes(count) is called as data arrives, possibly from several threads.
+def download_stream(stream, output_path, filename, connections=RANGED_CONNECTIONS, on_bytes=None):
+    with span("download", itag=getattr(stream, "itag", None)) as timing:
+        file_path = _download_stream(stream, output_path, filename, connections, timing, on_bytes)
+    return file_path
+
+def _download_stream(stream, output_path, filename, connections, timing, on_bytes):
+    file_path = os.path.join(output_path, filename)
+    try:
+        total_size = stream.filesize
+    except Exception:
+        total_size = 0
+    if not total_size:
+        file_path = _pytubefix_download(stream, output_path, filename, on_bytes)
+        timing.set(bytes=os.path.getsize(file_path), connections=1)
+        return file_path
+
+    os.makedirs(output_path, exist_ok=True)
+    stats = {}
+    reported = [0]
+    def counted(count):
+        with _progress_lock:
+            reported[0] += count
+        on_bytes(count)
+    try:
+        file_path = download_url(stream.url, file_path, total_size, connections=connections, stats=stats,
+                                 on_bytes=counted if on_bytes is not None else None)
+        timing.set(connections=connections, **stats)
+        return file_path
+    except RangeNotSupportedError:
+        if os.path.exists(file_path + ".part"):
+            os.remove(file_path + ".part")
+        if reported[0]:
+            # pytubefix downloads the whole stream again
+            on_bytes(-reported[0])
+        file_path = _pytubefix_download(stream, output_path, filename, on_bytes, skip_existing=False)
+        timing.set(bytes=os.path.getsize(file_path), connections=1, retries=stats.get("retries", 0))
+        return file_path
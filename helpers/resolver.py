@@ -0,0 +1,130 @@
+# helpers/resolver.py
+
+import threading
+import time
+from collections import OrderedDict
+from pytubefix import YouTube, Playlist
+from helpers.utils import get_token_file_path
+from helpers.metrics import span
+from helpers.url_parser import (
+    video_id_from_url,
+    playlist_id_from_url,
+    canonical_video_url,
+    canonical_playlist_url,
+)
+
+# How many resolved videos/playlists are kept and for how long. Stream URLs
+# handed out by YouTube expire after a few hours, so stay well below that.
+RESOLVER_CACHE_SIZE = 128
+RESOLVER_CACHE_TTL = 30 * 60
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_key_locks = {}
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+# Every link shape of the same video (watch, youtu.be, shorts, embed...) maps
+# to one key and is resolved through its canonical URL. Links the parser
+# doesn't understand are passed on as is and pytubefix raises the real error.
+def _video_target(youtube_link):
+    video_id = video_id_from_url(youtube_link)
+    if video_id is None:
+        return ("video", youtube_link), youtube_link
+    return ("video", video_id), canonical_video_url(video_id)
+
+def _playlist_target(playlist_url):
+    playlist_id = playlist_id_from_url(playlist_url)
+    if playlist_id is None:
+        return ("playlist", playlist_url), playlist_url
+    return ("playlist", playlist_id), canonical_playlist_url(playlist_id)
+
+def _cache_get(key):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > RESOLVER_CACHE_TTL:
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        _stats["hits"] += 1
+        return value
+
+def _cache_put(key, value):
+    with _cache_lock:
+        _cache[key] = (time.monotonic(), value)
+        _cache.move_to_end(key)
+        while len(_cache) > RESOLVER_CACHE_SIZE:
+            _cache.popitem(last=False)
+            _stats["evictions"] += 1
+
+def _resolve(key, factory):
+    value = _cache_get(key)
+    if value is not None:
+        return value
+
+    # One lock per key so concurrent callers asking for the same URL wait for
+    # a single round trip instead of each starting their own
+    with _cache_lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        value = _cache_get(key)
+        if value is not None:
+            return value
+        with _cache_lock:
+            _stats["misses"] += 1
+        try:
+            # Only real round trips are timed, cache hits cost nothing
+            with span("resolve", kind=key[0], id=key[1]):
+                value = factory()
+            # Cached before the key lock goes, so a caller arriving in between
+            # finds the value instead of starting another round trip
+            _cache_put(key, value)
+        finally:
+            with _cache_lock:
+                _key_locks.pop(key, None)
+        return value
+
+def _build_video(youtube_link):
+    yt = YouTube(
+        youtube_link,
+        client='WEB_EMBEDDED_PLAYER',
+        use_po_token=True,
+        token_file= get_token_file_path()
+    )
+    # Fetch the player response once and parse the stream manifest and title
+    # up front, so every later user of this object reads them from memory
+    yt.fmt_streams
+    yt.title
+    return yt
+
+def _build_playlist(playlist_url):
+    return Playlist(
+        playlist_url,
+        client='WEB_EMBEDDED_PLAYER',
+        use_po_token=True,
+        token_file= get_token_file_path()
+    )
+
+# Function to get a resolved YouTube object, shared between all helpers
+def resolve_video(youtube_link):
+    key, url = _video_target(youtube_link)
+    return _resolve(key, lambda: _build_video(url))
+
+# Function to get a Playlist object, shared between validation and download
+def resolve_playlist(playlist_url):
+    key, url = _playlist_target(playlist_url)
+    return _resolve(key, lambda: _build_playlist(url))
+
+def get_resolver_stats():
+    with _cache_lock:
+        stats = dict(_stats)
+        stats["size"] = len(_cache)
+    return stats
+
+def clear_resolver_cache():
+    with _cache_lock:
+        _cache.clear()
+        for name in _stats:
+            _stats[name] = 0
@@ -0,0 +1,215 @@
+# helpers/segmented_encoder.py
+
+import os
+import re
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from helpers.utils import get_ffmpeg_path
+from helpers.pipeline import CPU_WORKERS
+from helpers.ffmpeg_helper import _run_ffmpeg
+
+# Inputs at least this long (seconds) are encoded in segments on all cores
+SEGMENTED_MIN_DURATION = 20 * 60
+
+# Segments are never shorter than this (seconds), so short inputs use fewer workers
+MIN_SEGMENT_DURATION = 2 * 60
+
+SAMPLE_RATE = 44100
+FRAME_SAMPLES = 1152  # samples per MPEG-1 Layer III frame
+
+# Frames encoded ahead of each segment and thrown away, so the kept frames
+# start with a warmed up encoder, and frames of extra input after it
+LEAD_IN_FRAMES = 4
+LEAD_OUT_FRAMES = 3
+
+# Input seek point is placed this many seconds before the segment start; the
+# exact start is then cut by atrim on the input's own timestamps
+SEEK_MARGIN = 1.0
+
+# Containers whose timestamps are only millisecond accurate. After a seek the
+# decoded samples carry those rounded timestamps and land up to a few dozen
+# samples off, so segments of these are decoded from the start instead.
+COARSE_TIMESTAMP_FORMATS = ("matroska", "webm")
+
+_PTS_TIME = re.compile(r"pts_time:(-?[\d.]+)")
+_INPUT_FORMAT = re.compile(r"Input #0, ([\w,]+), from")
+
+_BITRATES = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_SAMPLE_RATES = (44100, 48000, 32000)
+
+# Function to list the (offset, length) of every MPEG-1 Layer III frame in a
+# headerless MP3 file, reading only the frame headers
+def mp3_frames(file):
+    frames = []
+    offset = 0
+    while True:
+        file.seek(offset)
+        header = file.read(4)
+        if len(header) < 4:
+            break
+        b0, b1, b2 = header[0], header[1], header[2]
+        # Sync word, MPEG-1, Layer III
+        if b0 != 0xFF or (b1 & 0xFE) != 0xFA:
+            raise ValueError(f"No MPEG-1 Layer III frame at byte {offset}")
+        bitrate = _BITRATES[b2 >> 4] if (b2 >> 4) < len(_BITRATES) else 0
+        sample_rate = _SAMPLE_RATES[(b2 >> 2) & 3] if ((b2 >> 2) & 3) < len(_SAMPLE_RATES) else 0
+        if not bitrate or not sample_rate:
+            raise ValueError(f"Unsupported MP3 frame header at byte {offset}")
+        length = 144000 * bitrate // sample_rate + ((b2 >> 1) & 1)
+        frames.append((offset, length))
+        offset += length
+    return frames
+
+# Segment boundaries in frames: [(first frame, end frame)], the last one open (None)
+def _segment_frames(duration, workers):
+    total_frames = int(duration * SAMPLE_RATE) // FRAME_SAMPLES
+    count = max(1, min(workers, int(duration // MIN_SEGMENT_DURATION)))
+    per_segment = -(-total_frames // count)
+    bounds = []
+    for index in range(count):
+        first = index * per_segment
+        end = None if index == count - 1 else (index + 1) * per_segment
+        bounds.append((first, end))
+    return bounds
+
+# Function to get the timeline segments are cut on: (timestamp of the first
+# decoded sample, whether seeking keeps timestamps sample accurate). The first
+# sample is sample 0 of a single pass encode; its timestamp is rarely 0, the
+# container's start time and the codec's pre-skip (Opus) move it.
+def input_timeline(input_file):
+    command = [
+        get_ffmpeg_path(), '-hide_banner', '-copyts', '-i', input_file, '-vn',
+        '-af', 'ashowinfo', '-frames:a', '1', '-f', 'null', '-',
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, errors='replace')
+    match = _PTS_TIME.search(result.stderr)
+    container = _INPUT_FORMAT.search(result.stderr)
+    formats = container.group(1).split(",") if container else []
+    seekable = not any(name in COARSE_TIMESTAMP_FORMATS for name in formats)
+    return (float(match.group(1)) if match else 0.0), seekable
+
+# The segment is cut by timestamp (-copyts keeps the input's own) rather than
+# by counting samples from wherever the seek lands, so it starts on the same
+# sample a single pass encode has there. on_time(seconds, None) follows the encode.
+# With info_frame the encoder also writes its Xing/LAME frame, which is
+# returned separately. Returns (segment file, byte range start, end, frames
+# kept, Xing/LAME frame or None).
+def _encode_segment(input_file, segment_file, first, end, bitrate, origin=0.0, seekable=True, on_time=None, info_frame=False):
+    lead_in = LEAD_IN_FRAMES if first else 0
+    start_sample = (first - lead_in) * FRAME_SAMPLES
+    seek = max(0.0, start_sample / SAMPLE_RATE - SEEK_MARGIN) if seekable else 0.0
+    trim = f"start={origin + start_sample / SAMPLE_RATE:.6f}"
+    if end is not None:
+        end_sample = (end + LEAD_OUT_FRAMES) * FRAME_SAMPLES
+        trim += f":end={origin + end_sample / SAMPLE_RATE:.6f}"
+
+    command = [
+        get_ffmpeg_path(), '-y', '-v', 'error',
+        *(['-ss', f"{origin + seek:.6f}"] if seek else []), '-copyts', '-i', input_file, '-vn',
+        '-af', f"aresample={SAMPLE_RATE},atrim={trim},asetpts=PTS-STARTPTS",
+        '-ac', '2', '-c:a', 'libmp3lame', '-b:a', f"{bitrate}k",
+        # No bit reservoir, so frames don't borrow bits from their neighbours
+        # and can be cut apart; no ID3 tag in the pieces
+        '-reservoir', '0', '-write_xing', '1' if info_frame else '0', '-id3v2_version', '0',
+        '-threads', '1', '-f', 'mp3', segment_file,
+    ]
+    _run_ffmpeg(command, on_time=on_time)
+
+    header = None
+    with open(segment_file, 'rb') as file:
+        frames = mp3_frames(file)
+        if info_frame and frames:
+            offset, length = frames.pop(0)
+            file.seek(offset)
+            header = file.read(length)
+    keep = frames[lead_in:] if end is None else frames[lead_in:lead_in + end - first]
+    if end is not None and len(keep) != end - first:
+        raise RuntimeError(f"Segment at frame {first} came out short: {len(keep)} of {end - first} frames")
+    if not keep:
+        return segment_file, 0, 0, 0, header
+    # Byte range of the kept frames
+    return segment_file, keep[0][0], keep[-1][0] + keep[-1][1], len(keep), header
+
+# Function to point a Xing/LAME frame at the joined file: its frame and byte
+# counts are rewritten, the encoder delay and padding it carries are kept
+def _patch_info_frame(header, frame_count, byte_count):
+    header = bytearray(header)
+    tag = max(header.find(b"Info"), header.find(b"Xing"))
+    if tag < 0:
+        raise ValueError("No Xing/LAME tag in the info frame")
+    flags = int.from_bytes(header[tag + 4:tag + 8], "big")
+    field = tag + 8
+    if flags & 1:
+        header[field:field + 4] = frame_count.to_bytes(4, "big")
+        field += 4
+    if flags & 2:
+        header[field:field + 4] = (len(header) + byte_count).to_bytes(4, "big")
+    return bytes(header)
+
+def _copy_range(source, target, start, end):
+    source.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        block = source.read(min(1024 * 1024, remaining))
+        if not block:
+            break
+        target.write(block)
+        remaining -= len(block)
+
+# Function to encode a long input to a CBR MP3 on several ffmpeg processes at
+# once. The input is split at MP3 frame boundaries; every segment after the
+# first is encoded with a few frames of lead-in that are dropped again, so the
+# encoder delay lines up with the first segment and the pieces join without
+# gaps or repeated samples. The joined file carries the encoder delay and
+# padding only once, at its start and end, like a single pass encode.
+# The last segment's Xing/LAME frame (it ends where the joined file ends, so
+# its padding is the joined file's) goes in front of the joined frames, and a
+# final copy adds the ID3 tag with the input's metadata, as in a single pass.
+# on_time(seconds, duration) follows the seconds encoded over all segments,
+# from the segment threads.
+def encode_mp3_segmented(input_file, output_file, duration, bitrate=192, workers=CPU_WORKERS, on_time=None):
+    bounds = _segment_frames(duration, workers)
+    origin, seekable = input_timeline(input_file)
+    done = [0.0] * len(bounds)
+    lock = threading.Lock()
+
+    def segment_progress(index, first, end):
+        if on_time is None:
+            return None
+        length = ((end - first) * FRAME_SAMPLES / SAMPLE_RATE) if end is not None else duration - first * FRAME_SAMPLES / SAMPLE_RATE
+        def update(seconds, _duration):
+            with lock:
+                done[index] = min(seconds, length)
+                on_time(min(sum(done), duration), duration)
+        return update
+
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_file))) as temp_dir:
+        with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+            futures = [
+                executor.submit(_encode_segment, input_file, os.path.join(temp_dir, f"segment_{index}.mp3"), first, end, bitrate,
+                                origin, seekable, segment_progress(index, first, end), index == len(bounds) - 1)
+                for index, (first, end) in enumerate(bounds)
+            ]
+            pieces = [future.result() for future in futures]
+
+        frame_count = sum(piece[3] for piece in pieces)
+        byte_count = sum(piece[2] - piece[1] for piece in pieces)
+        joined_file = os.path.join(temp_dir, "joined.mp3")
+        with open(joined_file, 'wb') as file:
+            file.write(_patch_info_frame(pieces[-1][4], frame_count, byte_count))
+            for segment_file, start, end, _count, _header in pieces:
+                with open(segment_file, 'rb') as segment:
+                    _copy_range(segment, file, start, end)
+
+        command = [
+            get_ffmpeg_path(), '-y', '-v', 'error', '-i', joined_file, '-i', input_file,
+            '-map', '0:a', '-map_metadata', '1', '-c:a', 'copy', '-f', 'mp3', output_file,
+        ]
+        _run_ffmpeg(command)
+    return len(bounds)
+
+# Function to tell whether an input is long enough to be worth segmenting
+def should_segment(duration, workers=CPU_WORKERS):
+    return bool(duration) and duration >= SEGMENTED_MIN_DURATION and workers > 1 and len(_segment_frames(duration, workers)) > 1
@@ -0,0 +1,185 @@
+# helpers/stream_policy.py
+
+import re
+from collections import namedtuple
+
+# What a download actually needs, so the smallest stream that still meets it
+# is fetched instead of always the biggest one:
+#   max_height         highest video resolution wanted, e.g. 720 (None: best)
+#   codecs             acceptable video/audio codecs, e.g. ("av1", "vp9", "h264")
+#   max_bytes_per_sec  bandwidth budget per stream
+#   audio_bitrate      kbps the audio ends up at; sources above it are wasted
+#   video_containers   containers the video may come in; the merge writes mp4
+StreamPolicy = namedtuple(
+    "StreamPolicy",
+    ["max_height", "codecs", "max_bytes_per_sec", "audio_bitrate", "video_containers"],
+    defaults=(None, None, None, None, ("mp4",)),
+)
+
+DEFAULT_POLICY = StreamPolicy()
+
+# The chosen stream, why it was chosen, its size and what the old "highest
+# first" rule would have fetched. Sizes are in bytes, None when unknown.
+Selection = namedtuple("Selection", ["stream", "reason", "size", "baseline", "bytes_saved"])
+
+_CODEC_FAMILIES = (
+    ("av01", "av1"),
+    ("vp09", "vp9"),
+    ("vp9", "vp9"),
+    ("vp8", "vp8"),
+    ("avc1", "h264"),
+    ("mp4a", "aac"),
+    ("opus", "opus"),
+    ("vorbis", "vorbis"),
+)
+
+def codec_family(codec):
+    codec = (codec or "").lower()
+    for prefix, family in _CODEC_FAMILIES:
+        if codec.startswith(prefix):
+            return family
+    return codec
+
+def _video_codec(stream):
+    return codec_family(getattr(stream, "video_codec", None))
+
+def _audio_codec(stream):
+    return codec_family(getattr(stream, "audio_codec", None))
+
+def _height(stream):
+    height = getattr(stream, "height", None)
+    if height:
+        return height
+    match = re.match(r"(\d+)p", getattr(stream, "resolution", None) or "")
+    return int(match.group(1)) if match else 0
+
+def _abr(stream):
+    match = re.match(r"(\d+)kbps", getattr(stream, "abr", None) or "")
+    return int(match.group(1)) if match else 0
+
+def _duration(stream):
+    return getattr(getattr(stream, "_monostate", None), "duration", None)
+
+# Size from the stream manifest only: Stream.filesize would send a request per
+# stream when YouTube left contentLength out, so estimate from the bitrate instead
+def stream_size(stream):
+    size = getattr(stream, "_filesize", 0)
+    if size:
+        return size
+    bitrate = getattr(stream, "bitrate", None)
+    duration = _duration(stream)
+    if bitrate and duration:
+        return int(duration * bitrate / 8)
+    return None
+
+def _bytes_per_sec(stream):
+    size = stream_size(stream)
+    duration = _duration(stream)
+    if size and duration:
+        return size / duration
+    bitrate = getattr(stream, "bitrate", None)
+    return bitrate / 8 if bitrate else None
+
+def _size_key(stream):
+    size = stream_size(stream)
+    return size if size is not None else float("inf")
+
+def _is_video_only(stream):
+    return getattr(stream, "includes_video_track", False) and not getattr(stream, "includes_audio_track", False)
+
+def _is_audio_only(stream):
+    return getattr(stream, "includes_audio_track", False) and not getattr(stream, "includes_video_track", False)
+
+def _selection(stream, notes, baseline):
+    size = stream_size(stream)
+    baseline_size = stream_size(baseline) if baseline is not None else None
+    bytes_saved = baseline_size - size if size is not None and baseline_size is not None else None
+    return Selection(stream, "; ".join(notes), size, baseline, bytes_saved)
+
+def _within_budget(candidates, policy, notes):
+    if not policy.max_bytes_per_sec:
+        return candidates
+    affordable = [s for s in candidates if (_bytes_per_sec(s) or 0) <= policy.max_bytes_per_sec]
+    if affordable:
+        return affordable
+    notes.append(f"no stream fits {policy.max_bytes_per_sec} bytes/s, taking the leanest")
+    leanest = min(candidates, key=lambda s: _bytes_per_sec(s) or float("inf"))
+    return [leanest]
+
+def _preferred_codecs(candidates, policy, codec_of, notes):
+    if not policy.codecs:
+        return candidates
+    preferred = [s for s in candidates if codec_of(s) in policy.codecs]
+    if preferred:
+        return preferred
+    notes.append(f"none of {', '.join(policy.codecs)} available")
+    return candidates
+
+# Function to pick the video-only stream for a merge: the highest resolution
+# allowed by the policy, and at that resolution the smallest stream in an
+# accepted codec and container. Returns a Selection, or None without video.
+def select_video_stream(streams, policy=DEFAULT_POLICY):
+    candidates = [s for s in streams if _is_video_only(s)]
+    if not candidates:
+        return None
+    # What was fetched before there was a policy: the first highest mp4
+    mp4_streams = [s for s in streams if getattr(s, "subtype", None) == "mp4" and getattr(s, "includes_video_track", False)]
+    baseline = max(mp4_streams, key=_height) if mp4_streams else None
+    notes = []
+
+    if policy.video_containers:
+        in_container = [s for s in candidates if getattr(s, "subtype", None) in policy.video_containers]
+        if in_container:
+            candidates = in_container
+        else:
+            notes.append(f"no {'/'.join(policy.video_containers)} stream available")
+
+    if policy.max_height:
+        low_enough = [s for s in candidates if _height(s) <= policy.max_height]
+        if low_enough:
+            candidates = low_enough
+        else:
+            notes.append(f"nothing at or below {policy.max_height}p")
+            lowest = min(_height(s) for s in candidates)
+            candidates = [s for s in candidates if _height(s) == lowest]
+
+    candidates = _within_budget(candidates, policy, notes)
+    candidates = _preferred_codecs(candidates, policy, _video_codec, notes)
+
+    top_height = max(_height(s) for s in candidates)
+    chosen = min((s for s in candidates if _height(s) == top_height), key=_size_key)
+    notes.insert(0, f"{top_height}p {_video_codec(chosen)} {getattr(chosen, 'subtype', '')} (itag {chosen.itag}), smallest at this resolution")
+    return _selection(chosen, notes, baseline)
+
+# Function to pick the audio-only stream: the smallest one whose bitrate still
+# reaches the target (kbps; policy.audio_bitrate, else the caller's
+# target_bitrate), or the highest bitrate one when nothing does or no target is given.
+def select_audio_stream(streams, policy=DEFAULT_POLICY, target_bitrate=None):
+    candidates = [s for s in streams if _is_audio_only(s)]
+    if not candidates:
+        return None
+    baseline = max(candidates, key=_abr)
+    notes = []
+    target_bitrate = policy.audio_bitrate or target_bitrate
+
+    candidates = _within_budget(candidates, policy, notes)
+    candidates = _preferred_codecs(candidates, policy, _audio_codec, notes)
+
+    enough = [s for s in candidates if _abr(s) >= target_bitrate] if target_bitrate else []
+    if enough:
+        chosen = min(enough, key=lambda s: (_abr(s), _size_key(s)))
+        notes.insert(0, f"{_abr(chosen)}kbps {_audio_codec(chosen)} (itag {chosen.itag}), smallest reaching {target_bitrate}kbps")
+    else:
+        chosen = max(candidates, key=_abr)
+        target = f", nothing reaches {target_bitrate}kbps" if target_bitrate else ""
+        notes.insert(0, f"{_abr(chosen)}kbps {_audio_codec(chosen)} (itag {chosen.itag}), highest bitrate{target}")
+    return _selection(chosen, notes, baseline)
+
+# One line describing a selection for the progress log
+def explain_selection(selection):
+    text = f"Selected {selection.reason}"
+    if selection.size is not None:
+        text += f", {selection.size / 1048576:.1f} MB"
+    if selection.bytes_saved and selection.bytes_saved > 0:
+        text += f", saves {selection.bytes_saved / 1048576:.1f} MB over itag {selection.baseline.itag}"
+    return text
@@ -0,0 +1,111 @@
+# helpers/url_parser.py
+
+import re
+from collections import namedtuple
+from urllib.parse import urlsplit, parse_qs
+
+# Offline parsing of YouTube links: pulls the video and playlist IDs out of
+# every common URL shape without touching the network, so malformed input is
+# rejected instantly and batches can be deduplicated before any work starts.
+
+YOUTUBE_HOSTS = ("youtube.com", "youtube-nocookie.com")
+SHORT_HOSTS = ("youtu.be",)
+
+# Path prefixes that are followed by a video ID, e.g. /shorts/<id>
+VIDEO_PATH_PREFIXES = ("shorts", "embed", "v", "e", "live")
+
+# Video IDs are 11 characters of base64url (64 bits). The last character
+# carries only the remaining 4 bits, so it is one of 16 values.
+_VIDEO_ID = re.compile(r"[A-Za-z0-9_-]{10}[AEIMQUYcgkosw048]")
+_PLAYLIST_ID = re.compile(r"[A-Za-z0-9_-]{2,64}")
+
+ParsedUrl = namedtuple("ParsedUrl", ["video_id", "playlist_id"])
+
+def is_video_id(value):
+    return bool(value) and _VIDEO_ID.fullmatch(value) is not None
+
+def is_playlist_id(value):
+    return bool(value) and _PLAYLIST_ID.fullmatch(value) is not None
+
+def _host_matches(host, domains):
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+# Function to parse a YouTube link. Returns ParsedUrl(video_id, playlist_id)
+# with whichever IDs the link carries, or None if it is not a YouTube link.
+def parse_youtube_url(url):
+    if not isinstance(url, str):
+        return None
+    url = url.strip()
+    if not url or any(c.isspace() for c in url):
+        return None
+    if "://" not in url:
+        url = "https://" + url
+
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+    except ValueError:
+        return None
+    if parts.scheme not in ("http", "https"):
+        return None
+
+    query = parse_qs(parts.query)
+    segments = [segment for segment in parts.path.split("/") if segment]
+    video_id = None
+
+    if _host_matches(host, SHORT_HOSTS):
+        video_id = segments[0] if segments else None
+    elif _host_matches(host, YOUTUBE_HOSTS):
+        if segments[:1] == ["watch"]:
+            video_id = query.get("v", [None])[0]
+        elif len(segments) >= 2 and segments[0] in VIDEO_PATH_PREFIXES and segments[1] != "videoseries":
+            video_id = segments[1]
+    else:
+        return None
+
+    playlist_id = query.get("list", [None])[0]
+
+    if video_id is not None and not is_video_id(video_id):
+        return None
+    if playlist_id is not None and not is_playlist_id(playlist_id):
+        return None
+    if video_id is None and playlist_id is None:
+        return None
+    return ParsedUrl(video_id, playlist_id)
+
+def canonical_video_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+def canonical_playlist_url(playlist_id):
+    return f"https://www.youtube.com/playlist?list={playlist_id}"
+
+# Function to get the video ID of a link, or None when there isn't one
+def video_id_from_url(url):
+    parsed = parse_youtube_url(url)
+    return parsed.video_id if parsed else None
+
+# Function to get the playlist ID of a link, or None when there isn't one
+def playlist_id_from_url(url):
+    parsed = parse_youtube_url(url)
+    return parsed.playlist_id if parsed else None
+
+# Function to normalize a batch of links before any network work is scheduled.
+# kind is "video" or "playlist". Returns (unique, invalid, duplicates):
+#   unique      [(canonical_url, original_url)] in input order, one per ID
+#   invalid     original links that don't carry an ID of that kind
+#   duplicates  original links dropped because their ID was already seen
+def dedupe_urls(urls, kind="video"):
+    id_of = video_id_from_url if kind == "video" else playlist_id_from_url
+    canonical = canonical_video_url if kind == "video" else canonical_playlist_url
+    seen = set()
+    unique, invalid, duplicates = [], [], []
+    for url in urls:
+        item_id = id_of(url)
+        if item_id is None:
+            invalid.append(url)
+        elif item_id in seen:
+            duplicates.append(url)
+        else:
+            seen.add(item_id)
+            unique.append((canonical(item_id), url))
+    return unique, invalid, duplicates
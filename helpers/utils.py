@@ -2,10 +2,8 @@
 
 import os
 import sys
-import subprocess
-import tkinter as tk
-from tkinter import messagebox
-from pytubefix import YouTube, Playlist
+import shutil
+from helpers.url_parser import video_id_from_url, playlist_id_from_url
 
 import os
 import sys
@@ -31,55 +29,89 @@ def get_token_file_path():
     return resource_path(os.path.join('helpers', 'token_file', 'token_file.json'))
 
 def get_ffmpeg_path():
-    return resource_path(os.path.join('helpers', 'ffmpeg', 'ffmpeg.exe'))
+    ffmpeg_path = resource_path(os.path.join('helpers', 'ffmpeg', 'ffmpeg.exe'))
+    if not os.path.exists(ffmpeg_path):
+        # No bundled ffmpeg.exe (e.g. headless Linux workers): use the one on PATH
+        return shutil.which('ffmpeg') or ffmpeg_path
+    return ffmpeg_path
 
 
 def sanitize_filename(filename):
     return "".join(c if c.isalnum() or c in (' ', '.', '_') else '_' for c in filename)
 
-def center_window(window, width, height):
-    window.update_idletasks()
-    screen_width = window.winfo_screenwidth()
-    screen_height = window.winfo_screenheight()
-    x = (screen_width // 2) - (width // 2)
-    y = (screen_height // 2) - (height // 2)
-    window.geometry(f'{width}x{height}+{x}+{y}')
-
-def show_success_message(file_path):
-    if messagebox.askyesno(
-        "Success",
-        f"Download completed successfully. The file(s) are located at {file_path}.\n\nDo you want to open the file location?"
-    ):
-        open_file_location(file_path)
-
-def open_file_location(file_path):
-    if not os.path.exists(file_path):
-        messagebox.showerror("Error", "The path does not exist.")
-        return
-
-    if os.name == 'nt':  # For Windows
-        normalized_path = os.path.normpath(file_path)
-        subprocess.run(['explorer', '/select,', normalized_path], shell=True)
-    elif os.name == 'posix':  # For MacOS
-        subprocess.run(['open', '-R', file_path])
-    else:  # Assume Linux
-        directory = os.path.dirname(file_path)
-        subprocess.run(['xdg-open', directory])
-
-def is_youtube_link_valid(url):
+# Function to name the file a stream of a video is downloaded to before it is
+# converted or merged, e.g. "Title_dQw4w9WgXcQ_audio". The video ID keeps
+# videos whose titles sanitize to the same name apart.
+def temp_filename(title, video_id, suffix):
+    return f"{sanitize_filename(title)}_{video_id}_{suffix}"
+
+# Function to read a time such as "90", "1:30" or "1:02:03.5" as seconds
+def parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        parts = str(value).strip().split(':')
+        if not 1 <= len(parts) <= 3:
+            raise ValueError(f"Invalid time: {value}")
+        try:
+            seconds = 0.0
+            for part in parts:
+                seconds = seconds * 60 + float(part)
+        except ValueError:
+            raise ValueError(f"Invalid time: {value}")
+    if seconds < 0:
+        raise ValueError(f"Invalid time: {value}")
+    return seconds
+
+# Function to turn optional start/end times into a clip (start, end) in
+# seconds; end None means until the end. Returns None when neither is given.
+def parse_clip(start=None, end=None):
+    if start is None and end is None:
+        return None
+    start = parse_timestamp(start) if start is not None else 0.0
+    end = parse_timestamp(end) if end is not None else None
+    if end is not None and end <= start:
+        raise ValueError("The clip end must come after its start")
+    return start, end
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+# File name suffix for a clip, e.g. "_clip_90-120"; empty without a clip
+def clip_suffix(clip):
+    if clip is None:
+        return ""
+    start, end = clip
+    return f"_clip_{int(start)}-{int(end) if end is not None else 'end'}"
+
+# Function to describe a clip for the log, with the share of a video of the
+# given length (seconds) it covers, e.g. "0:01:30-0:02:00 (0.3% of the video)"
+def describe_clip(clip, length=None):
+    start, end = clip
+    text = f"{_format_seconds(start)}-{_format_seconds(end) if end is not None else 'end'}"
+    if length:
+        share = ((end if end is not None else length) - start) / length
+        text += f" ({max(0.0, min(share, 1.0)) * 100:.1f}% of the video)"
+    return text
+
+def is_youtube_link_valid(url, offline=False):
     """
     Returns:
       - "valid": if the link is a valid YouTube video
-      - "invalid_regex": if there's a known regex error
+      - "invalid_regex": if the link is malformed (checked locally, no network)
       - "invalid_failed": if something else went wrong
+
+    With offline=True only the link itself is checked, the video isn't fetched.
     """
+    if video_id_from_url(url) is None:
+        return "invalid_regex"
+    if offline:
+        return "valid"
     try:
-        _ = YouTube(
-            url,
-            client='WEB_EMBEDDED_PLAYER',
-            use_po_token=True,
-            token_file= get_token_file_path()
-        )
+        from helpers.resolver import resolve_video  # local import to avoid a circular import
+        _ = resolve_video(url)
         return "valid"
     except Exception as e:
         if "regex" in str(e):
@@ -87,49 +119,17 @@ def is_youtube_link_valid(url):
         else:
             return "invalid_failed"
 
-def is_youtube_playlist_link_valid(url):
+def is_youtube_playlist_link_valid(url, offline=False):
+    if playlist_id_from_url(url) is None:
+        return "invalid_regex"
+    if offline:
+        return "valid"
     try:
-        _ = Playlist(
-            url,
-            client='WEB_EMBEDDED_PLAYER',
-            use_po_token=True,
-            token_file= get_token_file_path()
-        )
+        from helpers.resolver import resolve_playlist  # local import to avoid a circular import
+        _ = resolve_playlist(url)
         return "valid"
     except Exception as e:
         if "regex" in str(e):
             return "invalid_regex"
         else:
             return "invalid_failed"
-
-# Toast logic to show a quick message under a button
-current_toast = None
-def show_toast(root, message, button):
-    global current_toast
-    if current_toast is not None:
-        current_toast.destroy()
-
-    toast = tk.Toplevel(root)
-    toast.overrideredirect(True)
-    toast.attributes("-topmost", True)
-    current_toast = toast
-
-    label = tk.Label(toast, text=message, bg="lightyellow", relief=tk.SOLID, bd=1, padx=5, pady=2)
-    label.pack(expand=True, fill=tk.BOTH)
-
-    toast.update_idletasks()
-    toast_width = label.winfo_reqwidth() + 10
-
-    button_x = button.winfo_rootx() + (button.winfo_width() // 2) - (toast_width // 2)
-    button_y = button.winfo_rooty() + button.winfo_height()
-    toast.geometry(f"{toast_width}x30+{button_x}+{button_y}")
-
-    if hasattr(toast, "timer"):
-        root.after_cancel(toast.timer)
-    toast.timer = toast.after(1300, lambda: destroy_toast(toast))
-
-def destroy_toast(toast):
-    global current_toast
-    if toast == current_toast:
-        toast.destroy()
-        current_toast = None
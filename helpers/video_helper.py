@@ -1,168 +1,232 @@
 # helpers/video_helper.py
 
 import os
-import subprocess
-import tkinter as tk
-from tkinter import messagebox
-from pytubefix import YouTube
-from helpers.utils import sanitize_filename, get_ffmpeg_path, get_token_file_path, show_success_message
+from concurrent.futures import ThreadPoolExecutor
+from helpers.utils import sanitize_filename, temp_filename, clip_suffix, describe_clip
+from helpers.progress import TransferMeter
+from helpers.resolver import resolve_video
+from helpers.ranged_downloader import download_stream
+from helpers.ffmpeg_helper import mux_streams, merge_files, plan_codec_args, stream_codecs, clip_streams
+from helpers.metrics import span
+from helpers.output_store import reuse_output, remember_output
+from helpers.stream_policy import (
+    DEFAULT_POLICY,
+    select_video_stream,
+    select_audio_stream,
+    explain_selection,
+    stream_size,
+)
+
+# Merge while downloading instead of saving the video and audio streams first
+STREAM_MUX = True
+
+# ffmpeg's default AAC bitrate in kbps, which re-encoded merged audio ends up
+# at; an AAC source at this bitrate is copied instead
+MUX_AUDIO_BITRATE = 128
+
+# Output store key of a merged mp4: (both itags, profile with the resolution)
+def mp4_store_key(video_stream, audio_stream):
+    return f"{video_stream.itag}+{audio_stream.itag}", f"mp4-{video_stream.resolution}"
 
 # ----------------- Video Download Functions -----------------
 def get_available_resolutions(youtube_link):
     try:
-        yt = YouTube(
-            youtube_link,
-            client='WEB_EMBEDDED_PLAYER',
-            use_po_token=True,
-            token_file= get_token_file_path()
-        )
+        yt = resolve_video(youtube_link)
         video_streams = yt.streams.filter(file_extension='mp4', progressive=False).order_by('resolution').desc()
 
         unique_resolutions = []
-        filtered_streams = []
+        streams_by_resolution = {}
 
         for stream in video_streams:
             if stream.resolution not in unique_resolutions:
                 unique_resolutions.append(stream.resolution)
-                filtered_streams.append(stream)
+            streams_by_resolution.setdefault(stream.resolution, []).append(stream)
+
+        # Of several mp4 streams at one resolution (H.264, AV1...) offer the smallest
+        filtered_streams = [
+            min(streams_by_resolution[resolution], key=lambda s: stream_size(s) or float("inf"))
+            for resolution in unique_resolutions
+        ]
 
         return unique_resolutions, filtered_streams
 
     except Exception as e:
         return str(e), []
 
-def download_video(youtube_link, selected_stream, output_dir, progress_var, progress_text_widget):
+def download_video(youtube_link, selected_stream, output_dir, progress, on_bytes=None):
     try:
-        yt = YouTube(
-            youtube_link,
-            client='WEB_EMBEDDED_PLAYER',
-            use_po_token=True,
-            token_file= get_token_file_path()
-        )
-        sanitized_title = sanitize_filename(yt.title)
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, "Downloading video...\n")
-        progress_text_widget.config(state=tk.DISABLED)
-        progress_var.set(50)
-
-        video_file = selected_stream.download(output_path=output_dir, filename=f"{sanitized_title}_video.mp4")
-        progress_var.set(80)
+        yt = resolve_video(youtube_link)
+        progress.log("Downloading video...")
+
+        video_file = download_stream(selected_stream, output_dir, temp_filename(yt.title, yt.video_id, "video.mp4"), on_bytes=on_bytes)
         return video_file
     except Exception as e:
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, f"Download failed: {e}\n")
-        progress_text_widget.config(state=tk.DISABLED)
+        progress.log(f"Download failed: {e}")
         return str(e)
 
-def download_audio(youtube_link, output_dir, progress_var, progress_text_widget):
+def download_audio(youtube_link, output_dir, progress, policy=DEFAULT_POLICY, on_bytes=None):
     try:
-        yt = YouTube(
-            youtube_link,
-            client='WEB_EMBEDDED_PLAYER',
-            use_po_token=True,
-            token_file= get_token_file_path()
-        )
-
-        # Get the audio stream with the highest available bitrate
-        audio_stream = yt.streams.filter(only_audio=True).order_by('abr').desc().first()
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, "Downloading audio...\n")
-        progress_text_widget.config(state=tk.DISABLED)
-        progress_var.set(30)
-
-        sanitized_title = sanitize_filename(yt.title)
-        audio_file = audio_stream.download(output_path=output_dir, filename=f"{sanitized_title}_audio")
-        progress_var.set(60)
+        yt = resolve_video(youtube_link)
+
+        # Get the smallest audio stream that still covers the merged AAC track
+        audio_stream = select_audio_stream(yt.streams, policy, MUX_AUDIO_BITRATE).stream
+        progress.log("Downloading audio...")
+
+        audio_file = download_stream(audio_stream, output_dir, temp_filename(yt.title, yt.video_id, "audio"), on_bytes=on_bytes)
 
         return audio_file
     except Exception as e:
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, f"Download failed: {e}\n")
-        progress_text_widget.config(state=tk.DISABLED)
+        progress.log(f"Download failed: {e}")
         return str(e)
 
-def merge_video_and_audio_simple(video_file, audio_file, output_file, progress_text_widget):
+def is_downloaded_file(result):
+    # The download helpers return the file path on success and the error text on failure
+    return isinstance(result, str) and os.path.isfile(result)
+
+# Function to fetch the video and audio streams of one video at the same time.
+# If either transfer fails the other one's file is removed, so a failed job
+# doesn't leave half a pair behind. Both transfers feed one byte count, which
+# takes the bar to 80%; the merge does the rest.
+def download_video_and_audio(youtube_link, selected_stream, output_dir, progress, policy=DEFAULT_POLICY):
+    try:
+        audio_stream = select_audio_stream(resolve_video(youtube_link).streams, policy, MUX_AUDIO_BITRATE).stream
+        total = (stream_size(selected_stream) or 0) + (stream_size(audio_stream) or 0)
+    except Exception:
+        # download_audio reports the actual error
+        total = None
+    meter = TransferMeter(progress, total or None, 0, 80, label="Downloading video and audio")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        video_future = executor.submit(download_video, youtube_link, selected_stream, output_dir, progress, meter.add)
+        audio_future = executor.submit(download_audio, youtube_link, output_dir, progress, policy, meter.add)
+        video_file = video_future.result()
+        audio_file = audio_future.result()
+    meter.finish()
+
+    if is_downloaded_file(video_file) != is_downloaded_file(audio_file):
+        leftover = video_file if is_downloaded_file(video_file) else audio_file
+        with span("cleanup"):
+            os.remove(leftover)
+    return video_file, audio_file
+
+# Function to download and merge video and audio in one go: both streams are
+# piped into a single ffmpeg process, so no _video/_audio files hit the disk.
+# With clip = (start, end) seconds only that part of both streams is fetched.
+def download_and_merge_streams(youtube_link, selected_stream, output_file, progress, policy=DEFAULT_POLICY, clip=None):
+    try:
+        yt = resolve_video(youtube_link)
+
+        # Get the smallest audio stream that still covers the merged AAC track
+        selection = select_audio_stream(yt.streams, policy, MUX_AUDIO_BITRATE)
+        audio_stream = selection.stream
+        progress.log(explain_selection(selection))
+        # Copy whatever tracks the mp4 can take as they are
+        codec_args, decisions = plan_codec_args("mp4", stream_codecs(selected_stream, audio_stream))
+        progress.log(f"Downloading and merging video and audio ({decisions})...")
+
+        if clip is not None:
+            progress.log(f"Clip {describe_clip(clip, yt.length)}, starting at the keyframe before it")
+            meter = TransferMeter(progress, end=95, label="Cutting clip", unit="seconds")
+            clip_streams([selected_stream, audio_stream], output_file, clip, codec_args, meter.update, yt.length)
+        else:
+            total = (stream_size(selected_stream) or 0) + (stream_size(audio_stream) or 0)
+            meter = TransferMeter(progress, total or None, end=95, label="Downloading and merging")
+            mux_streams(selected_stream, audio_stream, output_file, codec_args, meter.add)
+        meter.finish()
+        progress.log("Merging successful.")
+
+        return os.path.normpath(output_file)
+    except Exception as e:
+        progress.log(f"Merging failed: {e}")
+        return str(e)
+
+def merge_video_and_audio_simple(video_file, audio_file, output_file, progress):
     try:
         normalized_mp4_file = os.path.normpath(output_file) 
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, "Merging video and audio...\n")
-        progress_text_widget.config(state=tk.DISABLED)
-        
-        ffmpeg_path = get_ffmpeg_path()
-        command = f'"{ffmpeg_path}" -y -i "{video_file}" -i "{audio_file}" -c:v copy -c:a aac "{output_file}"'
-        
-        subprocess.run(command, shell=True, check=True)
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, f"Merging successful.\n")
-        progress_text_widget.config(state=tk.DISABLED)
+        progress.log("Merging video and audio...")
+
+        meter = TransferMeter(progress, start=80, end=95, label="Merging", unit="seconds")
+        decisions = merge_files(video_file, audio_file, output_file, meter.update)
+        meter.finish()
+        progress.log(f"Merging successful ({decisions}).")
 
         # Delete the temporary video and audio files
-        os.remove(video_file)
-        os.remove(audio_file)
+        with span("cleanup"):
+            os.remove(video_file)
+            os.remove(audio_file)
         
         normalized_mp4_file = os.path.normpath(normalized_mp4_file)
         return normalized_mp4_file
     except Exception as e:
-        progress_text_widget.config(state=tk.NORMAL)
-        progress_text_widget.insert(tk.END, f"Merging failed: {e}\n")
-        progress_text_widget.config(state=tk.DISABLED)
+        progress.log(f"Merging failed: {e}")
 
-def start_process_video(youtube_link, resolution_choice, output_dir, progress_var, progress_text_widget, loading_window):
-    resolutions, video_streams = get_available_resolutions(youtube_link)
+# available is the (resolutions, streams) pair from get_available_resolutions
+# when the caller already has it; clip = (start, end) seconds limits the
+# download to that part of the video
+def start_process_video(youtube_link, resolution_choice, output_dir, progress, streaming=STREAM_MUX, available=None, policy=DEFAULT_POLICY, clip=None):
+    resolutions, video_streams = available or get_available_resolutions(youtube_link)
     if isinstance(resolutions, str):
-        messagebox.showerror("Error", f"Failed to get resolutions: {resolutions}")
-        loading_window.destroy()
+        progress.error(f"Failed to get resolutions: {resolutions}")
         return
 
     selected_stream = video_streams[resolution_choice]
     selected_resolution = resolutions[resolution_choice]
 
-    video_file = download_video(youtube_link, selected_stream, output_dir, progress_var, progress_text_widget)
-    if isinstance(video_file, str) and "failed" in video_file.lower():
-        messagebox.showerror("Error", f"Failed to download video: {video_file}")
-        loading_window.destroy()
+    try:
+        yt = resolve_video(youtube_link)
+        output_file = os.path.join(output_dir, f"{sanitize_filename(yt.title)}_{selected_resolution}{clip_suffix(clip)}.mp4")
+    except Exception as e:
+        progress.error(f"Failed to load video: {e}")
+        return
+
+    store_key = None
+    if clip is None:
+        try:
+            store_key = mp4_store_key(selected_stream, select_audio_stream(yt.streams, policy, MUX_AUDIO_BITRATE).stream)
+        except Exception:
+            # The download reports the actual error
+            pass
+    if store_key is not None and reuse_output(yt.video_id, *store_key, output_file, progress):
+        progress.set(100)
+        progress.log("Download Complete!")
+        progress.log(f"File saved to: {output_file}")
+        progress.finished(output_file)
         return
 
-    audio_file = download_audio(youtube_link, output_dir, progress_var, progress_text_widget)
-    if isinstance(audio_file, str) and "failed" in audio_file.lower():
-        messagebox.showerror("Error", f"Failed to download audio: {audio_file}")
-        loading_window.destroy()
+    # Clips are always cut by ffmpeg straight from the stream URLs
+    if streaming or clip is not None:
+        merged_file = download_and_merge_streams(youtube_link, selected_stream, output_file, progress, policy, clip)
+        if not is_downloaded_file(merged_file):
+            progress.error(f"Failed to download video: {merged_file}")
+            return
+    else:
+        video_file, audio_file = download_video_and_audio(youtube_link, selected_stream, output_dir, progress, policy)
+        if not is_downloaded_file(video_file):
+            progress.error(f"Failed to download video: {video_file}")
+            return
+
+        if not is_downloaded_file(audio_file):
+            progress.error(f"Failed to download audio: {audio_file}")
+            return
+
+        merged_file = merge_video_and_audio_simple(video_file, audio_file, output_file, progress)
+
+    if merged_file is None:
+        progress.error("Merging failed.")
         return
 
-    from pytubefix import YouTube as YTCheck  # local import to avoid confusion
-    title_yt = YTCheck(
-        youtube_link,
-        client='WEB_EMBEDDED_PLAYER',
-        use_po_token=True,
-        token_file= get_token_file_path()
-    ).title
-    
-    output_file = os.path.join(output_dir, f"{sanitize_filename(title_yt)}_{selected_resolution}.mp4")
-    merged_file = merge_video_and_audio_simple(video_file, audio_file, output_file, progress_text_widget)
-
-    progress_var.set(100)
-    progress_text_widget.config(state=tk.NORMAL)
-    progress_text_widget.insert(tk.END, "Download Complete!\n")
-    loading_window.title("Finished")
-    progress_text_widget.config(state=tk.DISABLED)
-
-    progress_text_widget.config(state=tk.NORMAL)
-    progress_text_widget.insert(tk.END, f"File saved to: {merged_file}\n")
-    progress_text_widget.config(state=tk.DISABLED)
-    loading_window.update_idletasks()
-
-    show_success_message(merged_file)
-
-def get_highest_resolution(youtube_link):
+    if store_key is not None:
+        remember_output(yt.video_id, *store_key, merged_file, progress)
+    progress.set(100)
+    progress.log("Download Complete!")
+    progress.log(f"File saved to: {merged_file}")
+    progress.finished(merged_file)
+
+# Function to get the video stream the policy picks: by default the highest
+# resolution, in its smallest mp4 encoding
+def get_highest_resolution(youtube_link, policy=DEFAULT_POLICY):
     try:
-        yt = YouTube(
-            youtube_link,
-            client='WEB_EMBEDDED_PLAYER',
-            use_po_token=True,
-            token_file= get_token_file_path()
-        )
-        video_streams = yt.streams.filter(file_extension='mp4').order_by('resolution').desc()
-        highest_resolution = video_streams.first()
-        return highest_resolution
+        yt = resolve_video(youtube_link)
+        selection = select_video_stream(yt.streams, policy)
+        return selection.stream if selection else None
     except Exception:
         return None
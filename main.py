@@ -1,17 +1,27 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from threading import Thread
 import os
-from pytubefix import YouTube
 
 # Import helper functions
 from helpers.utils import (
     sanitize_filename,
-    center_window,
     is_youtube_link_valid,
     is_youtube_playlist_link_valid,
+)
+from helpers.gui_utils import (
+    center_window,
     show_toast,
-    get_token_file_path
+    BackgroundTask,
+    LogView,
+    TkProgress,
+)
+from helpers.log_buffer import (
+    LogBuffer,
+    new_log_path,
+)
+from helpers.resolver import (
+    resolve_video,
+    resolve_playlist,
 )
 from helpers.audio_helper import (
     start_download_audio,
@@ -23,11 +33,53 @@ from helpers.video_helper import (
     get_available_resolutions,
     start_process_video,
 )
+from helpers.job_journal import (
+    FAILED,
+    JobJournal,
+    JournalProgress,
+)
+from helpers.async_engine import AsyncEngine
+from helpers.output_store import STORE_DIR, STORE_ENV, enable_store
 
 # ----------------- Main Application Window -----------------
 
 def on_closing():
     window.destroy()
+    engine.stop()
+
+class InvalidLinkError(Exception):
+    pass
+
+# Function to run probe() (link validation, title or resolution lookup) off
+# the UI thread. While it runs the status label shows "Resolving..." and the
+# submit button turns into a Cancel button; on_resolved gets the result on
+# the UI thread, on_failed the exception. A canceled probe is ignored.
+def resolve_in_background(parent_window, submit_button, status_label, probe, on_resolved, on_failed):
+    submit_text = submit_button.cget("text")
+    # Tk hands back the name of the registered callback, which can be set again as is
+    submit_command = submit_button.cget("command")
+
+    def restore(status_text=""):
+        if submit_button.winfo_exists():
+            submit_button.config(text=submit_text, command=submit_command)
+            status_label.config(text=status_text)
+
+    def resolved(result):
+        restore()
+        on_resolved(result)
+
+    def failed(error):
+        restore()
+        on_failed(error)
+
+    def cancel():
+        task.cancel()
+        restore("Canceled.")
+
+    task = BackgroundTask(parent_window, probe, resolved, failed)
+    status_label.config(text="Resolving\u2026")
+    submit_button.config(text="Cancel", command=cancel)
+    return task
 
 # Function to handle the audio download button
 def run_audio_script():
@@ -41,86 +93,80 @@ def run_audio_script():
     entry = tk.Entry(root, width=50)
     entry.pack(pady=5)
 
-    tk.Button(root, text="Download", command=lambda: on_submit_audio(entry, root)).pack(pady=10)
+    submit_button = tk.Button(root, text="Download", command=lambda: on_submit_audio(entry, root, submit_button))
+    submit_button.pack(pady=10)
 
     result_label_audio = tk.Label(root, text="")
     result_label_audio.pack(pady=10)
 
-def on_submit_audio(entry, parent_window):
+def on_submit_audio(entry, parent_window, submit_button):
     youtube_link = entry.get()
     if youtube_link:
-        if is_youtube_link_valid(youtube_link) != "valid":
-            messagebox.showerror("Invalid Link", "The provided YouTube link is invalid. Please enter a valid link.")
-            return
-        try:
-            yt = YouTube(
-                youtube_link,
-                client='WEB_EMBEDDED_PLAYER',
-                use_po_token=True,
-                token_file= get_token_file_path()
-            )
-            sanitized_title = sanitize_filename(yt.title)
-        except Exception:
-            messagebox.showerror("Invalid Link", "The provided YouTube link is invalid. Please enter a valid link.")
-            return
+        def probe():
+            if is_youtube_link_valid(youtube_link) != "valid":
+                raise InvalidLinkError(youtube_link)
+            return sanitize_filename(resolve_video(youtube_link).title)
 
-        initial_dir = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
-        output_dir = filedialog.askdirectory(initialdir=initial_dir, title="Select Download Folder", parent=parent_window)
+        def on_failed(error):
+            messagebox.showerror("Invalid Link", "The provided YouTube link is invalid. Please enter a valid link.", parent=parent_window)
 
-        if not output_dir:
-            return
+        resolve_in_background(
+            parent_window, submit_button, result_label_audio, probe,
+            lambda sanitized_title: on_audio_resolved(youtube_link, parent_window, sanitized_title),
+            on_failed,
+        )
+    else:
+        messagebox.showerror("Error", "Please enter a valid YouTube link.")
 
-        mp3_file_path = os.path.join(output_dir, f"{sanitized_title}.mp3")
+def on_audio_resolved(youtube_link, parent_window, sanitized_title):
+    initial_dir = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+    output_dir = filedialog.askdirectory(initialdir=initial_dir, title="Select Download Folder", parent=parent_window)
 
-        override = True
-        if os.path.exists(mp3_file_path):
-            should_override = messagebox.askyesno("File Exists", f"'{sanitized_title}.mp3' already exists. Do you want to override it?", parent=parent_window)
-            if not should_override:
-                return
-            else:
-                override = True
+    if not output_dir:
+        return
 
-        # Create the loading window
-        loading_window = tk.Toplevel(parent_window)
-        loading_window.title("Processing")
-        loading_window.geometry("400x300")
-        loading_window.transient(parent_window)
-        loading_window.grab_set()
-        center_window(loading_window, 400, 300)
+    mp3_file_path = os.path.join(output_dir, f"{sanitized_title}.mp3")
 
-        progress_var = tk.IntVar()
+    override = True
+    if os.path.exists(mp3_file_path):
+        should_override = messagebox.askyesno("File Exists", f"'{sanitized_title}.mp3' already exists. Do you want to override it?", parent=parent_window)
+        if not should_override:
+            return
+        else:
+            override = True
 
-        main_frame = tk.Frame(loading_window)
-        main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=0)
+    # Create the loading window
+    loading_window = tk.Toplevel(parent_window)
+    loading_window.title("Processing")
+    loading_window.geometry("400x300")
+    loading_window.transient(parent_window)
+    loading_window.grab_set()
+    center_window(loading_window, 400, 300)
 
-        text_frame = tk.Frame(main_frame)
-        text_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+    progress_var = tk.IntVar()
 
-        progress_text_widget = tk.Text(text_frame, height=10, width=50, wrap=tk.WORD, state=tk.DISABLED)
-        progress_text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    main_frame = tk.Frame(loading_window)
+    main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=0)
 
-        scrollbar = tk.Scrollbar(text_frame, command=progress_text_widget.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        progress_text_widget.config(yscrollcommand=scrollbar.set)
+    log_view = LogView(main_frame)
+    log_view.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
 
-        progress_frame = tk.Frame(main_frame)
-        progress_frame.pack(side=tk.BOTTOM, fill=tk.X)
+    progress_frame = tk.Frame(main_frame)
+    progress_frame.pack(side=tk.BOTTOM, fill=tk.X)
 
-        progress_bar = ttk.Progressbar(progress_frame, orient="horizontal", length=300, mode="determinate", variable=progress_var)
-        progress_bar.pack(side=tk.BOTTOM, pady=(15, 15))
+    progress_bar = ttk.Progressbar(progress_frame, orient="horizontal", length=300, mode="determinate", variable=progress_var)
+    progress_bar.pack(side=tk.BOTTOM, pady=(15, 15))
 
-        thread = Thread(target=start_download_audio, args=(youtube_link, output_dir, progress_var, progress_text_widget, loading_window, override))
-        thread.start()
-    else:
-        messagebox.showerror("Error", "Please enter a valid YouTube link.")
+    progress = TkProgress(progress_var, log_view, loading_window)
+    engine.submit_job(start_download_audio, youtube_link, output_dir, progress, override)
 
 # Function to handle the playlist download button
 def run_playlist_script():
     global result_label_playlist, start_button_playlist
     root = tk.Toplevel(window)
     root.title("YouTube Playlist Downloader")
-    root.geometry("400x200")
-    center_window(root, 400, 200)
+    root.geometry("400x230")
+    center_window(root, 400, 230)
 
     tk.Label(root, text="Enter the YouTube playlist link:").pack(pady=10)
 
@@ -131,64 +177,99 @@ def run_playlist_script():
     tk.Radiobutton(root, text="Download audio as .mp3", variable=download_type_var, value=1).pack(anchor=tk.W)
     tk.Radiobutton(root, text="Download video at the highest resolution", variable=download_type_var, value=2).pack(anchor=tk.W)
 
-    start_button_playlist = tk.Button(root, text="Start Download", command=lambda: on_submit_playlist(entry, root, download_type_var))
+    sync_var = tk.BooleanVar(value=False)
+    tk.Checkbutton(root, text="Sync folder (only download new or changed items)", variable=sync_var).pack(anchor=tk.W)
+
+    start_button_playlist = tk.Button(root, text="Start Download", command=lambda: on_submit_playlist(entry, root, download_type_var, sync_var))
     start_button_playlist.pack(pady=10)
 
     result_label_playlist = tk.Label(root, text="")
     result_label_playlist.pack(pady=10)
 
-def on_submit_playlist(entry, parent_window, download_type_var):
+def on_submit_playlist(entry, parent_window, download_type_var, sync_var):
     youtube_link = entry.get()
     download_type = download_type_var.get()
+    sync = sync_var.get()
 
     if download_type == -1:
         show_toast(parent_window, "Please select an option", start_button_playlist)
         return
 
     if youtube_link:
-        if is_youtube_playlist_link_valid(youtube_link) != "valid":
-            show_toast(parent_window, "Please enter a valid YouTube playlist link", start_button_playlist)
-            return
-
-        initial_dir = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
-        output_dir = filedialog.askdirectory(initialdir=initial_dir, title="Select Download Folder", parent=parent_window)
-
-        if not output_dir:
-            show_toast(parent_window, "Download canceled.", start_button_playlist)
-            return
-
-        loading_window = tk.Toplevel(parent_window)
-        loading_window.title("Processing")
-        loading_window.geometry("400x300")
-        loading_window.transient(parent_window)
-        loading_window.grab_set()
-        center_window(loading_window, 400, 300)
-
-        progress_var = tk.IntVar()
-
-        main_frame = tk.Frame(loading_window)
-        main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=0)
+        def probe():
+            if is_youtube_playlist_link_valid(youtube_link) != "valid":
+                raise InvalidLinkError(youtube_link)
+            # Loads the playlist page, so a link to a missing playlist fails here
+            return resolve_playlist(youtube_link).title
 
-        text_frame = tk.Frame(main_frame)
-        text_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        def on_failed(error):
+            show_toast(parent_window, "Please enter a valid YouTube playlist link", start_button_playlist)
 
-        progress_text_widget = tk.Text(text_frame, height=10, width=50, wrap=tk.WORD, state=tk.DISABLED)
-        progress_text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        resolve_in_background(
+            parent_window, start_button_playlist, result_label_playlist, probe,
+            lambda playlist_title: on_playlist_resolved(youtube_link, parent_window, download_type, sync),
+            on_failed,
+        )
+    else:
+        show_toast(parent_window, "Please enter a YouTube playlist link", start_button_playlist)
 
-        scrollbar = tk.Scrollbar(text_frame, command=progress_text_widget.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        progress_text_widget.config(yscrollcommand=scrollbar.set)
+def on_playlist_resolved(youtube_link, parent_window, download_type, sync):
+    initial_dir = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+    output_dir = filedialog.askdirectory(initialdir=initial_dir, title="Select Download Folder", parent=parent_window)
 
-        progress_frame = tk.Frame(main_frame)
-        progress_frame.pack(side=tk.BOTTOM, fill=tk.X)
-
-        progress_bar = ttk.Progressbar(progress_frame, orient="horizontal", length=300, mode="determinate", variable=progress_var)
-        progress_bar.pack(side=tk.BOTTOM, pady=(15, 15))
+    if not output_dir:
+        show_toast(parent_window, "Download canceled.", start_button_playlist)
+        return
 
-        thread = Thread(target=start_download_playlist, args=(youtube_link, output_dir, progress_var, progress_text_widget, loading_window, download_type))
-        thread.start()
-    else:
-        show_toast(parent_window, "Please enter a YouTube playlist link", start_button_playlist)
+    job = None
+    if journal is not None:
+        kind = "playlist-audio" if download_type == 1 else "playlist-video"
+        job = journal.add_job(kind, youtube_link, output_dir, {"sync": sync})
+    start_playlist_download(parent_window, youtube_link, output_dir, download_type, sync, job)
+
+# Function to open the progress window of a playlist download and start it.
+# With a journal job the items are recorded, so the download can be resumed
+# after the app was closed or crashed.
+def start_playlist_download(parent_window, youtube_link, output_dir, download_type, sync, job=None):
+    loading_window = tk.Toplevel(parent_window)
+    loading_window.title("Processing")
+    loading_window.geometry("400x300")
+    loading_window.transient(parent_window)
+    loading_window.grab_set()
+    center_window(loading_window, 400, 300)
+
+    progress_var = tk.IntVar()
+
+    main_frame = tk.Frame(loading_window)
+    main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=0)
+
+    # Playlists can log thousands of lines; the window keeps the last ones
+    # and the whole log goes to a file
+    log_view = LogView(main_frame, LogBuffer(spill_path=new_log_path("playlist")))
+    log_view.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+    progress_frame = tk.Frame(main_frame)
+    progress_frame.pack(side=tk.BOTTOM, fill=tk.X)
+
+    progress_bar = ttk.Progressbar(progress_frame, orient="horizontal", length=300, mode="determinate", variable=progress_var)
+    progress_bar.pack(side=tk.BOTTOM, pady=(15, 15))
+
+    progress = TkProgress(progress_var, log_view, loading_window)
+    if job is not None:
+        progress = JournalProgress(progress, job)
+    engine.submit_job(start_download_playlist, youtube_link, output_dir, progress, download_type, sync=sync, job=job, engine=engine)
+
+# Function to offer resuming the playlist downloads a previous run didn't finish
+def offer_resume():
+    for info in journal.unfinished_jobs():
+        if info["kind"] not in ("playlist-audio", "playlist-video"):
+            continue
+        job = journal.job(info["id"])
+        if not messagebox.askyesno("Resume Download", f"A playlist download was interrupted:\n{info['url']}\n\nResume it?", parent=window):
+            job.set_state(FAILED, error="Not resumed")
+            continue
+        download_type = 1 if info["kind"] == "playlist-audio" else 2
+        start_playlist_download(window, info["url"], info["output_dir"], download_type, info["options"].get("sync", False), job)
 
 # Function to handle the video download button
 def run_video_script():
@@ -203,84 +284,113 @@ def run_video_script():
     entry = tk.Entry(root, width=50)
     entry.pack(pady=5)
 
-    tk.Button(root, text="Start Process", command=lambda: on_submit_video(entry, root)).pack(pady=10)
+    submit_button = tk.Button(root, text="Start Process", command=lambda: on_submit_video(entry, root, submit_button))
+    submit_button.pack(pady=10)
 
     result_label_video = tk.Label(root, text="")
     result_label_video.pack(pady=10)
 
-def on_submit_video(entry, parent_window):
+def on_submit_video(entry, parent_window, submit_button):
     youtube_link = entry.get()
     if youtube_link:
-        if is_youtube_link_valid(youtube_link) != "valid":
-            messagebox.showerror("Invalid Link", "The provided YouTube link is invalid. Please enter a valid link.", parent=parent_window)
-            return
+        def probe():
+            if is_youtube_link_valid(youtube_link) != "valid":
+                raise InvalidLinkError(youtube_link)
+            resolutions, video_streams = get_available_resolutions(youtube_link)
+            if isinstance(resolutions, str):
+                raise RuntimeError(f"Failed to get resolutions: {resolutions}")
+            return resolutions, video_streams
+
+        def on_failed(error):
+            if isinstance(error, InvalidLinkError):
+                messagebox.showerror("Invalid Link", "The provided YouTube link is invalid. Please enter a valid link.", parent=parent_window)
+            else:
+                messagebox.showerror("Error", str(error), parent=parent_window)
+
+        resolve_in_background(
+            parent_window, submit_button, result_label_video, probe,
+            lambda available: on_video_resolved(youtube_link, parent_window, available),
+            on_failed,
+        )
+    else:
+        messagebox.showerror("Error", "Please enter a valid YouTube link.", parent=parent_window)
 
-        initial_dir = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
-        output_dir = filedialog.askdirectory(initialdir=initial_dir, title="Select Download Folder", parent=parent_window)
+# The resolutions and streams found while resolving are handed on to the
+# download job, so nothing is fetched twice
+def on_video_resolved(youtube_link, parent_window, available):
+    resolutions, video_streams = available
 
-        if not output_dir:
-            result_label_video.config(text="Download canceled.")
-            return
+    initial_dir = os.path.abspath(os.path.join(os.getcwd(), os.pardir))
+    output_dir = filedialog.askdirectory(initialdir=initial_dir, title="Select Download Folder", parent=parent_window)
 
-        resolutions, video_streams = get_available_resolutions(youtube_link)
-        if isinstance(resolutions, str):
-            messagebox.showerror("Error", f"Failed to get resolutions: {resolutions}")
-            return
+    if not output_dir:
+        result_label_video.config(text="Download canceled.")
+        return
 
-        resolution_window = tk.Toplevel(parent_window)
-        resolution_window.title("Select Resolution")
+    resolution_window = tk.Toplevel(parent_window)
+    resolution_window.title("Select Resolution")
 
-        num_resolutions = len(resolutions)
-        button_height = 40
-        resolution_window_height = max(150, 30 * num_resolutions + button_height + 20)
+    num_resolutions = len(resolutions)
+    button_height = 40
+    resolution_window_height = max(150, 30 * num_resolutions + button_height + 20)
 
-        resolution_window.geometry(f"300x{resolution_window_height}")
-        center_window(resolution_window, 300, resolution_window_height)
+    resolution_window.geometry(f"300x{resolution_window_height}")
+    center_window(resolution_window, 300, resolution_window_height)
 
-        tk.Label(resolution_window, text="Select the resolution:").pack(pady=10)
+    tk.Label(resolution_window, text="Select the resolution:").pack(pady=10)
 
-        resolution_var = tk.IntVar(value=0)
-        for idx, resolution in enumerate(resolutions):
-            tk.Radiobutton(resolution_window, text=resolution, variable=resolution_var, value=idx).pack(anchor="w")
+    resolution_var = tk.IntVar(value=0)
+    for idx, resolution in enumerate(resolutions):
+        tk.Radiobutton(resolution_window, text=resolution, variable=resolution_var, value=idx).pack(anchor="w")
 
-        def on_resolution_select():
-            resolution_choice = resolution_var.get()
-            resolution_window.destroy()
+    def on_resolution_select():
+        resolution_choice = resolution_var.get()
+        resolution_window.destroy()
 
-            loading_window = tk.Toplevel(parent_window)
-            loading_window.title("Processing")
-            loading_window.geometry("400x300")
-            loading_window.transient(parent_window)
-            loading_window.grab_set()
-            center_window(loading_window, 400, 300)
+        loading_window = tk.Toplevel(parent_window)
+        loading_window.title("Processing")
+        loading_window.geometry("400x300")
+        loading_window.transient(parent_window)
+        loading_window.grab_set()
+        center_window(loading_window, 400, 300)
 
-            progress_var = tk.IntVar()
+        progress_var = tk.IntVar()
 
-            main_frame = tk.Frame(loading_window)
-            main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=0)
+        main_frame = tk.Frame(loading_window)
+        main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=0)
 
-            text_frame = tk.Frame(main_frame)
-            text_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        log_view = LogView(main_frame)
+        log_view.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+        progress_frame = tk.Frame(main_frame)
+        progress_frame.pack(side=tk.BOTTOM, fill=tk.X)
 
-            progress_text_widget = tk.Text(text_frame, height=10, width=50, wrap=tk.WORD, state=tk.DISABLED)
-            progress_text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        progress_bar = ttk.Progressbar(progress_frame, orient="horizontal", length=300, mode="determinate", variable=progress_var)
+        progress_bar.pack(side=tk.BOTTOM, pady=(15, 15))
 
-            scrollbar = tk.Scrollbar(text_frame, command=progress_text_widget.yview)
-            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-            progress_text_widget.config(yscrollcommand=scrollbar.set)
+        progress = TkProgress(progress_var, log_view, loading_window)
+        engine.submit_job(start_process_video, youtube_link, resolution_choice, output_dir, progress, available=available)
 
-            progress_frame = tk.Frame(main_frame)
-            progress_frame.pack(side=tk.BOTTOM, fill=tk.X)
+    tk.Button(resolution_window, text="Download", command=on_resolution_select).pack(pady=10)
 
-            progress_bar = ttk.Progressbar(progress_frame, orient="horizontal", length=300, mode="determinate", variable=progress_var)
-            progress_bar.pack(side=tk.BOTTOM, pady=(15, 15))
+# Runs every download: jobs wait for a slot as coroutines and playlist items
+# are coroutines of its event loop instead of threads
+engine = AsyncEngine().start()
 
-            thread = Thread(target=start_process_video, args=(youtube_link, resolution_choice, output_dir, progress_var, progress_text_widget, loading_window))
-            thread.start()
+# The journal is optional; without it downloads just can't be resumed
+try:
+    journal = JobJournal()
+except Exception:
+    journal = None
 
-        tk.Button(resolution_window, text="Download", command=on_resolution_select).pack(pady=10)
-    else:
-        messagebox.showerror("Error", "Please enter a valid YouTube link.", parent=parent_window)
+# The output store is opt-in: with YOUTUBE_CONVERTER_STORE set, outputs made
+# before are linked from the store instead of downloaded again
+store_setting = os.environ.get(STORE_ENV)
+if store_setting:
+    try:
+        enable_store(STORE_DIR if store_setting == "1" else store_setting)
+    except Exception:
+        pass
 
 window = tk.Tk()
 window.title("Download YouTube")
@@ -297,4 +407,6 @@ playlist_button = tk.Button(window, text="Playlist link", command=run_playlist_s
 playlist_button.pack(pady=10)
 
 window.protocol("WM_DELETE_WINDOW", on_closing)
+if journal is not None:
+    window.after(200, offer_resume)
 window.mainloop()
@@ -0,0 +1,285 @@
+# server.py
+#
+# Service mode: runs the audio, video and playlist flows for clients on the
+# network over a small JSON HTTP API, without tkinter. Jobs are queued and run
+# in the background; clients poll for status and progress.
+#
+#   python server.py -o /srv/downloads --port 8080 --concurrency 4 --per-client 2
+#
+#   POST   /jobs                 submit a job, answers 202 with its id
+#                                {"kind": "audio", "url": "https://youtu.be/...", "output_dir": "music"}
+#   GET    /jobs                 all jobs, or only one client's with ?client=
+#   GET    /jobs/<id>            state, percent, status line and output of a job
+#   GET    /jobs/<id>/progress   same plus the log lines after ?since=N
+#   GET    /jobs/<id>/result     the outcome, 202 while the job hasn't finished
+#   GET    /jobs/<id>/file       the downloaded file, for jobs producing one
+#   DELETE /jobs/<id>            cancel a job that hasn't started
+#   GET    /health               queue and worker counts
+#
+# Jobs take the same fields as cli.py's job files. output_dir is a folder
+# inside the server's download folder. A client is named by its X-Client-Id
+# header, or by its address; clients take turns for the workers.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from helpers.job_service import JobService, QUEUED, RUNNING
+from helpers.job_journal import JOURNAL_PATH, JobJournal
+from helpers.output_store import STORE_DIR, enable_store
+from helpers.pipeline import CPU_WORKERS
+from cli import run_job, prepare_jobs
+
+# Job fields a client may set; everything else is the server's business
+JOB_FIELDS = (
+    "kind", "url", "output_dir", "resolution", "sync", "prune", "max_height", "codecs",
+    "max_rate", "audio_bitrate", "start", "end", "playlist_workers", "transcode_workers", "streaming",
+)
+
+# What each client field must be; anything else is answered with 400
+TEXT_FIELDS = ("kind", "url", "output_dir", "resolution")
+FLAG_FIELDS = ("sync", "prune", "streaming")
+NUMBER_FIELDS = ("max_height", "max_rate", "audio_bitrate", "playlist_workers", "transcode_workers")
+TIME_FIELDS = ("start", "end")
+
+# Most workers a client's playlist gets; larger counts are lowered to these
+MAX_JOB_WORKERS = {"playlist_workers": 8, "transcode_workers": CPU_WORKERS}
+
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 64 * 1024
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# Function to check a submitted job and turn it into the job dict run_job
+# takes; raises RequestError when it can't be run
+def build_job(body, download_dir):
+    if not isinstance(body, dict) or not body.get("url"):
+        raise RequestError(400, "A job needs at least a url")
+    # A field set to null counts as not given
+    job = {name: body[name] for name in JOB_FIELDS if body.get(name) is not None}
+    _check_fields(job)
+    for name, limit in MAX_JOB_WORKERS.items():
+        if name in job:
+            job[name] = min(job[name], limit)
+
+    # Keep every output inside the download folder
+    root = os.path.realpath(download_dir)
+    output_dir = os.path.realpath(os.path.join(root, str(job.get("output_dir") or "")))
+    if output_dir != root and not output_dir.startswith(root + os.sep):
+        raise RequestError(400, "output_dir must be a folder inside the download folder")
+    job["output_dir"] = output_dir
+
+    runnable, rejected = prepare_jobs([job])
+    if rejected:
+        raise RequestError(400, rejected[0]["error"])
+    return runnable[0][1]
+
+def _check_fields(job):
+    for name, value in job.items():
+        if name in TEXT_FIELDS and not isinstance(value, str):
+            raise RequestError(400, f"{name} must be a string")
+        if name in FLAG_FIELDS and not isinstance(value, bool):
+            raise RequestError(400, f"{name} must be true or false")
+        # bool is an int too, but true isn't a worker count
+        if name in NUMBER_FIELDS and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+            raise RequestError(400, f"{name} must be a whole number above 0")
+        if name in TIME_FIELDS and (isinstance(value, bool) or not isinstance(value, (str, int, float))):
+            raise RequestError(400, f"{name} must be a time such as 90 or \"1:30\"")
+    codecs = job.get("codecs")
+    if codecs is not None and (not isinstance(codecs, list) or not all(isinstance(codec, str) for codec in codecs)):
+        raise RequestError(400, "codecs must be a list of strings")
+
+def _make_handler(service, download_dir):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            sys.stderr.write(f"[server] {self.address_string()} {format % args}\n")
+
+        def _client(self):
+            return self.headers.get("X-Client-Id") or self.client_address[0]
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if self.close_connection:
+                self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(body)
+
+        # A rejected body is left unread, so the connection can't be reused
+        def _reject_body(self, status, message):
+            self.close_connection = True
+            raise RequestError(status, message)
+
+        def _read_json(self):
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._reject_body(400, "Content-Length must be a non-negative number")
+            if length > MAX_BODY_SIZE:
+                self._reject_body(413, "Request body too large")
+            try:
+                return json.loads(self.rfile.read(length) or b"null")
+            except ValueError:
+                raise RequestError(400, "Request body is not valid JSON")
+
+        def _job(self, job_id):
+            service_job = service.get(job_id)
+            if service_job is None:
+                raise RequestError(404, "No such job")
+            return service_job
+
+        def _route(self, method):
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+            parts = [part for part in url.path.split("/") if part]
+
+            if parts == ["health"] and method == "GET":
+                return self._send_json(200, dict(service.counts(), ok=True))
+            if parts == ["jobs"] and method == "POST":
+                job = build_job(self._read_json(), download_dir)
+                service_job = service.submit(self._client(), job)
+                return self._send_json(202, service_job.describe(), {"Location": f"/jobs/{service_job.id}"})
+            if parts == ["jobs"] and method == "GET":
+                client = query.get("client", [None])[0]
+                return self._send_json(200, {"jobs": [job.describe() for job in service.list_jobs(client)]})
+            if len(parts) == 2 and parts[0] == "jobs":
+                if method == "GET":
+                    return self._send_json(200, self._job(parts[1]).describe())
+                if method == "DELETE":
+                    service_job = self._job(parts[1])
+                    if not service.cancel(service_job.id):
+                        raise RequestError(409, f"Job is {service_job.state}, only queued jobs can be canceled")
+                    return self._send_json(200, service_job.describe())
+            if len(parts) == 3 and parts[0] == "jobs" and method == "GET":
+                service_job = self._job(parts[1])
+                if parts[2] == "progress":
+                    try:
+                        since = int(query.get("since", ["0"])[0])
+                    except ValueError:
+                        raise RequestError(400, "since must be a number")
+                    lines, next_since = service_job.log_since(since)
+                    return self._send_json(200, dict(service_job.describe(), log=lines, next=next_since))
+                if parts[2] == "result":
+                    if service_job.state in (QUEUED, RUNNING):
+                        return self._send_json(202, {"id": service_job.id, "state": service_job.state})
+                    return self._send_json(200, {"id": service_job.id, "state": service_job.state, "output": service_job.output, "error": service_job.error})
+                if parts[2] == "file":
+                    return self._send_file(service_job)
+            raise RequestError(404, "Not found")
+
+        def _send_file(self, service_job):
+            if not service_job.output or not os.path.isfile(service_job.output):
+                raise RequestError(404, "The job has no file to download")
+            size = os.path.getsize(service_job.output)
+            name = os.path.basename(service_job.output).replace('"', '')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(size))
+            self.send_header("Content-Disposition", f'attachment; filename="{name}"')
+            self.end_headers()
+            with open(service_job.output, 'rb') as file:
+                shutil.copyfileobj(file, self.wfile)
+
+        def send_response(self, *args, **kwargs):
+            self.responded = True
+            super().send_response(*args, **kwargs)
+
+        def _handle(self, method):
+            self.responded = False
+            try:
+                self._route(method)
+            except RequestError as e:
+                self._send_json(e.status, {"error": str(e)})
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+            except Exception:
+                # A bug in one request mustn't leave the client without an
+                # answer; once a response has started it can only be cut off
+                self.log_error("%s %s failed:\n%s", method, self.path, traceback.format_exc().rstrip())
+                self.close_connection = True
+                if not self.responded:
+                    try:
+                        self._send_json(500, {"error": "Internal server error"})
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def do_DELETE(self):
+            self._handle("DELETE")
+
+    return Handler
+
+# Function to build the service and the HTTP server around it; call
+# serve_forever() on the server, and service.stop() once it is shut down
+def create_server(download_dir, host="127.0.0.1", port=8080, concurrency=2, per_client=None, journal=None):
+    def runner(service_job):
+        job = dict(service_job.job)
+        if journal is not None and job.get("journal_id") is None:
+            job["journal_id"] = journal.add_job(job.get("kind", "audio"), job["url"], job["output_dir"], service_job.job).id
+        return run_job(service_job.id, job, journal=journal, watcher=service_job.progress())
+
+    service = JobService(runner, concurrency=concurrency, per_client=per_client).start()
+    httpd = ThreadingHTTPServer((host, port), _make_handler(service, download_dir))
+    httpd.daemon_threads = True
+    return httpd, service
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the YouTube downloads over HTTP.")
+    parser.add_argument("-o", "--output-dir", default=os.getcwd(), help="download folder; every job's output goes inside it (default: current folder)")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on, 0.0.0.0 for the whole network (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on (default: 8080)")
+    parser.add_argument("-j", "--concurrency", type=int, default=2, help="jobs run at the same time (default: 2)")
+    parser.add_argument("--per-client", type=int, help="jobs of one client run at the same time (default: no limit beyond --concurrency)")
+    parser.add_argument("--journal", nargs="?", const=JOURNAL_PATH, metavar="PATH", help="record the jobs in a journal so they can be resumed")
+    parser.add_argument("--resume", action="store_true", help="queue the jobs the journal has as unfinished at startup")
+    parser.add_argument("--store", nargs="?", const=STORE_DIR, metavar="DIR", help="reuse outputs made before from a local store, as in cli.py")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.store:
+        enable_store(args.store)
+    journal = None
+    if args.journal or args.resume:
+        journal = JobJournal(args.journal or JOURNAL_PATH)
+
+    httpd, service = create_server(args.output_dir, args.host, args.port, args.concurrency, args.per_client, journal)
+    if args.resume:
+        for row in journal.unfinished_jobs():
+            service.submit("resumed", dict(row["options"], journal_id=row["id"]))
+
+    host, port = httpd.server_address[:2]
+    print(f"Serving on http://{host}:{port}/ (downloads in {os.path.abspath(args.output_dir)})", file=sys.stderr, flush=True)
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.stop(wait=False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# The tests import helpers and benchmarks from the project folder
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -0,0 +1,113 @@
+# tests/test_job_service.py
+
+import threading
+import time
+
+from helpers.job_service import JobService, QUEUED, RUNNING, DONE, FAILED, CANCELED
+
+# Function to wait until check() is true, failing the test after timeout seconds
+def wait_for(check, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not check():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+# Runner whose jobs block until released, recording the order they start in
+class GatedRunner:
+    def __init__(self):
+        self.started = []
+        self.gates = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, service_job):
+        gate = threading.Event()
+        with self.lock:
+            self.gates[service_job.job["name"]] = gate
+            self.started.append(service_job.job["name"])
+        gate.wait(5)
+        return {"status": "ok", "output": service_job.job["name"], "error": None}
+
+    def release(self, name):
+        wait_for(lambda: name in self.gates)
+        self.gates[name].set()
+
+def test_submit_and_status():
+    service = JobService(lambda service_job: {"status": "ok", "output": "/tmp/out.mp3", "error": None}).start()
+    try:
+        service_job = service.submit("alice", {"kind": "audio", "url": "https://youtu.be/x"})
+        wait_for(lambda: service_job.is_finished)
+    finally:
+        service.stop()
+    assert service_job.state == DONE
+    assert service_job.output == "/tmp/out.mp3"
+    assert service_job.percent == 100
+    assert service.get(service_job.id) is service_job
+    assert service_job.describe()["output"] == "/tmp/out.mp3"
+
+def test_failing_runner():
+    def runner(service_job):
+        raise RuntimeError("boom")
+
+    service = JobService(runner).start()
+    try:
+        service_job = service.submit("alice", {})
+        wait_for(lambda: service_job.is_finished)
+    finally:
+        service.stop()
+    assert service_job.state == FAILED
+    assert service_job.error == "boom"
+
+def test_cancel_only_queued_jobs():
+    runner = GatedRunner()
+    service = JobService(runner, concurrency=1).start()
+    try:
+        first = service.submit("alice", {"name": "first"})
+        second = service.submit("alice", {"name": "second"})
+        wait_for(lambda: first.state == RUNNING)
+
+        assert service.cancel(second.id)
+        assert second.state == CANCELED
+        assert not service.cancel(first.id)
+        assert not service.cancel("no-such-job")
+
+        runner.release("first")
+        wait_for(lambda: first.is_finished)
+    finally:
+        service.stop()
+    assert first.state == DONE
+    assert runner.started == ["first"]
+    assert service.counts() == {"queued": 0, "running": 0, "workers": 1}
+
+def test_per_client_limit():
+    runner = GatedRunner()
+    service = JobService(runner, concurrency=3, per_client=1).start()
+    try:
+        alice = [service.submit("alice", {"name": f"a{number}"}) for number in range(3)]
+        bob = service.submit("bob", {"name": "b0"})
+        wait_for(lambda: len(runner.started) == 2)
+        # A free worker doesn't start alice's second job while her first runs
+        time.sleep(0.1)
+        assert sorted(runner.started) == ["a0", "b0"]
+        assert [job.state for job in alice] == [RUNNING, QUEUED, QUEUED]
+        assert service.counts() == {"queued": 2, "running": 2, "workers": 3}
+
+        for name in ("a0", "b0", "a1", "a2"):
+            runner.release(name)
+        wait_for(lambda: all(job.is_finished for job in alice + [bob]))
+    finally:
+        service.stop()
+    # Each of alice's jobs only started once the one before it was done
+    assert runner.started[2:] == ["a1", "a2"]
+
+def test_clients_take_turns():
+    order = []
+    service = JobService(lambda service_job: order.append(service_job.job["name"]) or {"status": "ok"}, concurrency=1)
+    for client, names in (("alice", ["a1", "a2", "a3"]), ("bob", ["b1", "b2"]), ("carol", ["c1"])):
+        for name in names:
+            service.submit(client, {"name": name})
+    service.start()
+    try:
+        wait_for(lambda: len(order) == 6)
+    finally:
+        service.stop()
+    assert order == ["a1", "b1", "c1", "a2", "b2", "a3"]
@@ -0,0 +1,39 @@
+# tests/test_output_store.py
+
+import os
+from helpers.output_store import OutputStore
+
+def make_output(tmp_path, name, content):
+    file_path = tmp_path / name
+    file_path.write_bytes(content)
+    return str(file_path)
+
+def test_fetches_by_itag(tmp_path):
+    store = OutputStore(str(tmp_path / "store"))
+    store.add("vid", 140, "mp3-192k", make_output(tmp_path, "a.mp3", b"mp3 data"))
+    target = str(tmp_path / "out" / "a.mp3")
+    assert store.fetch("vid", 140, "mp3-192k", target) is not None
+    assert open(target, 'rb').read() == b"mp3 data"
+    assert store.fetch("vid", 251, "mp3-192k", str(tmp_path / "out" / "b.mp3")) is None
+    store.close()
+
+def test_fetches_any_itag_of_the_profile(tmp_path):
+    store = OutputStore(str(tmp_path / "store"))
+    store.add("vid", 140, "mp3-192k", make_output(tmp_path, "a.mp3", b"mp3 data"))
+    target = str(tmp_path / "out" / "a.mp3")
+    assert store.fetch("vid", None, "mp3-192k", target) is not None
+    assert open(target, 'rb').read() == b"mp3 data"
+    assert store.fetch("vid", None, "mp4-1080p", str(tmp_path / "out" / "a.mp4")) is None
+    assert store.fetch("other", None, "mp3-192k", str(tmp_path / "out" / "b.mp3")) is None
+    assert store.stats()["hits"] == 1
+    store.close()
+
+def test_drops_a_changed_entry(tmp_path):
+    store = OutputStore(str(tmp_path / "store"))
+    stored = store.add("vid", 140, "mp3-192k", make_output(tmp_path, "a.mp3", b"mp3 data"))
+    os.remove(stored)
+    with open(stored, 'wb') as file:
+        file.write(b"edited")
+    assert store.fetch("vid", None, "mp3-192k", str(tmp_path / "out" / "a.mp3")) is None
+    assert store.stats()["entries"] == 0
+    store.close()
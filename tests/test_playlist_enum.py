@@ -0,0 +1,23 @@
+# tests/test_playlist_enum.py
+
+from benchmarks.fake_backend import FakePlaylist
+from helpers.playlist_enum import iter_playlist_entries
+
+VIDEOS = [("aaaaaaaaaaA", "First"), ("bbbbbbbbbbA", "Second")]
+
+def test_lists_the_page():
+    entries = list(iter_playlist_entries(FakePlaylist("PLx", "Playlist", VIDEOS)))
+    assert [(entry.video_id, entry.title) for entry in entries] == VIDEOS
+
+def test_falls_back_when_the_page_has_no_videos():
+    playlist = FakePlaylist("PLx", "Playlist", VIDEOS)
+    # A layout the page walk doesn't understand finds nothing, without failing
+    playlist._extract_videos = lambda page, context=None: ([], None)
+    entries = list(iter_playlist_entries(playlist))
+    assert [(entry.video_id, entry.title) for entry in entries] == [("aaaaaaaaaaA", None), ("bbbbbbbbbbA", None)]
+
+def test_falls_back_when_the_page_fails():
+    playlist = FakePlaylist("PLx", "Playlist", VIDEOS)
+    playlist.html = "<html></html>"
+    entries = list(iter_playlist_entries(playlist))
+    assert [entry.video_id for entry in entries] == ["aaaaaaaaaaA", "bbbbbbbbbbA"]
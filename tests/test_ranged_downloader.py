@@ -0,0 +1,129 @@
+# tests/test_ranged_downloader.py
+
+import os
+import shutil
+from urllib.request import urlopen
+
+import pytest
+
+from benchmarks.stream_server import StreamServer
+from helpers.ranged_downloader import (
+    RANGE_SIZE,
+    RangeNotSupportedError,
+    _fetch_range,
+    _prepare_part,
+    _save_part_state,
+    download_stream,
+    download_url,
+)
+
+RANGE = 64 * 1024
+SIZE = 5 * RANGE + 1234
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.bin"
+    path.write_bytes(os.urandom(SIZE))
+    return path
+
+def _serve(source, **kwargs):
+    server = StreamServer(**kwargs).start()
+    return server, server.add_file("stream", str(source))
+
+# Stand-in for a pytubefix stream; download() is the single connection
+# fallback the ranged downloader uses
+class FakeStream:
+    def __init__(self, url, filesize):
+        self.url = url
+        self.filesize = filesize
+        self.itag = 140
+        self.downloads = 0
+
+    def download(self, output_path=None, filename=None, skip_existing=True):
+        self.downloads += 1
+        file_path = os.path.join(output_path, filename)
+        with urlopen(self.url) as response, open(file_path, 'wb') as file:
+            shutil.copyfileobj(response, file)
+        return file_path
+
+def test_ranged_download(tmp_path, source):
+    server, url = _serve(source)
+    target = tmp_path / "out.bin"
+    stats = {}
+    counted = []
+    try:
+        download_url(url, str(target), SIZE, connections=3, range_size=RANGE, stats=stats, on_bytes=counted.append)
+        requests = server.take_counters()["requests"]
+    finally:
+        server.stop()
+
+    assert target.read_bytes() == source.read_bytes()
+    assert not os.path.exists(str(target) + ".part")
+    assert requests == 6
+    assert stats == {"retries": 0, "bytes": SIZE}
+    assert sum(counted) == SIZE
+
+def test_resume_from_part(tmp_path, source):
+    server, url = _serve(source)
+    target = str(tmp_path / "out.bin")
+    part = target + ".part"
+    try:
+        # An earlier run fetched the first two ranges before it stopped
+        state = _prepare_part(target, part, SIZE, RANGE)
+        for start in (0, RANGE):
+            _fetch_range(url, target, start, start + RANGE - 1)
+            state["done"].append(start)
+        _save_part_state(part, state)
+        server.take_counters()
+
+        counted = []
+        stats = {}
+        download_url(url, target, SIZE, connections=2, range_size=RANGE, stats=stats, on_bytes=counted.append)
+        requests = server.take_counters()["requests"]
+    finally:
+        server.stop()
+
+    with open(target, 'rb') as file:
+        assert file.read() == source.read_bytes()
+    assert not os.path.exists(part)
+    # Only the missing ranges were fetched; the finished ones are reported up front
+    assert requests == 4
+    assert stats["bytes"] == SIZE - 2 * RANGE
+    assert sum(counted) == SIZE
+
+def test_finished_file_is_not_fetched_again(tmp_path, source):
+    server, url = _serve(source)
+    target = tmp_path / "out.bin"
+    shutil.copyfile(source, target)
+    try:
+        download_url(url, str(target), SIZE, range_size=RANGE)
+        requests = server.take_counters()["requests"]
+    finally:
+        server.stop()
+    assert requests == 0
+
+def test_server_ignoring_range(tmp_path, source):
+    server, url = _serve(source, ranges=False)
+    try:
+        with pytest.raises(RangeNotSupportedError):
+            download_url(url, str(tmp_path / "direct.bin"), SIZE, connections=2, range_size=RANGE)
+        # The sidecar is kept for a later attempt
+        assert os.path.exists(str(tmp_path / "direct.bin.part"))
+    finally:
+        server.stop()
+
+def test_download_stream_falls_back_without_range(tmp_path):
+    # download_stream fetches RANGE_SIZE ranges; the second one is refused
+    source = tmp_path / "source.bin"
+    source.write_bytes(os.urandom(RANGE_SIZE + RANGE))
+    server, url = _serve(source, ranges=False)
+    try:
+        stream = FakeStream(url, RANGE_SIZE + RANGE)
+        file_path = download_stream(stream, str(tmp_path), "out.bin", connections=2)
+    finally:
+        server.stop()
+
+    assert stream.downloads == 1
+    with open(file_path, 'rb') as file:
+        assert file.read() == source.read_bytes()
+    assert not os.path.exists(file_path + ".part")
@@ -0,0 +1,119 @@
+# tests/test_server.py
+
+import json
+import os
+import threading
+from http.client import HTTPConnection
+
+import pytest
+
+import server
+from test_job_service import wait_for
+
+VIDEO_URL = "https://youtu.be/dQw4w9WgXcQ"
+
+# Server with run_job replaced by a stub that blocks until released, so jobs
+# can be looked at while they are queued or running
+@pytest.fixture
+def service_url(tmp_path, monkeypatch):
+    release = threading.Event()
+    ran = []
+
+    def run_job(index, job, journal=None, watcher=None):
+        ran.append(job)
+        watcher.log(f"running {job['url']}")
+        release.wait(5)
+        output = tmp_path / "out.mp3"
+        output.write_bytes(b"mp3")
+        return {"status": "ok", "output": str(output), "error": None}
+
+    monkeypatch.setattr(server, "run_job", run_job)
+    httpd, service = server.create_server(str(tmp_path), port=0, concurrency=1)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield httpd.server_address[1], release, ran
+    finally:
+        release.set()
+        httpd.shutdown()
+        httpd.server_close()
+        service.stop()
+
+def request(port, method, path, body=None, client="alice"):
+    connection = HTTPConnection("127.0.0.1", port, timeout=5)
+    headers = {"X-Client-Id": client}
+    data = None
+    if body is not None:
+        data = json.dumps(body).encode('utf-8')
+        headers["Content-Type"] = "application/json"
+    connection.request(method, path, data, headers)
+    response = connection.getresponse()
+    payload = response.read()
+    connection.close()
+    if response.getheader("Content-Type", "").startswith("application/json"):
+        return response.status, json.loads(payload)
+    return response.status, payload
+
+def test_submit_status_and_result(service_url, tmp_path):
+    port, release, ran = service_url
+    status, job = request(port, "POST", "/jobs", {"kind": "audio", "url": VIDEO_URL})
+    assert status == 202
+    assert job["state"] in ("queued", "running")
+    assert job["client"] == "alice"
+
+    wait_for(lambda: request(port, "GET", f"/jobs/{job['id']}")[1]["state"] == "running")
+    status, result = request(port, "GET", f"/jobs/{job['id']}/result")
+    assert status == 202
+    status, progress = request(port, "GET", f"/jobs/{job['id']}/progress?since=0")
+    assert progress["log"] == ["running https://www.youtube.com/watch?v=dQw4w9WgXcQ"]
+
+    release.set()
+    wait_for(lambda: request(port, "GET", f"/jobs/{job['id']}/result")[0] == 200)
+    status, result = request(port, "GET", f"/jobs/{job['id']}/result")
+    assert result["state"] == "done"
+    status, body = request(port, "GET", f"/jobs/{job['id']}/file")
+    assert (status, body) == (200, b"mp3")
+    # Without an output_dir the job writes to the download folder itself
+    assert ran[0]["output_dir"] == os.path.realpath(str(tmp_path))
+
+def test_cancel(service_url):
+    port, release, ran = service_url
+    _, first = request(port, "POST", "/jobs", {"url": VIDEO_URL})
+    _, second = request(port, "POST", "/jobs", {"url": "https://youtu.be/aaaaaaaaaaA"})
+    wait_for(lambda: request(port, "GET", f"/jobs/{first['id']}")[1]["state"] == "running")
+
+    status, canceled = request(port, "DELETE", f"/jobs/{second['id']}")
+    assert (status, canceled["state"]) == (200, "canceled")
+    status, error = request(port, "DELETE", f"/jobs/{first['id']}")
+    assert status == 409
+    status, _ = request(port, "DELETE", "/jobs/unknown")
+    assert status == 404
+
+    release.set()
+    wait_for(lambda: request(port, "GET", f"/jobs/{first['id']}")[1]["state"] == "done")
+    assert len(ran) == 1
+
+def test_jobs_of_one_client(service_url):
+    port, release, ran = service_url
+    request(port, "POST", "/jobs", {"url": VIDEO_URL}, client="alice")
+    request(port, "POST", "/jobs", {"url": VIDEO_URL, "kind": "video"}, client="bob")
+    status, listing = request(port, "GET", "/jobs?client=bob")
+    assert status == 200
+    assert [job["kind"] for job in listing["jobs"]] == ["video"]
+
+@pytest.mark.parametrize("body, message", [
+    ({"url": VIDEO_URL, "kind": "bogus"}, "Unknown job kind: bogus"),
+    ({"url": VIDEO_URL, "kind": 3}, "kind must be a string"),
+    ({"url": VIDEO_URL, "playlist_workers": "4"}, "playlist_workers must be a whole number above 0"),
+    ({"url": "not a link"}, "Invalid YouTube link"),
+    ({"url": VIDEO_URL, "output_dir": "../elsewhere"}, "output_dir must be a folder inside the download folder"),
+    ({}, "A job needs at least a url"),
+])
+def test_rejected_jobs(service_url, body, message):
+    port, release, ran = service_url
+    status, error = request(port, "POST", "/jobs", body)
+    assert (status, error) == (400, {"error": message})
+
+def test_worker_counts_are_capped(tmp_path):
+    job = server.build_job({"kind": "playlist-audio", "url": "https://www.youtube.com/playlist?list=PLx", "playlist_workers": 1000}, str(tmp_path))
+    assert job["playlist_workers"] == server.MAX_JOB_WORKERS["playlist_workers"]